@@ -1,54 +1,228 @@
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
+from tkinter import ttk, filedialog, messagebox, simpledialog
 from tkinter.font import Font
+import numpy as np
 import pandas as pd
-import locale
 import json
-
-
-# Configurar locale para moeda brasileira
-locale.setlocale(locale.LC_ALL, 'pt_BR.UTF-8')
+import os
+import queue
+import shutil
+import socket
+import sqlite3
+import threading
+from datetime import datetime
+
+import diagnostico
+from motor_inventario import (
+    CHAVES_RESUMO, COLUNAS_MOEDA, NIVEIS_ZONA, TAMANHO_BLOCO, TarefaCancelada, apurar, buscar_prefixo,
+    construir_indice_chaves, construir_indice_repetidas, contribuicao_da_linha, formatar_moeda_serie, gravar_arquivo,
+    gravar_contagens, gravar_sessao, interpretar_leitura, ler_contagens, ler_json, ler_planilha,
+    ler_planilha_em_fluxo, ler_sessao, linhas_resumo, localizar_ocorrencia, megabytes, mesclar_contagens,
+    ocorrencia_da_linha, preparar_exibicao, preparar_inventario, resumo_por_zona, totais_do_vetor,
+)
+from banco_inventario import abrir_banco, apurar_banco, gravar_arquivo_banco, gravar_banco, gravar_linhas_banco, ler_banco
+from servidor_contagem import PORTA_PADRAO, aguardar_eventos, baixar_inventario, enviar_deltas
+
+
+# Recuperação após falhas: snapshot do inventário + diário das edições feitas depois dele
+PASTA_RECUPERACAO = os.path.join(os.path.expanduser("~"), ".contagem_estoque")
+ARQUIVO_SNAPSHOT = os.path.join(PASTA_RECUPERACAO, "snapshot.pkl")
+ARQUIVO_DIARIO = os.path.join(PASTA_RECUPERACAO, "diario.jsonl")
+ARQUIVO_DIARIO_ANTERIOR = os.path.join(PASTA_RECUPERACAO, "diario.anterior.jsonl")
+ARQUIVO_DIARIO_PENDENTE = os.path.join(PASTA_RECUPERACAO, "diario.pendente.jsonl")  # Aguarda a próxima compactação
+ARQUIVO_SESSAO_ATIVA = os.path.join(PASTA_RECUPERACAO, "sessao.ativa")
+LIMITE_DIARIO = 500  # Edições no diário antes de compactá-lo em um novo snapshot
+
+# Diagnóstico de desempenho (opcional): tempos de cada etapa em JSON lines e perfis do cProfile
+ARQUIVO_DIAGNOSTICO = os.path.join(PASTA_RECUPERACAO, "diagnostico.jsonl")
+PASTA_PERFIS = os.path.join(PASTA_RECUPERACAO, "perfis")
+VARIAVEL_DIAGNOSTICO = "CONTAGEM_DIAGNOSTICO"  # Com esta variável de ambiente, as medições começam ligadas
+COLUNAS_DIAGNOSTICO = ["HORÁRIO", "ETAPA", "TEMPO (s)", "LINHAS", "MEMÓRIA (MB)", "PICO (MB)", "PERFIL"]
+INTERVALO_DIAGNOSTICO_MS = 1000  # Atualização do painel de diagnóstico enquanto aberto
+MINIMO_COLORIR_S = 0.05  # A cada rolagem a tabela é colorida: só colorações lentas são registradas
+CANDIDATOS_LARGURA = 5  # Textos mais longos de cada coluna medidos com a fonte ao calcular as larguras
+MARGEM_COLUNA = 10  # Espaço extra de cada coluna, em pixels
 
 def carregar_planilha():
     """Carregar a planilha de Excel."""
-    global df
     file_path = filedialog.askopenfilename(
         title="Selecione a Planilha",
         filetypes=[("Arquivos Excel", "*.xlsx *.xls")]
     )
     if file_path:
-        try:
-            df = pd.read_excel(file_path)
+        # .xlsx é lido em fluxo, linha a linha; .xls (formato antigo) só pelo pandas
+        leitura = ler_planilha_em_fluxo if file_path.lower().endswith((".xlsx", ".xlsm")) else ler_planilha
+        executar_em_segundo_plano(
+            "Carregando planilha...",
+            lambda progresso: leitura(file_path, progresso),
+            exibir_inventario,
+            "Erro ao carregar a planilha",
+            ao_receber_parcial=exibir_previa,
+        )
 
-            # Converter a coluna COD para texto
-            if "COD" in df.columns:
-                df["COD"] = df["COD"].astype(str)
+def relatorio_memoria():
+    """Mostra quanto de memória o inventário carregado ocupa, coluna a coluna."""
+    if df is None:
+        messagebox.showwarning("Aviso", "Nenhuma planilha foi carregada!")
+        return
 
-            required_columns = ["COD", "PRODUTO", "VL. UNT.", "ENDEREÇO", "QTD"]
-            for col in required_columns:
-                if col not in df.columns:
-                    raise ValueError(f"Coluna obrigatória '{col}' não encontrada na planilha.")
+    uso = df.memory_usage(deep=True, index=False)
+    linhas = [f"{col}: {megabytes(uso[col])} ({df[col].dtype})" for col in df.columns]
+    total = uso.sum()
+    if exibicao is not None:
+        linhas.append(f"Textos de moeda em cache: {megabytes(exibicao.memory_usage(deep=True).sum())}")
+        total += exibicao.memory_usage(deep=True).sum()
+    linhas.append("")
+    linhas.append(f"TOTAL: {megabytes(total)} para {len(df)} itens")
+    messagebox.showinfo("Memória do Inventário", "\n".join(linhas))
+
+def abrir_diagnostico():
+    """Abre o painel de diagnóstico: liga as medições, perfila uma operação e lista as etapas recentes."""
+    global janela_diagnostico, tabela_diagnostico, var_diagnostico, rotulo_diagnostico, ultima_etapa_exibida
+    if janela_diagnostico is not None and janela_diagnostico.winfo_exists():
+        janela_diagnostico.lift()
+        return
 
-            if "CONTAGEM" not in df.columns:
-                df["CONTAGEM"] = 0
+    janela_diagnostico = tk.Toplevel(root)
+    janela_diagnostico.title("Diagnóstico de Desempenho")
+    janela_diagnostico.geometry("950x400")
+    frame_opcoes = tk.Frame(janela_diagnostico)
+    frame_opcoes.pack(side="top", fill="x", padx=10, pady=5)
+    var_diagnostico = tk.BooleanVar(value=diagnostico.ativo)
+    tk.Checkbutton(
+        frame_opcoes, text="REGISTRAR TEMPOS DAS OPERAÇÕES", variable=var_diagnostico, command=alternar_diagnostico
+    ).pack(side="left")
+    tk.Button(frame_opcoes, text="PERFILAR PRÓXIMA OPERAÇÃO", command=perfilar_operacao).pack(side="left", padx=10)
+    rotulo_diagnostico = tk.Label(janela_diagnostico, text="", anchor="w", justify="left")
+    rotulo_diagnostico.pack(side="top", fill="x", padx=10)
+
+    tabela_diagnostico = ttk.Treeview(janela_diagnostico, columns=COLUNAS_DIAGNOSTICO, show="headings")
+    for col in COLUNAS_DIAGNOSTICO:
+        tabela_diagnostico.heading(col, text=col)
+        tabela_diagnostico.column(col, width=250 if col == "PERFIL" else 100, anchor="w" if col in ("ETAPA", "PERFIL") else "center")
+    barra = ttk.Scrollbar(janela_diagnostico, orient="vertical", command=tabela_diagnostico.yview)
+    tabela_diagnostico.configure(yscrollcommand=barra.set)
+    barra.pack(side="right", fill="y")
+    tabela_diagnostico.pack(fill="both", expand=True, padx=(10, 0), pady=5)
+
+    ultima_etapa_exibida = None
+    atualizar_diagnostico()
+
+def alternar_diagnostico():
+    """Liga ou desliga as medições conforme a caixa do painel."""
+    if var_diagnostico.get():
+        ligar_diagnostico()
+    else:
+        diagnostico.desativar()
+    atualizar_diagnostico(reagendar=False)
+
+def ligar_diagnostico():
+    """Liga as medições, gravando as etapas em ARQUIVO_DIAGNOSTICO."""
+    os.makedirs(PASTA_RECUPERACAO, exist_ok=True)
+    diagnostico.ativar(ARQUIVO_DIAGNOSTICO, PASTA_PERFIS)
+
+def perfilar_operacao():
+    """Executa a próxima operação sob o cProfile, para anexar o perfil a um chamado."""
+    if not diagnostico.ativo:
+        ligar_diagnostico()
+        var_diagnostico.set(True)
+    diagnostico.perfilar_proxima()
+    atualizar_diagnostico(reagendar=False)
+
+def atualizar_diagnostico(reagendar=True):
+    """Atualiza o painel com as etapas recentes enquanto ele estiver aberto."""
+    global ultima_etapa_exibida
+    if janela_diagnostico is None or not janela_diagnostico.winfo_exists():
+        return
+    if not diagnostico.ativo:
+        rotulo_diagnostico.config(text="Medições desligadas.")
+    elif diagnostico.perfil_pendente:
+        rotulo_diagnostico.config(text="A próxima operação será executada sob o cProfile.")
+    else:
+        rotulo_diagnostico.config(text=f"Registro: {ARQUIVO_DIAGNOSTICO}\nPerfis: {PASTA_PERFIS}")
+
+    etapas = diagnostico.etapas_recentes()
+    if etapas and etapas[0] is not ultima_etapa_exibida:  # Só redesenha quando há etapas novas
+        ultima_etapa_exibida = etapas[0]
+        tabela_diagnostico.delete(*tabela_diagnostico.get_children())
+        for registro in etapas:
+            tabela_diagnostico.insert("", "end", values=(
+                registro["horario"][11:23],
+                registro["etapa"],
+                f"{registro['segundos']:.3f}".replace(".", ","),
+                "" if registro["linhas"] is None else registro["linhas"],
+                "" if registro["memoria_mb"] is None else f"{registro['memoria_mb']:+.1f}".replace(".", ","),
+                "" if registro["pico_mb"] is None else f"{registro['pico_mb']:.1f}".replace(".", ","),
+                os.path.basename(registro.get("perfil") or ""),
+            ))
+    if reagendar:
+        root.after(INTERVALO_DIAGNOSTICO_MS, atualizar_diagnostico)
+
+def exibir_previa(parcial):
+    """Mostra as linhas já lidas enquanto o restante da planilha é carregado."""
+    global df, exibicao, indice_busca, totais_resumo, visao, inventario_antes_da_previa
+    if inventario_antes_da_previa is None:
+        inventario_antes_da_previa = (df, exibicao, indice_busca)
+    redefinir_ordenacao()
+    df, exibicao = parcial
+    indice_busca = None  # A busca fica disponível ao fim da carga
+    totais_resumo = None
+    visao = np.arange(len(df))
+    renderizar_janela()  # Mantém a posição de rolagem do usuário
+    if len(df) <= TAMANHO_BLOCO:
+        redimensionar_colunas()
+
+def descartar_previa():
+    """Volta ao inventário anterior quando uma carga com prévia é cancelada ou falha."""
+    global df, exibicao, indice_busca, totais_resumo, inventario_antes_da_previa
+    if inventario_antes_da_previa is None:
+        return
+    df, exibicao, indice_busca = inventario_antes_da_previa
+    inventario_antes_da_previa = None
+    totais_resumo = None
+    redefinir_ordenacao()
+    if df is None:
+        definir_visao([])
+    else:
+        atualizar_tabela()
 
-            df["VL. ESTOQUE"] = 0.0
-            df["DIF. ETQ"] = 0.0
-            df["VL. DIF."] = 0.0
+def exibir_inventario(resultado):
+    """Substitui o inventário atual pelo recém-carregado e atualiza a tabela."""
+    global df, exibicao, indice_busca, totais_resumo, inventario_antes_da_previa
+    df, exibicao, indice_busca = resultado
+    inventario_antes_da_previa = None
+    desconectar_servidor()  # O novo inventário não é mais o do servidor
+    fechar_banco()  # Nem o do banco da sessão anterior
+    redefinir_ordenacao()
+    totais_resumo = None  # Totais do arquivo anterior não valem mais
 
-            atualizar_tabela()
-            redimensionar_colunas()  # Ajusta a largura das colunas após carregar os dados
-        except Exception as e:
-            messagebox.showerror("Erro", f"Erro ao carregar a planilha: {e}")
+    atualizar_tabela()
+    redimensionar_colunas()  # Ajusta a largura das colunas após carregar os dados
+    repetidas = len(df) - len(indice_busca["CHAVE"])
+    if repetidas:
+        messagebox.showwarning(
+            "Aviso",
+            f"{repetidas} linha(s) repetem COD + ENDEREÇO de outra linha.\n"
+            "Contagens mescladas de outros arquivos (MESCLAR CONTAGENS) vão para a primeira ocorrência de cada par."
+        )
+    try:
+        iniciar_diario(df)
+    except OSError as e:
+        messagebox.showwarning("Aviso", f"Não foi possível ativar a recuperação da contagem: {e}")
+
+def atualizar_exibicao_linha(posicao):
+    """Atualiza os textos em cache de uma única linha após uma edição."""
+    linha = df.iloc[[posicao]]
+    for col in COLUNAS_MOEDA:
+        exibicao.iat[posicao, exibicao.columns.get_loc(col)] = formatar_moeda_serie(linha[col]).iat[0]
+
+def valores_janela(posicoes):
+    """Monta as tuplas exibidas na tabela (ÍNDICE + colunas) para as posições informadas."""
+    janela = df.iloc[posicoes][colunas[1:]].copy()
+    for col in COLUNAS_MOEDA:
+        janela[col] = exibicao[col].iloc[posicoes].to_numpy()
+    return list(janela.itertuples(index=True, name=None))
 
-def formatar_moeda(valor):
-    """Formata valores como moeda no padrão brasileiro, incluindo R$."""
-    if isinstance(valor, (int, float)):
-        if valor >= 1000 or valor <= -1000:  # Adiciona suporte para valores negativos
-            return f"R$ {valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-        else:
-            return f"R$ {valor:,.2f}".replace(".", ",")
-    return valor
 def salvar_json():
     """Salva os dados da planilha no formato JSON."""
     if df is None:
@@ -61,129 +235,597 @@ def salvar_json():
         filetypes=[("Arquivos JSON", "*.json")]
     )
     if save_path:
-        try:
-            # Converte o DataFrame para JSON
-            df.to_json(save_path, orient="records", force_ascii=False, indent=4)
-            messagebox.showinfo("Sucesso", "Dados salvos no formato JSON com sucesso!")
-        except Exception as e:
-            messagebox.showerror("Erro", f"Erro ao salvar o arquivo JSON: {e}")
+        # Converte o DataFrame para JSON
+        dados = df.copy()  # Cópia fixa: a contagem pode seguir na tela durante a gravação
+        executar_em_segundo_plano(
+            "Salvando arquivo JSON...",
+            lambda progresso: gravar_arquivo(
+                save_path, progresso, lambda caminho: dados.to_json(caminho, orient="records", force_ascii=False, indent=4)
+            ),
+            lambda _: messagebox.showinfo("Sucesso", "Dados salvos no formato JSON com sucesso!"),
+            "Erro ao salvar o arquivo JSON",
+            substitui_df=False,
+        )
 
 def carregar_json():
     """Carrega os dados do inventário a partir de um arquivo JSON."""
-    global df
     file_path = filedialog.askopenfilename(
         title="Selecione o Arquivo JSON",
         filetypes=[("Arquivos JSON", "*.json")]
     )
     if file_path:
-        try:
-            # Carregar o JSON e converter para DataFrame
-            df = pd.read_json(file_path, orient="records")
+        executar_em_segundo_plano(
+            "Carregando arquivo JSON...",
+            lambda progresso: ler_json(file_path, progresso),
+            exibir_inventario,
+            "Erro ao carregar o arquivo JSON",
+        )
+
+def salvar_sessao():
+    """Salva a sessão de contagem em formato colunar binário (Arrow/Feather) ou em um banco SQLite."""
+    if df is None:
+        messagebox.showwarning("Aviso", "Nenhuma planilha foi carregada!")
+        return
+
+    save_path = filedialog.asksaveasfilename(
+        title="Salvar Sessão",
+        defaultextension=".feather",
+        filetypes=[("Sessão de contagem", "*.feather"), ("Banco de contagem (SQLite)", "*.sqlite")]
+    )
+    if save_path and save_path.lower().endswith(".sqlite"):
+        salvar_sessao_banco(save_path)
+    elif save_path:
+        dados = df.copy()  # Cópia fixa: a contagem pode seguir na tela durante a gravação
+        executar_em_segundo_plano(
+            "Salvando sessão...",
+            lambda progresso: gravar_arquivo(save_path, progresso, lambda caminho: gravar_sessao(dados, caminho)),
+            lambda _: messagebox.showinfo("Sucesso", "Sessão salva com sucesso!"),
+            "Erro ao salvar a sessão",
+            substitui_df=False,
+        )
 
-            # Verificar se as colunas obrigatórias estão presentes
-            required_columns = ["COD", "PRODUTO", "VL. UNT.", "ENDEREÇO", "QTD"]
-            for col in required_columns:
-                if col not in df.columns:
-                    raise ValueError(f"Coluna obrigatória '{col}' não encontrada no arquivo JSON.")
+def carregar_sessao():
+    """Carrega uma sessão de contagem salva por salvar_sessao."""
+    file_path = filedialog.askopenfilename(
+        title="Selecione a Sessão",
+        filetypes=[("Sessão de contagem", "*.feather *.sqlite")]
+    )
+    if file_path and file_path.lower().endswith(".sqlite"):
+        executar_em_segundo_plano(
+            "Carregando banco da sessão...",
+            lambda progresso: ler_banco(file_path, progresso),
+            lambda resultado: exibir_sessao_banco(file_path, resultado),
+            "Erro ao carregar o banco da sessão",
+        )
+    elif file_path:
+        executar_em_segundo_plano(
+            "Carregando sessão...",
+            lambda progresso: ler_sessao(file_path, progresso),
+            exibir_sessao,
+            "Erro ao carregar a sessão",
+        )
 
-            if "CONTAGEM" not in df.columns:
-                df["CONTAGEM"] = 0
+def exibir_sessao(resultado):
+    """Exibe a sessão carregada junto com o resumo das colunas já calculadas."""
+    exibir_inventario(resultado)
+    atualizar_resumo()
+
+def exibir_sessao_banco(caminho, resultado):
+    """Exibe a sessão lida do banco e passa a gravar nele cada contagem."""
+    exibir_sessao(resultado)
+    abrir_sessao_banco(caminho)
+
+def salvar_sessao_banco(save_path):
+    """Salva a sessão em um banco SQLite, que passa a receber cada contagem feita na tela."""
+    if banco is not None and os.path.abspath(save_path) == os.path.abspath(caminho_banco):
+        banco.execute("PRAGMA wal_checkpoint(TRUNCATE)")  # As contagens já estão no banco
+        messagebox.showinfo("Sucesso", "Sessão salva com sucesso!")
+        return
 
-            df["VL. ESTOQUE"] = 0.0
-            df["DIF. ETQ"] = 0.0
-            df["VL. DIF."] = 0.0
+    dados = df.copy()  # Cópia fixa: a contagem pode seguir na tela durante a gravação
+    executar_em_segundo_plano(
+        "Salvando banco da sessão...",
+        lambda progresso: gravar_arquivo_banco(save_path, progresso, lambda caminho: gravar_banco(dados, caminho)),
+        lambda _: concluir_sessao_banco(save_path, dados),
+        "Erro ao salvar o banco da sessão",
+        substitui_df=False,
+    )
 
-            atualizar_tabela()
-            redimensionar_colunas()
-        except Exception as e:
-            messagebox.showerror("Erro", f"Erro ao carregar o arquivo JSON: {e}")
+def concluir_sessao_banco(save_path, dados):
+    """Passa a gravar no banco recém-salvo, incluindo as contagens feitas durante a gravação."""
+    abrir_sessao_banco(save_path)
+    gravar_no_banco(posicoes_alteradas(dados))
+    messagebox.showinfo("Sucesso", "Sessão salva com sucesso! As próximas contagens serão gravadas nela automaticamente.")
+
+def abrir_sessao_banco(caminho):
+    """Abre o banco da sessão; a partir daqui, cada contagem é um UPDATE de uma linha nele."""
+    global banco, caminho_banco
+    fechar_banco()
+    try:
+        banco = abrir_banco(caminho)
+        caminho_banco = caminho
+    except sqlite3.Error as e:
+        messagebox.showwarning("Aviso", f"Não foi possível abrir o banco da sessão para gravação: {e}")
+
+def fechar_banco():
+    """Fecha o banco da sessão, se houver um aberto."""
+    global banco, caminho_banco
+    if banco is not None:
+        banco.close()
+        banco = caminho_banco = None
+
+def gravar_no_banco(posicoes=None):
+    """Grava no banco da sessão as linhas informadas de df (None: a apuração de todos os itens)."""
+    if banco is None:
+        return
+    try:
+        if posicoes is None:
+            apurar_banco(banco)
+        elif len(np.atleast_1d(posicoes)):
+            gravar_linhas_banco(banco, df, posicoes)
+    except sqlite3.Error as e:
+        fechar_banco()
+        messagebox.showerror(
+            "Erro", f"Não foi possível gravar no banco da sessão: {e}\nA contagem continua na tela; salve a sessão novamente."
+        )
+
+def posicoes_alteradas(anterior):
+    """Posições de df cuja contagem ou marcação de recontagem difere da cópia anterior."""
+    atual, antes = df["CONTAGEM"].to_numpy(dtype=float), anterior["CONTAGEM"].to_numpy(dtype=float)
+    diferentes = (atual != antes) & ~(np.isnan(atual) & np.isnan(antes))
+    if "RECONTAGEM" in df.columns:
+        marcadas = anterior["RECONTAGEM"].to_numpy(dtype=bool) if "RECONTAGEM" in anterior.columns else False
+        diferentes |= df["RECONTAGEM"].to_numpy(dtype=bool) != marcadas
+    return np.flatnonzero(diferentes)
+
+def iniciar_diario(dados):
+    """Grava o snapshot do inventário recém-aberto e começa um diário de edições vazio."""
+    global diario, edicoes_diario, geracao_diario
+    os.makedirs(PASTA_RECUPERACAO, exist_ok=True)
+    if diario is not None:
+        diario.close()
+    with trava_snapshot:
+        geracao_diario += 1  # Invalida compactações ainda em andamento do inventário anterior
+        gravar_snapshot(dados)
+        for caminho in (ARQUIVO_DIARIO, ARQUIVO_DIARIO_ANTERIOR, ARQUIVO_DIARIO_PENDENTE):
+            if os.path.exists(caminho):
+                os.remove(caminho)
+    diario = open(ARQUIVO_DIARIO, "a", encoding="utf-8")
+    edicoes_diario = 0
+    open(ARQUIVO_SESSAO_ATIVA, "w").close()
+
+def gravar_snapshot(dados):
+    """Substitui o snapshot de forma atômica (um snapshot pela metade nunca é lido)."""
+    temporario = ARQUIVO_SNAPSHOT + ".tmp"
+    dados.to_pickle(temporario)
+    os.replace(temporario, ARQUIVO_SNAPSHOT)
+
+def registrar_edicao(posicao, anterior, novo):
+    """Acrescenta uma edição de CONTAGEM ao diário e força a gravação em disco."""
+    global edicoes_diario
+    if diario is None:
+        return
+    cod, endereco, ocorrencia = chave_da_linha(posicao)
+    registro = {
+        "cod": cod,
+        "endereco": endereco,
+        "ocorrencia": ocorrencia,
+        "anterior": float(anterior),
+        "novo": float(novo),
+        "momento": datetime.now().isoformat(timespec="seconds"),
+    }
+    diario.write(json.dumps(registro, ensure_ascii=False) + "\n")
+    diario.flush()
+    os.fsync(diario.fileno())
+    edicoes_diario += 1
+    if edicoes_diario >= LIMITE_DIARIO:
+        compactar_diario()
+
+def compactar_diario():
+    """Troca o diário por um novo e grava, em segundo plano, um snapshot que já inclui as edições.
+
+    Se outra compactação ainda está gravando, esta fica na fila: alterações em massa (mescla,
+    preenchimento) não passam pelo diário e só são preservadas pelo snapshot.
+    """
+    global diario, edicoes_diario, compactacao_pendente, compactando
+    if diario is None:
+        return  # Sem sessão ativa
+
+    diario.close()
+    with trava_compactacao:
+        iniciar = not compactando
+        if iniciar:
+            # O diário atual fica guardado até o novo snapshot estar gravado
+            # (junto com o que restou de uma compactação que falhou)
+            for caminho in (ARQUIVO_DIARIO_PENDENTE, ARQUIVO_DIARIO):
+                if os.path.exists(caminho):
+                    anexar_diario(caminho, ARQUIVO_DIARIO_ANTERIOR)
+            compactando = True
+        else:
+            # Edições até aqui vão para o diário pendente, incorporado pelo snapshot da fila
+            anexar_diario(ARQUIVO_DIARIO, ARQUIVO_DIARIO_PENDENTE)
+            compactacao_pendente = (df.copy(), geracao_diario)  # Um pedido mais novo substitui o anterior
+    diario = open(ARQUIVO_DIARIO, "a", encoding="utf-8")
+    edicoes_diario = 0
+    if iniciar:
+        threading.Thread(target=gravar_compactacao, args=(df.copy(), geracao_diario), daemon=True).start()
+
+def anexar_diario(origem, destino):
+    """Acrescenta os registros de um diário ao fim de outro e apaga o de origem."""
+    with open(origem, encoding="utf-8") as leitura, open(destino, "a", encoding="utf-8") as escrita:
+        shutil.copyfileobj(leitura, escrita)
+        escrita.flush()
+        os.fsync(escrita.fileno())
+    os.remove(origem)
+
+def gravar_compactacao(dados, geracao):
+    """Grava o snapshot compactado, descarta o diário já incorporado a ele e segue com a fila."""
+    global compactacao_pendente, compactando
+    try:
+        while True:
+            with trava_snapshot:
+                if geracao == geracao_diario:  # Senão, outro inventário foi aberto nesse meio-tempo
+                    gravar_snapshot(dados)
+                    os.remove(ARQUIVO_DIARIO_ANTERIOR)
+            with trava_compactacao:
+                if compactacao_pendente is None:
+                    compactando = False
+                    return
+                dados, geracao = compactacao_pendente
+                compactacao_pendente = None
+                if geracao == geracao_diario:
+                    os.replace(ARQUIVO_DIARIO_PENDENTE, ARQUIVO_DIARIO_ANTERIOR)
+    except OSError:
+        # Os diários continuam valendo; a próxima compactação os incorpora
+        with trava_compactacao:
+            compactacao_pendente = None
+            compactando = False
+
+def verificar_recuperacao():
+    """Oferece recuperar a contagem quando o aplicativo não foi fechado corretamente."""
+    if not (os.path.exists(ARQUIVO_SESSAO_ATIVA) and os.path.exists(ARQUIVO_SNAPSHOT)):
+        return
+    if messagebox.askyesno(
+        "Recuperar contagem",
+        "O aplicativo não foi fechado corretamente na última vez.\nDeseja recuperar a contagem interrompida?"
+    ):
+        executar_em_segundo_plano(
+            "Recuperando contagem...", ler_recuperacao, exibir_sessao, "Erro ao recuperar a contagem"
+        )
+    else:
+        descartar_recuperacao()
+
+def ler_recuperacao(progresso):
+    """Reconstrói o inventário a partir do último snapshot mais o diário (fora da thread do Tk)."""
+    progresso(0.1, "Lendo o último snapshot...")
+    dados = pd.read_pickle(ARQUIVO_SNAPSHOT)
+    progresso(0.3, "Reaplicando as edições do diário...")
+    aplicar_registros(
+        dados, ler_diario(ARQUIVO_DIARIO_ANTERIOR) + ler_diario(ARQUIVO_DIARIO_PENDENTE) + ler_diario(ARQUIVO_DIARIO)
+    )
+    return preparar_inventario(dados, "no snapshot", progresso, manter_calculadas=True)
+
+def ler_diario(caminho):
+    """Lê os registros de um diário, ignorando uma última linha gravada pela metade."""
+    registros = []
+    if os.path.exists(caminho):
+        with open(caminho, encoding="utf-8") as arquivo:
+            for linha in arquivo:
+                try:
+                    registros.append(json.loads(linha))
+                except json.JSONDecodeError:
+                    break  # Queda durante a gravação desta linha
+    return registros
+
+def aplicar_registros(dados, registros):
+    """Reaplica as edições do diário, na ordem em que foram feitas."""
+    if not registros:
+        return
+    posicao_por_chave, repetidas = construir_indice_chaves(dados), construir_indice_repetidas(dados)
+    novos = {}  # A última edição de cada linha prevalece
+    for registro in registros:
+        posicao = localizar_ocorrencia(
+            posicao_por_chave, repetidas, registro["cod"], registro["endereco"], registro.get("ocorrencia", 0)
+        )
+        if posicao is not None:
+            novos[posicao] = registro["novo"]
+    if not novos:
+        return
 
+    # Grava as contagens e recalcula as colunas das linhas editadas, como em salvar_valor
+    gravar_contagens(dados, np.fromiter(novos.keys(), dtype=np.int64), np.fromiter(novos.values(), dtype=float))
+
+def descartar_recuperacao():
+    """Apaga o snapshot e o diário (fechamento normal ou recuperação recusada)."""
+    global diario, geracao_diario
+    if diario is not None:
+        diario.close()
+        diario = None
+    with trava_snapshot:
+        geracao_diario += 1  # Compactações em andamento não gravam mais nada
+        arquivos = (ARQUIVO_SNAPSHOT, ARQUIVO_DIARIO, ARQUIVO_DIARIO_ANTERIOR, ARQUIVO_DIARIO_PENDENTE, ARQUIVO_SESSAO_ATIVA)
+        for caminho in arquivos:
+            if os.path.exists(caminho):
+                os.remove(caminho)
+
+def fechar_aplicativo():
+    """Fecha o aplicativo normalmente, sem deixar uma contagem para recuperar."""
+    if servidor is not None and deltas_pendentes:
+        try:
+            enviar_deltas(servidor["url"], deltas_pendentes, ESTACAO)  # Últimas leituras ainda não enviadas
+        except OSError as e:
+            if not messagebox.askyesno(
+                "Servidor indisponível",
+                f"{len(deltas_pendentes)} contagem(ns) não chegaram ao servidor ({e}).\nFechar mesmo assim?"
+            ):
+                return
+    fechar_banco()
+    descartar_recuperacao()
+    root.destroy()
+
+@diagnostico.medido("atualizar_tabela", linhas=lambda _: len(visao))
 def atualizar_tabela(filtro_codigo=None, filtro_endereco=None):
     """Atualiza a tabela exibida na aba Apuração com filtros opcionais."""
-    for row in tabela.get_children():
-        tabela.delete(row)
-
-    df_filtrado = df
+    posicoes = np.arange(len(df))
     if filtro_codigo:
-        df_filtrado = df_filtrado[df_filtrado["COD"].astype(str).str.contains(filtro_codigo, na=False)]
+        posicoes = np.intersect1d(posicoes, buscar_prefixo(indice_busca["COD"], filtro_codigo))
     if filtro_endereco:
-        df_filtrado = df_filtrado[df_filtrado["ENDEREÇO"].astype(str).str.contains(filtro_endereco, na=False)]
-
-    for index, row in df_filtrado.iterrows():
-        valores_formatados = [
-            formatar_moeda(row["VL. UNT."]) if col == "VL. UNT." else
-            formatar_moeda(row["VL. ESTOQUE"]) if col == "VL. ESTOQUE" else
-            formatar_moeda(row["VL. DIF."]) if col == "VL. DIF." else
-            row[col] for col in colunas[1:]
-        ]
-        tabela.insert("", "end", values=(index, *valores_formatados))
+        posicoes = np.intersect1d(posicoes, buscar_prefixo(indice_busca["ENDEREÇO"], filtro_endereco))
 
+    definir_visao(posicoes)
     redimensionar_colunas()
+
+def chave_da_linha(posicao):
+    """Retorna a chave estável (COD, ENDEREÇO, ocorrência) da linha na posição informada.
+
+    A ocorrência distingue as linhas que repetem COD + ENDEREÇO (0 na primeira delas).
+    """
+    cod, endereco = str(df["COD"].iat[posicao]), str(df["ENDEREÇO"].iat[posicao])
+    return cod, endereco, ocorrencia_da_linha(indice_busca["REPETIDAS"], cod, endereco, posicao)
+
+def posicao_da_chave(cod, endereco, ocorrencia=0):
+    """Localiza a linha de uma chave (COD, ENDEREÇO, ocorrência) em O(1); None se não existir."""
+    return localizar_ocorrencia(indice_busca["CHAVE"], indice_busca["REPETIDAS"], cod, endereco, ocorrencia)
+
+def chave_do_delta(delta):
+    """Chave (COD, ENDEREÇO, ocorrência) de um incremento ou de uma linha do servidor."""
+    return delta["cod"], delta["endereco"], delta.get("ocorrencia", 0)
+
+def definir_visao(posicoes):
+    """Define as linhas de df (por posição) exibidas na tabela e volta ao topo."""
+    global visao, inicio_janela, ordem_atual, ordem_desatualizada
+    if ordem_desatualizada or any(col not in cache_ordenacao for col, _ in chaves_ordenacao):
+        # Linhas editadas já mudaram de lugar no cache: a nova visão sai na ordem atualizada
+        ordem_atual = calcular_ordem(chaves_ordenacao) if chaves_ordenacao else None
+        ordem_desatualizada = False
+    visao = aplicar_ordem(np.asarray(posicoes, dtype=np.int64))
+    inicio_janela = 0
+    renderizar_janela()
+
+def aplicar_ordem(posicoes):
+    """Coloca as posições na ordem da classificação atual, sem reordenar df."""
+    if ordem_atual is None:
+        return posicoes
+    selecionadas = np.zeros(len(df), dtype=bool)
+    selecionadas[posicoes] = True
+    return ordem_atual[selecionadas[ordem_atual]]
+
+def linhas_por_tela():
+    """Calcula quantas linhas cabem na área visível da tabela."""
+    altura_linha = int(ttk.Style().lookup("Treeview", "rowheight") or 25)
+    altura = tabela.winfo_height()
+    if altura <= 1:  # Tabela ainda não foi desenhada
+        return int(tabela.cget("height"))
+    return max(1, altura // altura_linha)
+
+def renderizar_janela():
+    """Exibe somente a janela visível da visão atual (mais um pequeno buffer)."""
+    global inicio_janela, posicoes_janela
+    total = len(visao)
+    por_tela = linhas_por_tela()
+    inicio_janela = max(0, min(inicio_janela, total - por_tela))
+    posicoes = visao[inicio_janela:inicio_janela + por_tela + LINHAS_BUFFER]
+    posicoes_janela = posicoes
+
+    # Reaproveita os itens já existentes em vez de apagar e recriar a tabela
+    while len(itens_janela) < len(posicoes):
+        itens_janela.append(tabela.insert("", "end", values=()))
+    while len(itens_janela) > len(posicoes):
+        tabela.delete(itens_janela.pop())
+
+    for item, valores in zip(itens_janela, valores_janela(posicoes)):
+        tabela.item(item, values=valores)
+
+    tabela.yview_moveto(0)
+    if total:
+        scrollbar_y.set(inicio_janela / total, min(1.0, (inicio_janela + por_tela) / total))
+    else:
+        scrollbar_y.set(0.0, 1.0)
     formatar_coluna_vl_dif()  # Aplica a formatação condicional
 
+def rolar_tabela(*args):
+    """Recebe os comandos da barra de rolagem e desloca a janela exibida."""
+    global inicio_janela
+    if df is None:
+        return
+    if args[0] == "moveto":
+        inicio_janela = int(float(args[1]) * len(visao))
+    elif args[0] == "scroll":
+        passo = linhas_por_tela() if args[2] == "pages" else 1
+        inicio_janela += int(args[1]) * passo
+    renderizar_janela()
+
+def rolar_com_mouse(event):
+    """Desloca a janela exibida com a roda do mouse."""
+    if event.num == 4 or getattr(event, "delta", 0) > 0:
+        rolar_tabela("scroll", -3, "units")
+    else:
+        rolar_tabela("scroll", 3, "units")
+    return "break"  # Impede a rolagem nativa da Treeview
+
+@diagnostico.medido("formatar_coluna_vl_dif", linhas=lambda _: len(itens_janela), minimo_s=MINIMO_COLORIR_S)
 def formatar_coluna_vl_dif():
     """Aplica formatação condicional à coluna VL. DIF."""
-    vl_dif_index = colunas.index("VL. DIF.")  # Localiza o índice da coluna VL. DIF.
-
-    # Removendo todas as tags para evitar conflitos anteriores
-    for item in tabela.get_children():
-        tabela.item(item, tags="")
-
-    for item in tabela.get_children():
-        valores = tabela.item(item, "values")
-        try:
-            vl_dif = float(
-                str(valores[vl_dif_index])
-                .replace("R$", "")
-                .replace(".", "")
-                .replace(",", ".")
-            )  # Converte o valor
-
-            if vl_dif > 0:  # Valor positivo
-                tabela.tag_configure("positivo", background="green", foreground="white")
-                tabela.item(item, tags=("positivo",))
-            if vl_dif == 0:  # Valor positivo
-                tabela.tag_configure("igual", background="white", foreground="black")
-                tabela.item(item, tags=("igual",))
-            elif vl_dif < 0:  # Valor negativo
-                tabela.tag_configure("negativo", background="red", foreground="white")
-                tabela.item(item, tags=("negativo",))
-        except ValueError:
-            # Ignora erros de conversão
-            continue
+    # A cor vem do valor numérico em df, sem converter de volta o texto exibido
+    vl_dif = df["VL. DIF."].to_numpy()[posicoes_janela]
+    for item, valor in zip(itens_janela, vl_dif):
+        tabela.item(item, tags=tag_vl_dif(valor))
+
+def tag_vl_dif(vl_dif):
+    """Retorna as tags de cor da linha conforme o sinal de VL. DIF."""
+    if vl_dif > 0:  # Valor positivo
+        return ("positivo",)
+    if vl_dif == 0:  # Valor igual
+        return ("igual",)
+    if vl_dif < 0:  # Valor negativo
+        return ("negativo",)
+    return ()
+
+def atualizar_linha(posicao):
+    """Renderiza novamente apenas o item da tabela que exibe a linha informada."""
+    encontrados = np.flatnonzero(posicoes_janela == posicao)
+    if len(encontrados) == 0:
+        return  # Linha fora da área visível; será exibida ao rolar
+    item = itens_janela[encontrados[0]]
+    valores = valores_janela([posicao])[0]
+    tabela.item(item, values=valores, tags=tag_vl_dif(df.iat[posicao, df.columns.get_loc("VL. DIF.")]))
 
 def classificar_vl_dif(ascendente=True):
     """Classifica a tabela com base na coluna VL. DIF."""
-    global df
     if df is None:
         messagebox.showwarning("Aviso", "Nenhum inventário foi carregado!")
         return
+    chaves_ordenacao[:] = [("VL. DIF.", ascendente)]
+    ordenar_tabela()
+
+def clicar_cabecalho(event):
+    """Classifica pela coluna clicada; com Shift, acrescenta a coluna como critério secundário."""
+    if tabela.identify_region(event.x, event.y) != "heading" or df is None or inventario_ocupado():
+        return
+    numero = tabela.identify_column(event.x)  # "#1" é a primeira coluna exibida
+    col = colunas[int(numero[1:]) - 1]
+    criterios = [c for c, _ in chaves_ordenacao]
+    if event.state & 0x0001:  # Shift pressionado
+        if col in criterios:
+            i = criterios.index(col)
+            chaves_ordenacao[i] = (col, not chaves_ordenacao[i][1])
+        else:
+            chaves_ordenacao.append((col, True))
+    elif criterios == [col]:
+        chaves_ordenacao[0] = (col, not chaves_ordenacao[0][1])  # Segundo clique inverte a ordem
+    else:
+        chaves_ordenacao[:] = [(col, True)]
+    ordenar_tabela()
 
+def ordenar_tabela():
+    """Aplica os critérios de classificação atuais à visão, sem reordenar df."""
+    global ordem_atual, ordem_desatualizada
     try:
-        # Ordena o DataFrame com base em VL. DIF.
-        df = df.sort_values(by="VL. DIF.", ascending=ascendente).reset_index(drop=True)
-        atualizar_tabela()
-        messagebox.showinfo("Sucesso", f"VL. DIF. classificado em ordem {'crescente' if ascendente else 'decrescente'}!")
+        ordem_atual = calcular_ordem(chaves_ordenacao) if chaves_ordenacao else None
+        ordem_desatualizada = False
     except Exception as e:
-        messagebox.showerror("Erro", f"Erro ao classificar VL. DIF.: {e}")
-
+        messagebox.showerror("Erro", f"Erro ao classificar a tabela: {e}")
+        return
+    atualizar_cabecalhos()
+    definir_visao(visao)  # Mantém o filtro atual, agora na nova ordem
 
-def redimensionar_colunas():
-    """Ajusta automaticamente a largura de cada coluna com base no conteúdo."""
-    fonte_padrao = Font()
+def atualizar_cabecalhos():
+    """Mostra nos cabeçalhos o sentido (e a prioridade) de cada critério de classificação."""
     for col in colunas:
-        tabela.column(col, width=fonte_padrao.measure(col))
-        for item in tabela.get_children():
-            valor = tabela.item(item, "values")[colunas.index(col)]
-            largura = fonte_padrao.measure(str(valor))
-            if tabela.column(col, "width") < largura:
-                tabela.column(col, width=largura + 10)
-
+        tabela.heading(col, text=col.upper())
+    for prioridade, (col, ascendente) in enumerate(chaves_ordenacao, start=1):
+        seta = "▲" if ascendente else "▼"
+        sufixo = f" {seta}{prioridade}" if len(chaves_ordenacao) > 1 else f" {seta}"
+        tabela.heading(col, text=col.upper() + sufixo)
+
+def calcular_ordem(chaves):
+    """Combina as permutações em cache de cada coluna na permutação da visão."""
+    if len(chaves) == 1:
+        col, ascendente = chaves[0]
+        ordem, _ = ordem_da_coluna(col)
+        return ordem if ascendente else ordem[::-1].copy()
+    # lexsort usa a última chave como principal; postos inteiros evitam comparar textos
+    postos = []
+    for col, ascendente in reversed(chaves):
+        posto = postos_da_coluna(col)
+        postos.append(posto if ascendente else -posto)
+    return np.lexsort(postos)
+
+def ordem_da_coluna(col):
+    """Retorna (permutação crescente, valores ordenados) da coluna, calculando só na primeira vez."""
+    if col not in cache_ordenacao:
+        valores = valores_ordenacao(col)
+        ordem = np.argsort(valores, kind="stable")  # Empates ficam na ordem das posições
+        cache_ordenacao[col] = (ordem, valores[ordem])
+    return cache_ordenacao[col]
+
+def valores_ordenacao(col):
+    """Converte a coluna em um array comparável para a classificação."""
+    if col == "ÍNDICE":
+        return np.arange(len(df), dtype=np.float64)
+    serie = df[col]
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        # Posto alfabético de cada categoria; valores ausentes vão para o fim
+        postos = np.empty(len(serie.cat.categories), dtype=np.float64)
+        postos[serie.cat.categories.argsort()] = np.arange(len(postos))
+        codigos = serie.cat.codes.to_numpy()
+        return np.where(codigos >= 0, postos[codigos], np.inf)
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie.to_numpy(dtype=np.float64, na_value=np.nan)
+    numeros = pd.to_numeric(serie, errors="coerce")
+    if not numeros.isna().any():
+        return numeros.to_numpy(dtype=np.float64)  # Códigos numéricos: "99" antes de "100"
+    return serie.fillna("").astype(str).to_numpy(dtype=str)
+
+def postos_da_coluna(col):
+    """Posto denso de cada linha na coluna (valores iguais têm o mesmo posto)."""
+    ordem, ordenados = ordem_da_coluna(col)
+    novos = np.empty(len(ordenados), dtype=np.int64)
+    if len(ordenados):
+        novos[0] = 0
+        np.cumsum(ordenados[1:] != ordenados[:-1], out=novos[1:])
+    postos = np.empty_like(novos)
+    postos[ordem] = novos
+    return postos
+
+def atualizar_cache_ordenacao(posicao, colunas_alteradas):
+    """Reposiciona uma linha editada nas permutações em cache, sem reclassificar tudo.
+
+    A tabela exibida não muda de ordem; a próxima visão (filtro ou busca) já usa a nova.
+    """
+    global ordem_desatualizada
+    for col in colunas_alteradas:
+        if col not in cache_ordenacao:
+            continue
+        if any(col == criterio for criterio, _ in chaves_ordenacao):
+            ordem_desatualizada = True
+        ordem, ordenados = cache_ordenacao[col]
+        atual = np.flatnonzero(ordem == posicao)[0]
+        ordem = np.delete(ordem, atual)
+        ordenados = np.delete(ordenados, atual)
+        valor = df[col].iat[posicao]
+        valor = np.nan if pd.isna(valor) else float(valor)
+        # Entre valores iguais, a linha volta ao lugar da sua posição em df
+        inicio = np.searchsorted(ordenados, valor, side="left")
+        fim = np.searchsorted(ordenados, valor, side="right")
+        destino = inicio + np.searchsorted(ordem[inicio:fim], posicao)
+        cache_ordenacao[col] = (np.insert(ordem, destino, posicao), np.insert(ordenados, destino, valor))
+
+def redefinir_ordenacao():
+    """Volta à ordem original e descarta as permutações em cache."""
+    global ordem_atual, ordem_desatualizada
+    ordem_atual = None
+    ordem_desatualizada = False
+    chaves_ordenacao.clear()
+    cache_ordenacao.clear()
+    atualizar_cabecalhos()
 
 
 def editar_valor(event):
     """Permite editar o valor da coluna CONTAGEM ao clicar em uma célula."""
     global entry_temporaria
+    if inventario_ocupado():
+        return  # Evita edições enquanto uma operação trabalha sobre uma cópia que substituirá o inventário
     # Obtem o item selecionado
     item = tabela.identify_row(event.y)
     coluna = tabela.identify_column(event.x)
@@ -195,7 +837,7 @@ def editar_valor(event):
     valores = tabela.item(item, "values")
     if not valores:
         return
-    indice = int(valores[0])  # Obtém o índice da linha
+    posicao = int(posicoes_janela[itens_janela.index(item)])  # Linha de df exibida neste item
 
     # Posiciona o campo de entrada (Entry) na célula
     x, y, width, height = tabela.bbox(item, coluna)
@@ -205,21 +847,20 @@ def editar_valor(event):
     entry_temporaria.focus()
 
     # Salvar automaticamente ao perder o foco ou pressionar Enter
-    entry_temporaria.bind("<Return>", lambda e: salvar_valor(indice))
-    entry_temporaria.bind("<FocusOut>", lambda e: salvar_valor(indice))
+    entry_temporaria.bind("<Return>", lambda e: salvar_valor(posicao))
+    entry_temporaria.bind("<FocusOut>", lambda e: salvar_valor(posicao))
 
 
-def salvar_valor(indice):
+def salvar_valor(posicao):
     """Salva o valor editado na coluna CONTAGEM."""
     global entry_temporaria
+    if entry_temporaria is None:
+        return  # Já salvo pelo Enter; ignora o FocusOut da destruição do campo
     try:
         novo_valor = float(entry_temporaria.get().replace(",", "."))
-        df.at[indice, "CONTAGEM"] = novo_valor
-        df.at[indice, "DIF. ETQ"] = novo_valor - df.at[indice, "QTD"]
-        df.at[indice, "VL. ESTOQUE"] = df.at[indice, "VL. UNT."] * df.at[indice, "QTD"]
-        df.at[indice, "VL. DIF."] = df.at[indice, "DIF. ETQ"] * df.at[indice, "VL. UNT."]
-        atualizar_tabela()
-        atualizar_resumo()
+        aplicar_contagem(posicao, novo_valor)
+        atualizar_linha(posicao)
+        exibir_resumo()
     except ValueError:
         messagebox.showerror("Erro", "Por favor, insira um valor válido.")
     finally:
@@ -227,39 +868,286 @@ def salvar_valor(indice):
             entry_temporaria.destroy()
             entry_temporaria = None
 
+def aplicar_contagem(posicao, novo_valor, registrar=True):
+    """Grava a nova contagem de uma linha em df, nos caches e nos totais (sem redesenhar a tela).
+
+    Com registrar, a edição é desta estação: vai para o diário e, se conectado, para o servidor.
+    """
+    contribuicao_anterior = contribuicao_da_linha(df, posicao)
+    valor_anterior = df["CONTAGEM"].iat[posicao]
+    gravar_contagens(df, posicao, novo_valor)
+    gravar_no_banco(posicao)
+    if registrar:
+        registrar_edicao(posicao, valor_anterior, novo_valor)  # Depois de df, para a compactação já incluir a edição
+        if servidor is not None:
+            enfileirar_delta(posicao, valor_anterior, novo_valor)
+            agendar_envio()
+    alteradas = ["CONTAGEM", "DIF. ETQ", "VL. ESTOQUE", "VL. DIF."]
+    atualizar_cache_ordenacao(posicao, alteradas)
+    atualizar_exibicao_linha(posicao)
+    atualizar_larguras_linha(posicao, alteradas)  # As colunas só crescem quando o novo texto é mais largo
+    aplicar_delta_resumo(posicao, contribuicao_anterior, contribuicao_da_linha(df, posicao), exibir=False)
+
+def enfileirar_delta(posicao, anterior, novo):
+    """Acrescenta ao próximo lote do servidor o incremento que leva a linha de anterior a novo."""
+    cod, endereco, ocorrencia = chave_da_linha(posicao)
+    anterior = 0.0 if pd.isna(anterior) else float(anterior)
+    novo = 0.0 if pd.isna(novo) else float(novo)
+    deltas_pendentes.append({"cod": cod, "endereco": endereco, "ocorrencia": ocorrencia, "quantidade": novo - anterior})
+
+def registrar_leitura(event=None):
+    """Soma à CONTAGEM o item lido pelo leitor de código de barras (COD ou COD*QTD)."""
+    texto = entry_leitor.get()
+    entry_leitor.delete(0, tk.END)  # Pronto para a próxima leitura
+    if not texto.strip():
+        return
+    if df is None or indice_busca is None or inventario_ocupado():
+        avisar_leitura("Aguarde: não há inventário pronto para a contagem.")
+        return
+    try:
+        cod, quantidade = interpretar_leitura(texto)
+    except ValueError:
+        avisar_leitura(f"Leitura inválida: {texto.strip()}")
+        return
+    posicao = posicao_do_codigo(cod)
+    if posicao is None:
+        avisar_leitura(f"Código {cod} não encontrado.")
+        return
+
+    anterior = df["CONTAGEM"].iat[posicao]
+    novo_valor = (0.0 if pd.isna(anterior) else float(anterior)) + quantidade
+    aplicar_contagem(posicao, novo_valor)
+    cod, endereco, _ = chave_da_linha(posicao)
+    rotulo_leitor.config(text=f"{cod} - {df['PRODUTO'].iat[posicao]} ({endereco}): {novo_valor:g}", fg="black")
+
+    # Tabela e resumo são redesenhados uma vez por intervalo, não a cada leitura
+    leituras_pendentes.add(posicao)
+    agendar_descarga()
+
+def posicao_do_codigo(cod):
+    """Localiza em O(1) a linha de um COD lido; None se não existir."""
+    candidatas = indice_busca["CODIGO"].get(cod)
+    if candidatas is None and cod.lstrip("0") != cod:
+        candidatas = indice_busca["CODIGO"].get(cod.lstrip("0"))  # Código de barras com zeros à esquerda
+    if candidatas is None:
+        return None
+    if len(candidatas) > 1 and len(visao) < len(df):
+        # Código em vários endereços: prefere o da visão atual (ex.: filtrada pelo endereço em contagem)
+        visiveis = candidatas[np.isin(candidatas, visao, kind="table")]
+        if len(visiveis):
+            return int(visiveis[0])
+    return int(candidatas[0])
+
+def avisar_leitura(mensagem):
+    """Mostra um problema da leitura sem interromper o leitor com uma janela."""
+    rotulo_leitor.config(text=mensagem, fg="red")
+    root.bell()
+
+def agendar_descarga():
+    """Agenda o redesenho das linhas pendentes, se ainda não houver um agendado."""
+    global atualizacao_leitor
+    if atualizacao_leitor is None:
+        atualizacao_leitor = root.after(INTERVALO_LEITOR_MS, descarregar_leituras)
+
+def descarregar_leituras():
+    """Redesenha de uma só vez as linhas e o resumo alterados pelas leituras pendentes."""
+    global atualizacao_leitor
+    atualizacao_leitor = None
+    for posicao in leituras_pendentes:
+        if posicao < len(df):
+            atualizar_linha(posicao)
+    leituras_pendentes.clear()
+    if totais_resumo is not None:
+        exibir_resumo()
+
+def conectar_servidor():
+    """Baixa o inventário de um servidor de contagem e passa a contar junto com as outras estações."""
+    url = simpledialog.askstring(
+        "Conectar ao Servidor", "Endereço do servidor de contagem:", initialvalue=f"http://localhost:{PORTA_PADRAO}"
+    )
+    if not url:
+        return
+    executar_em_segundo_plano(
+        "Conectando ao servidor...",
+        lambda progresso: ler_servidor(url, progresso),
+        lambda resultado: exibir_inventario_servidor(url, resultado),
+        "Erro ao conectar ao servidor",
+    )
+
+def ler_servidor(url, progresso):
+    """Baixa e prepara o inventário do servidor (executado fora da thread do Tk)."""
+    progresso(None, "Baixando inventário do servidor...")
+    dados, versao = baixar_inventario(url)
+    return preparar_inventario(dados, "no servidor", progresso, manter_calculadas=True), versao
+
+def exibir_inventario_servidor(url, resultado):
+    """Exibe o inventário do servidor e começa a receber as contagens das outras estações."""
+    global servidor
+    inventario, versao = resultado
+    exibir_sessao(inventario)
+    servidor = {"url": url, "versao": versao}
+    threading.Thread(target=escutar_servidor, args=(servidor,), daemon=True).start()
+    root.after(INTERVALO_FILA_MS, verificar_servidor)
+    rotulo_leitor.config(text=f"Conectado ao servidor {url}", fg="black")
+
+def desconectar_servidor():
+    """Volta à contagem local; a thread de escuta da conexão anterior termina sozinha."""
+    global servidor
+    servidor = None
+    deltas_pendentes.clear()
+    chaves_em_envio.clear()
+
+def escutar_servidor(conexao):
+    """Aguarda as alterações do servidor e as entrega à thread do Tk (executado em uma thread)."""
+    while conexao is servidor:
+        try:
+            resposta = aguardar_eventos(conexao["url"], conexao["versao"])
+        except (OSError, ValueError) as e:
+            fila_servidor.put((conexao, "erro", e))
+            threading.Event().wait(INTERVALO_ENVIO_MS / 1000 * 4)  # Aguarda antes de tentar de novo
+            continue
+        conexao["versao"] = resposta["versao"]
+        fila_servidor.put((conexao, "eventos", resposta))
+
+def agendar_envio():
+    """Agrupa as contagens desta estação e as envia ao servidor uma vez por intervalo."""
+    global envio_agendado
+    if envio_agendado is None:
+        envio_agendado = root.after(INTERVALO_ENVIO_MS, enviar_pendentes)
+
+def enviar_pendentes():
+    """Envia ao servidor, em uma thread, o lote de contagens acumulado."""
+    global envio_agendado
+    envio_agendado = None
+    if servidor is None or not deltas_pendentes:
+        return
+    lote = deltas_pendentes[:]
+    deltas_pendentes.clear()
+    for delta in lote:
+        chave = chave_do_delta(delta)
+        chaves_em_envio[chave] = chaves_em_envio.get(chave, 0) + 1
+    conexao = servidor
+
+    def enviar():
+        try:
+            fila_servidor.put((conexao, "enviado", (lote, enviar_deltas(conexao["url"], lote, ESTACAO))))
+        except (OSError, ValueError) as e:
+            fila_servidor.put((conexao, "falha", (lote, e)))
+
+    threading.Thread(target=enviar, daemon=True).start()
+
+def verificar_servidor():
+    """Processa, na thread do Tk, as respostas e os eventos do servidor."""
+    # Uma carga, apuração ou mescla trabalha sobre uma cópia de df, que substituirá df ao terminar:
+    # as mensagens ficam na fila e são aplicadas depois, sobre o inventário resultante
+    while not inventario_ocupado():
+        try:
+            conexao, tipo, conteudo = fila_servidor.get_nowait()
+        except queue.Empty:
+            break
+        if conexao is not servidor:
+            continue  # Mensagem de uma conexão já encerrada
+
+        if tipo == "eventos":
+            aplicar_linhas_servidor(conteudo["linhas"])
+            if conteudo["recarregar"]:
+                avisar_leitura("O servidor foi reiniciado ou esta estação ficou para trás: conecte-se novamente.")
+        elif tipo == "enviado":
+            lote, resposta = conteudo
+            liberar_chaves(lote)
+            aplicar_linhas_servidor(resposta["linhas"])
+            if resposta["recusados"]:
+                avisar_leitura(f"{len(resposta['recusados'])} contagem(ns) recusada(s) pelo servidor.")
+        elif tipo == "falha":
+            lote, erro = conteudo
+            liberar_chaves(lote)
+            deltas_pendentes[:0] = lote  # Reenvia no próximo lote, antes das leituras mais novas
+            agendar_envio()
+            avisar_leitura(f"Servidor indisponível ({erro}); as contagens serão reenviadas.")
+        else:
+            avisar_leitura(f"Sem conexão com o servidor ({conteudo}).")
+
+    if servidor is not None:
+        root.after(INTERVALO_FILA_MS, verificar_servidor)
+
+def liberar_chaves(lote):
+    """Retira as chaves de um lote da lista de contagens em envio."""
+    for delta in lote:
+        chave = chave_do_delta(delta)
+        chaves_em_envio[chave] -= 1
+        if not chaves_em_envio[chave]:
+            del chaves_em_envio[chave]
+
+def aplicar_linhas_servidor(linhas):
+    """Aplica as contagens oficiais do servidor, exceto onde esta estação tem contagens a caminho."""
+    ocupadas = set(chaves_em_envio) | {chave_do_delta(delta) for delta in deltas_pendentes}
+    for linha in linhas:
+        chave = chave_do_delta(linha)
+        posicao = posicao_da_chave(*chave)
+        if chave in ocupadas or posicao is None:
+            continue  # A resposta desse lote trará o valor que já inclui a contagem local
+        atual = df["CONTAGEM"].iat[posicao]
+        if not pd.isna(atual) and float(atual) == linha["contagem"]:
+            continue
+        aplicar_contagem(posicao, linha["contagem"], registrar=False)
+        leituras_pendentes.add(posicao)
+    agendar_descarga()
+
+@diagnostico.medido("atualizar_resumo", linhas=lambda _: len(df))
 def atualizar_resumo():
-    """Atualiza o resumo exibido na aba Resumo."""
-    for widget in frame_resumo.winfo_children():
-        widget.destroy()
-
-    # Calcular resumo
-    total_estoque = df["VL. ESTOQUE"].sum()
-    total_dif_neg = df[df["DIF. ETQ"] < 0]["VL. DIF."].sum()
-    total_dif_pos = df[df["DIF. ETQ"] > 0]["VL. DIF."].sum()
-    divergencia_absoluta = abs(total_dif_neg) + abs(total_dif_pos)
-
-
-
-    # Calcular os novos totais
-    total_itens_contados = len(df[df["CONTAGEM"] > 0])
-    total_itens_negativos = len(df[df["DIF. ETQ"] < 0])
-    total_itens_positivos = len(df[df["DIF. ETQ"] > 0])
-
-    # Dados de resumo
-    resumo_data = [
-        ("ESTOQUE TOTAL", formatar_moeda(total_estoque)),
-        ("TOTAL DE ITENS CONTADOS", f"{total_itens_contados}"),
-        ("TOTAL DE ITENS NEGATIVOS", f"{total_itens_negativos}"),
-        ("TOTAL DE ITENS POSITIVOS", f"{total_itens_positivos}"),
-        ("TOTAL DIVERGÊNCIAS NEGATIVAS", formatar_moeda(total_dif_neg)),
-        ("TOTAL DIVERGÊNCIAS POSITIVAS", formatar_moeda(total_dif_pos)),
-        ("% DIVERGÊNCIA ABSOLUTA", f"{(divergencia_absoluta / total_estoque * 100):,.2f}%" if total_estoque != 0 else "0,00%"),
-    ]
+    """Recalcula todos os totais, gerais e por zona, e atualiza o resumo exibido na aba Resumo."""
+    global totais_resumo, resumo_zonas
+    resumo_zonas = resumo_por_zona(df, niveis_zona)
+    totais_resumo = totais_do_vetor(resumo_zonas[2].sum(axis=0))
+    if tabela_zonas is not None:
+        tabela_zonas.delete(*tabela_zonas.get_children())  # O conjunto de zonas pode ter mudado
+        itens_zonas.clear()
+    exibir_resumo()
+
+def aplicar_delta_resumo(posicao, anterior, nova, exibir=True):
+    """Atualiza os totais gerais e os da zona da linha, retirando a contribuição anterior e somando a nova."""
+    global totais_resumo
+    if totais_resumo is None:
+        atualizar_resumo()  # Primeira vez: calcula os totais a partir de df
+        return
+    delta = nova - anterior
+    totais_resumo = totais_do_vetor([totais_resumo[chave] for chave in CHAVES_RESUMO] + delta)
+    zonas, _, matriz = resumo_zonas
+    matriz[zonas[posicao]] += delta
+    zonas_alteradas.add(zonas[posicao])
+    if exibir:
+        exibir_resumo()
+
+def exibir_resumo():
+    """Exibe os totais atuais na aba Resumo, reaproveitando as tabelas já criadas."""
+    if tabela_resumo is None:
+        criar_tabelas_resumo()
+
+    # Atualiza apenas os valores das linhas existentes
+    for item, (titulo, valor) in zip(tabela_resumo.get_children(), linhas_resumo(totais_resumo)):
+        tabela_resumo.item(item, values=(titulo, valor))
+    exibir_zonas()
+
+def exibir_zonas():
+    """Redesenha na tabela por zona só as zonas cujos totais mudaram desde a última exibição."""
+    _, nomes, matriz = resumo_zonas
+    if not itens_zonas:
+        itens_zonas.extend(tabela_zonas.insert("", "end") for _ in nomes)
+        zonas_alteradas.update(range(len(nomes)))
+    for zona in zonas_alteradas:
+        valores = [valor for _, valor in linhas_resumo(totais_do_vetor(matriz[zona]))]
+        tabela_zonas.item(itens_zonas[zona], values=[str(nomes[zona])] + valores)
+    zonas_alteradas.clear()
+
+def criar_tabelas_resumo():
+    """Cria, uma única vez, a tabela dos totais gerais e a dos totais por zona do endereço."""
+    global tabela_resumo, tabela_zonas
+    titulos = [titulo for titulo, _ in linhas_resumo(totais_resumo)]
 
     # Criar tabela de resumo
     colunas_resumo = ["Descrição", "Valor"]
-    tabela_resumo = ttk.Treeview(frame_resumo, columns=colunas_resumo, show="headings", height=len(resumo_data))
-    tabela_resumo.pack(fill="both", expand=True, padx=10, pady=10)
+    tabela_resumo = ttk.Treeview(frame_resumo, columns=colunas_resumo, show="headings", height=len(titulos))
+    tabela_resumo.pack(fill="x", padx=10, pady=10)
 
     # Configurar colunas
     tabela_resumo.heading("Descrição", text="Descrição", anchor="w")
@@ -267,14 +1155,34 @@ def atualizar_resumo():
     tabela_resumo.column("Descrição", anchor="w", width=200)  # Reduza a largura da coluna "Descrição"
     tabela_resumo.column("Valor", anchor="center", width=150)  # Mantenha ou aumente a largura da coluna "Valor"
 
-    # Inserir dados na tabela
-    for titulo, valor in resumo_data:
-        tabela_resumo.insert("", "end", values=(titulo, valor))
+    # Linhas preenchidas por exibir_resumo
+    for titulo in titulos:
+        tabela_resumo.insert("", "end", values=(titulo, ""))
+
+    # Totais por zona: uma linha por zona, mesmas métricas do resumo geral
+    colunas_zonas = ["ZONA"] + [TITULOS_ZONAS.get(titulo, titulo) for titulo in titulos]
+    tabela_zonas = ttk.Treeview(frame_resumo, columns=colunas_zonas, show="headings")
+    tabela_zonas.pack(fill="both", expand=True, padx=10, pady=10)
+    for col in colunas_zonas:
+        tabela_zonas.heading(col, text=col, anchor="center")
+        tabela_zonas.column(col, anchor="center", width=130)
+    tabela_zonas.heading("ZONA", text=NOMES_ZONA[niveis_zona])
 
     # Estilizar linhas da tabela
     style = ttk.Style()
     style.configure("Treeview", font=("Arial", 12), rowheight=30)
     style.configure("Treeview.Heading", font=("Arial", 14, "bold"))
+    redimensionar_colunas()  # A tabela da Apuração também passa a ser desenhada em Arial 12
+
+def alternar_zonas():
+    """Alterna o resumo por zona entre a rua e a rua + prateleira do endereço."""
+    global niveis_zona
+    niveis_zona = 2 if niveis_zona == 1 else 1
+    btn_zonas.config(text=f"AGRUPAR POR {NOMES_ZONA[2 if niveis_zona == 1 else 1]}")
+    if tabela_zonas is not None:
+        tabela_zonas.heading("ZONA", text=NOMES_ZONA[niveis_zona])
+    if df is not None and totais_resumo is not None:
+        atualizar_resumo()
 
 def apurar_inventario():
     """Apura o inventário realizando os cálculos para cada item."""
@@ -282,25 +1190,115 @@ def apurar_inventario():
         messagebox.showwarning("Aviso", "Nenhum inventário foi carregado!")
         return
 
-    try:
-        # Recalcular valores para cada item
-        df["DIF. ETQ"] = df["CONTAGEM"] - df["QTD"]
-        df["VL. ESTOQUE"] = df["QTD"] * df["VL. UNT."]
-        df["VL. DIF."] = df["DIF. ETQ"] * df["VL. UNT."]
+    dados = df.copy()
+    executar_em_segundo_plano(
+        "Apurando inventário...",
+        lambda progresso: calcular_apuracao(dados, progresso),
+        concluir_apuracao,
+        "Erro ao apurar o inventário",
+    )
 
-        # Atualizar a tabela e o resumo
-        atualizar_tabela()
-        atualizar_resumo()
-        messagebox.showinfo("Sucesso", "Inventário apurado com sucesso!")
-    except Exception as e:
-        messagebox.showerror("Erro", f"Erro ao apurar o inventário: {e}")
+@diagnostico.medido("apurar_inventario")
+def calcular_apuracao(dados, progresso):
+    """Realiza os cálculos de cada item (executado fora da thread do Tk)."""
+    progresso(0.2, "Calculando diferenças...")
+    apurar(dados)
+
+    progresso(0.6, "Formatando valores...")
+    return dados, preparar_exibicao(dados)
+
+def concluir_apuracao(resultado):
+    """Exibe o inventário apurado."""
+    global df, exibicao
+    anterior = df
+    df, exibicao = resultado
+    cache_ordenacao.clear()  # Todas as colunas calculadas mudaram
+    compactar_diario()  # O diário só refaz a CONTAGEM: a apuração precisa de um novo snapshot
+    gravar_no_banco()
+    gravar_no_banco(posicoes_alteradas(anterior))  # Edições feitas durante a apuração não estão em df
+
+    # Atualizar a tabela e o resumo
+    ordenar_tabela()
+    atualizar_tabela()
+    atualizar_resumo()
+    messagebox.showinfo("Sucesso", "Inventário apurado com sucesso!")
+
+def mesclar_contagens_parciais():
+    """Mescla no inventário atual as contagens parciais salvas por outras equipes."""
+    if df is None:
+        messagebox.showwarning("Aviso", "Nenhum inventário foi carregado!")
+        return
+
+    arquivos = filedialog.askopenfilenames(
+        title="Selecione as Contagens Parciais",
+        filetypes=[("Contagens", "*.json *.xlsx *.xls *.csv *.feather")]
+    )
+    if not arquivos:
+        return
+    somar = messagebox.askyesnocancel(
+        "Mesclar Contagens",
+        "Para itens contados em mais de um arquivo:\n\n"
+        "Sim: somar as contagens\nNão: a contagem do último arquivo prevalece"
+    )
+    if somar is None:
+        return  # Caso o usuário cancele
+
+    dados = df.copy()
+    executar_em_segundo_plano(
+        "Mesclando contagens...",
+        lambda progresso: calcular_mescla(dados, arquivos, "somar" if somar else "substituir", progresso),
+        concluir_mescla,
+        "Erro ao mesclar as contagens",
+    )
+
+@diagnostico.medido("mesclar_contagens")
+def calcular_mescla(dados, arquivos, politica, progresso):
+    """Lê os arquivos e mescla as contagens em dados (executado fora da thread do Tk)."""
+    contagens = []
+    for i, arquivo in enumerate(arquivos):
+        progresso(0.7 * i / len(arquivos), f"Lendo {os.path.basename(arquivo)}...")
+        contagens.append((os.path.basename(arquivo), ler_contagens(arquivo)))
+    progresso(0.7, "Mesclando contagens...")
+    conflitos, nao_encontradas = mesclar_contagens(dados, contagens, politica)
+    progresso(0.85, "Formatando valores...")
+    return dados, preparar_exibicao(dados), len(arquivos), len(conflitos), len(nao_encontradas)
+
+def concluir_mescla(resultado):
+    """Exibe o inventário com as contagens mescladas."""
+    global df, exibicao
+    anterior = df
+    df, exibicao, arquivos, conflitos, nao_encontradas = resultado
+    cache_ordenacao.clear()
+    compactar_diario()  # Registra a mescla em um novo snapshot
+    alteradas = posicoes_alteradas(anterior)
+    gravar_no_banco(alteradas)
+    if servidor is not None:  # O servidor e as outras estações recebem as contagens mescladas
+        antes, depois = anterior["CONTAGEM"].to_numpy(dtype=float), df["CONTAGEM"].to_numpy(dtype=float)
+        for posicao in alteradas:
+            if np.nan_to_num(antes[posicao]) != np.nan_to_num(depois[posicao]):
+                enfileirar_delta(posicao, antes[posicao], depois[posicao])
+        agendar_envio()
+
+    ordenar_tabela()
+    atualizar_tabela()
+    atualizar_resumo()
+    mensagem = f"{arquivos} arquivo(s) de contagem mesclado(s)."
+    if conflitos:
+        mensagem += f"\n{conflitos} item(ns) com contagens divergentes marcados para recontagem (botão RECONTAGEM)."
+    if nao_encontradas:
+        mensagem += f"\n{nao_encontradas} contagem(ns) sem item correspondente no estoque foram ignoradas."
+    messagebox.showinfo("Sucesso", mensagem)
 
 
 def selecionar_contagens():
     """Seleciona todas as linhas da coluna CONTAGEM para edição."""
+    global exibicao
     if df is None:
         messagebox.showwarning("Aviso", "Nenhuma planilha foi carregada!")
         return
+    if inventario_ocupado():
+        messagebox.showwarning("Aviso", "Aguarde a operação em andamento terminar ou cancele-a.")
+        return
 
     try:
         # Preenche todas as linhas com um valor padrão (exemplo: 0 ou outro número)
@@ -317,24 +1315,98 @@ def selecionar_contagens():
         df["VL. ESTOQUE"] = df["VL. UNT."] * df["QTD"]
         df["VL. DIF."] = df["DIF. ETQ"] * df["VL. UNT."]
 
+        exibicao = preparar_exibicao(df)
+        cache_ordenacao.clear()
+        compactar_diario()  # Registra o preenchimento em massa em um novo snapshot
+        gravar_no_banco(np.arange(len(df)))
         atualizar_tabela()
         atualizar_resumo()
         messagebox.showinfo("Sucesso", "Contagens preenchidas com sucesso!")
     except Exception as e:
         messagebox.showerror("Erro", f"Erro ao preencher contagens: {e}")
 
+@diagnostico.medido("redimensionar_colunas", linhas=lambda _: len(df))
 def redimensionar_colunas():
-    """Ajusta automaticamente a largura de cada coluna com base no conteúdo."""
-    fonte_padrao = Font(family="TkDefaultFont")
+    """Ajusta a largura de cada coluna ao conteúdo do inventário inteiro, recalculando só quando ele muda."""
+    global dados_larguras
+    if df is None:
+        return
+    fontes = atualizar_fontes_tabela()
+    atuais = dados_larguras is not None and dados_larguras[0] is df and dados_larguras[1] is exibicao
+    if not atuais or dados_larguras[2] != fontes:
+        calcular_larguras()
+        dados_larguras = (df, exibicao, fontes)
+    aplicar_larguras()
+
+def atualizar_fontes_tabela():
+    """Mede com as fontes com que a Treeview desenha as linhas e os cabeçalhos; retorna as suas descrições.
+
+    O estilo da Treeview pode mudar durante o uso (o RESUMO passa a tabela para Arial 12).
+    """
+    estilo = ttk.Style()
+    for nome, padrao in (("Treeview", "TkDefaultFont"), ("Treeview.Heading", "TkHeadingFont")):
+        descricao = str(estilo.lookup(nome, "font") or padrao)
+        if nome not in fontes_tabela or fontes_tabela[nome][0] != descricao:
+            fontes_tabela[nome] = (descricao, Font(font=descricao))
+    return tuple(descricao for descricao, _ in fontes_tabela.values())
+
+def calcular_larguras():
+    """Calcula a largura das colunas: os textos mais longos são achados sem o Tk, e só eles são medidos."""
     for col in colunas:
-        largura_maxima = fonte_padrao.measure(col)  # Largura mínima com base no nome da coluna
-
-        for item in tabela.get_children():
-            valor = tabela.item(item, "values")[colunas.index(col)]
-            largura_valor = fonte_padrao.measure(str(valor))
-            largura_maxima = max(largura_maxima, largura_valor)
-
-        tabela.column(col, width=largura_maxima + 10)  # Adiciona um pequeno espaçamento extra
+        textos = textos_coluna(col)
+        comprimentos = textos.str.len().fillna(0).to_numpy(dtype=np.int64)
+        escolhidos = np.arange(len(comprimentos))
+        if len(comprimentos) > CANDIDATOS_LARGURA:
+            escolhidos = np.argpartition(comprimentos, -CANDIDATOS_LARGURA)[-CANDIDATOS_LARGURA:]
+        candidatos = [texto for texto in textos.iloc[escolhidos] if isinstance(texto, str)]
+        # Um texto novo mais curto que os candidatos não alarga a coluna (ver atualizar_larguras_linha)
+        limiares_colunas[col] = int(comprimentos[escolhidos].min()) if len(escolhidos) else 0
+        # O nome da coluna, na fonte do cabeçalho, é a largura mínima
+        larguras_colunas[col] = max(
+            [medir_texto(col, "Treeview.Heading"), *(medir_texto(texto) for texto in candidatos)]
+        ) + MARGEM_COLUNA
+
+def textos_coluna(col):
+    """Textos exibidos na coluna para o inventário inteiro, sem repetições quando é barato evitá-las."""
+    if col in COLUNAS_MOEDA:
+        return exibicao[col]  # Textos já formatados
+    valores = df.index if col == "ÍNDICE" else df[col]
+    if isinstance(valores.dtype, pd.CategoricalDtype):
+        codigos = valores.cat.codes.to_numpy()
+        usadas = np.bincount(codigos[codigos >= 0], minlength=len(valores.cat.categories)) > 0
+        return pd.Series(valores.cat.categories[usadas]).astype(str)
+    if pd.api.types.is_integer_dtype(valores.dtype):
+        # O texto mais longo de um inteiro é o do maior ou o do menor valor
+        return pd.Series([valores.min(), valores.max()] if len(valores) else [], dtype=object).map(str)
+    if pd.api.types.is_float_dtype(valores.dtype):
+        return pd.Series(pd.unique(np.asarray(valores))).map(str)
+    return pd.Series(valores).astype(str)
+
+def medir_texto(texto, estilo="Treeview"):
+    """Largura do texto na fonte do estilo (linhas ou cabeçalho), medida no Tk uma única vez por fonte e texto."""
+    descricao, fonte = fontes_tabela[estilo]
+    chave = (descricao, texto)
+    if chave not in larguras_medidas:
+        larguras_medidas[chave] = fonte.measure(texto)
+    return larguras_medidas[chave]
+
+def aplicar_larguras():
+    """Define na tabela só as larguras que mudaram desde a última vez."""
+    for col in colunas:
+        largura = larguras_colunas.get(col)
+        if largura is not None and larguras_aplicadas.get(col) != largura:
+            tabela.column(col, width=largura)
+            larguras_aplicadas[col] = largura
+
+def atualizar_larguras_linha(posicao, colunas_alteradas):
+    """Alarga as colunas em que o novo texto da linha editada passou da largura atual."""
+    if not larguras_colunas:
+        return
+    for col in colunas_alteradas:
+        texto = exibicao[col].iat[posicao] if col in COLUNAS_MOEDA else str(df[col].iat[posicao])
+        if len(texto) >= limiares_colunas.get(col, 0):
+            larguras_colunas[col] = max(larguras_colunas[col], medir_texto(texto) + MARGEM_COLUNA)
+    aplicar_larguras()
 
 def salvar_planilha():
     """Salva a planilha com os cálculos realizados."""
@@ -348,51 +1420,128 @@ def salvar_planilha():
         filetypes=[("Arquivos Excel", "*.xlsx")]
     )
     if save_path:
+        dados = df.copy()  # Cópia fixa: a contagem pode seguir na tela durante a gravação
+        executar_em_segundo_plano(
+            "Salvando planilha...",
+            lambda progresso: gravar_arquivo(save_path, progresso, lambda caminho: dados.to_excel(caminho, index=False)),
+            lambda _: messagebox.showinfo("Sucesso", "Planilha salva com sucesso!"),
+            "Erro ao salvar a planilha",
+            substitui_df=False,
+        )
+
+def executar_em_segundo_plano(titulo, trabalho, ao_concluir, mensagem_erro, ao_receber_parcial=None, substitui_df=True):
+    """Executa trabalho(progresso) em uma thread e entrega o resultado a ao_concluir no Tk.
+
+    A tarefa pode enviar resultados parciais em progresso(fracao, texto, parcial),
+    entregues a ao_receber_parcial também na thread do Tk. Com substitui_df (carga,
+    apuração, mescla), as contagens esperam a tarefa terminar; as gravações trabalham
+    sobre uma cópia fixa e deixam a contagem seguir.
+    """
+    global cancelamento, tarefa_substitui_df
+    if cancelamento is not None:
+        messagebox.showwarning("Aviso", "Aguarde a operação em andamento terminar ou cancele-a.")
+        return
+
+    evento = threading.Event()
+    cancelamento = evento
+    tarefa_substitui_df = substitui_df
+
+    def progresso(fracao, texto, parcial=None):
+        if evento.is_set():
+            raise TarefaCancelada()
+        if parcial is not None and ao_receber_parcial is not None:
+            fila_tarefas.put((evento, "parcial", parcial))
+        fila_tarefas.put((evento, "progresso", (fracao, texto)))
+
+    def executar():
         try:
-            df.to_excel(save_path, index=False)
-            messagebox.showinfo("Sucesso", "Planilha salva com sucesso!")
+            fila_tarefas.put((evento, "concluido", trabalho(progresso)))
+        except TarefaCancelada:
+            pass
         except Exception as e:
-            messagebox.showerror("Erro", f"Erro ao salvar a planilha: {e}")
+            fila_tarefas.put((evento, "erro", e))
+
+    rotulo_progresso.config(text=titulo)
+    barra_progresso.config(mode="determinate", value=0)
+    frame_progresso.pack(side="bottom", fill="x", padx=10, pady=5)
+    threading.Thread(target=executar, daemon=True).start()
+    root.after(INTERVALO_FILA_MS, lambda: verificar_fila_tarefas(ao_concluir, mensagem_erro, ao_receber_parcial))
+
+def verificar_fila_tarefas(ao_concluir, mensagem_erro, ao_receber_parcial=None):
+    """Processa, na thread do Tk, as mensagens enviadas pela tarefa em segundo plano."""
+    evento_atual = cancelamento
+    while True:
+        try:
+            evento, tipo, conteudo = fila_tarefas.get_nowait()
+        except queue.Empty:
+            break
+        if evento is not evento_atual:
+            continue  # Mensagem de uma tarefa já cancelada
+
+        if tipo == "progresso":
+            fracao, texto = conteudo
+            rotulo_progresso.config(text=texto)
+            if fracao is None:  # Etapa sem progresso mensurável
+                barra_progresso.config(mode="indeterminate")
+                barra_progresso.start(10)
+            else:
+                barra_progresso.stop()
+                barra_progresso.config(mode="determinate", value=fracao * 100)
+        elif tipo == "parcial":
+            ao_receber_parcial(conteudo)
+        else:
+            encerrar_tarefa()
+            if tipo == "concluido":
+                ao_concluir(conteudo)
+            else:
+                descartar_previa()
+                messagebox.showerror("Erro", f"{mensagem_erro}: {conteudo}")
+            return
+
+    if cancelamento is not None:
+        root.after(INTERVALO_FILA_MS, lambda: verificar_fila_tarefas(ao_concluir, mensagem_erro, ao_receber_parcial))
+
+def cancelar_tarefa():
+    """Cancela a operação em segundo plano; o resultado dela será descartado."""
+    if cancelamento is not None:
+        cancelamento.set()
+        encerrar_tarefa()
+        descartar_previa()
+
+def inventario_ocupado():
+    """Indica se a tarefa em andamento vai substituir df: até ela terminar, df não é alterado."""
+    return cancelamento is not None and tarefa_substitui_df
+
+def encerrar_tarefa():
+    """Esconde a barra de progresso e libera a execução de uma nova tarefa."""
+    global cancelamento
+    cancelamento = None
+    barra_progresso.stop()
+    frame_progresso.pack_forget()
 
 
 def buscar_por_codigo_endereco():
     """Filtra a tabela por Código de Produto ou Endereço."""
+    if df is None or indice_busca is None:
+        return  # Nada carregado ou carga ainda em andamento
     codigo = entry_busca_codigo.get().strip()
     endereco = entry_busca_endereco.get().strip()
     atualizar_tabela(filtro_codigo=codigo, filtro_endereco=endereco)
 
+def agendar_busca(event=None):
+    """Busca enquanto o usuário digita, aguardando uma pausa na digitação."""
+    global busca_agendada
+    if busca_agendada is not None:
+        root.after_cancel(busca_agendada)
+    busca_agendada = root.after(ATRASO_BUSCA_MS, executar_busca_agendada)
 
-# Configuração da interface Tkinter
-root = tk.Tk()
-root.title("GESTÃO DE ESTOQUES")
-root.geometry("1300x1000")
-
-# Título na parte superior
-titulo_principal = tk.Label(root, text="GESTÃO DE ESTOQUE - CONTAGEM", font=("Arial", 20, "bold"))
-titulo_principal.pack(side="top", pady=10)
-
-df = None  # DataFrame para armazenar os dados carregados
-
-# Menu de Navegação
-menu_principal = tk.Menu(root)
-root.config(menu=menu_principal)
-
-menu_navegacao = tk.Menu(menu_principal, tearoff=0)
-menu_principal.add_cascade(label="NAVEGAÇÃO", menu=menu_navegacao)
-menu_navegacao.add_command(label="APURAÇÃO", command=lambda: frame_resumo.pack_forget() or frame_dados.pack(fill="both", expand=True))
-menu_navegacao.add_command(label="RESUMO", command=lambda: frame_dados.pack_forget() or frame_resumo.pack(fill="both", expand=True))
+def executar_busca_agendada():
+    """Executa a busca agendada por agendar_busca."""
+    global busca_agendada
+    busca_agendada = None
+    buscar_por_codigo_endereco()
 
-# Botões superiores
-frame_botoes = tk.Frame(root)
-frame_botoes.pack(pady=10)
 
-btn_carregar = tk.Button(frame_botoes, text="CARREGAR PLANILHA", command=carregar_planilha)
-btn_carregar.grid(row=0, column=0, padx=10)
-
-btn_salvar = tk.Button(frame_botoes, text="SALVAR PLANILHA", command=salvar_planilha)
-btn_salvar.grid(row=1, column=0, padx=10)
-
-# Funções para os botões de filtro
 def filtrar_faltas():
     """Filtra itens com valores negativos na coluna VL.DIF."""
     df_filtrado = df[df["VL. DIF."] < 0]
@@ -403,136 +1552,311 @@ def filtrar_sobras():
     df_filtrado = df[df["VL. DIF."] > 0]
     atualizar_tabela_com_filtro(df_filtrado)
 
+def filtrar_recontagem():
+    """Filtra itens marcados para recontagem na mescla de contagens."""
+    if "RECONTAGEM" not in df.columns:
+        definir_visao([])
+        return
+    df_filtrado = df[df["RECONTAGEM"].astype(bool)]
+    atualizar_tabela_com_filtro(df_filtrado)
+
 def mostrar_todos():
     """Mostra todos os itens, removendo qualquer filtro."""
     atualizar_tabela()
 
 def atualizar_tabela_com_filtro(df_filtrado):
     """Atualiza a tabela com base em um DataFrame filtrado."""
-    for row in tabela.get_children():
-        tabela.delete(row)
-
-    for index, row in df_filtrado.iterrows():
-        valores_formatados = [
-            formatar_moeda(row["VL. UNT."]) if col == "VL. UNT." else
-            formatar_moeda(row["VL. ESTOQUE"]) if col == "VL. ESTOQUE" else
-            formatar_moeda(row["VL. DIF."]) if col == "VL. DIF." else
-            row[col] for col in colunas[1:]
-        ]
-        tabela.insert("", "end", values=(index, *valores_formatados))
-
-# Adicionando os botões ao canto superior direito
-frame_filtros = tk.Frame(root)
-frame_filtros.place(relx=0.92, rely=0.01)  # Posicionado no canto superior direito
-
-btn_faltas = tk.Button(
-    frame_filtros,
-    text="FALTAS",
-    font=("Arial", 10, "bold"),
-    bg="red",
-    fg="white",
-    command=filtrar_faltas
-)
-btn_faltas.pack(side="top", padx=10, pady=2)
-
-btn_sobras = tk.Button(
-    frame_filtros,
-    text="SOBRAS",
-    font=("Arial", 10, "bold"),
-    bg="green",
-    fg="white",
-    command=filtrar_sobras
-)
-btn_sobras.pack(side="top", padx=5, pady=2)
-
-btn_todos = tk.Button(
-    frame_filtros,
-    text="TODOS",
-    font=("Arial", 10, "bold"),
-    bg="darkgray",
-    fg="black",
-    command=mostrar_todos
-)
-btn_todos.pack(side="top", padx=5, pady=2)
+    definir_visao(df.index.get_indexer(df_filtrado.index))
+
+
+# Estado do aplicativo
+df = None  # DataFrame para armazenar os dados carregados
 
+# Tabela virtual: apenas as linhas visíveis existem como itens da Treeview
+LINHAS_BUFFER = 5  # Linhas extras renderizadas além da área visível
+visao = np.arange(0)  # Posições das linhas de df exibidas, na ordem da tabela
+ordem_atual = None  # Permutação das posições de df pela classificação atual (None: ordem original)
+chaves_ordenacao = []  # Critérios de classificação: (coluna, ascendente), do principal ao último
+cache_ordenacao = {}  # Coluna -> (permutação crescente, valores ordenados)
+ordem_desatualizada = False  # O cache mudou depois de ordem_atual ser calculada (contagens editadas)
+inicio_janela = 0  # Primeira posição de "visao" exibida na tabela
+itens_janela = []  # Itens da Treeview reaproveitados a cada renderização
+posicoes_janela = np.arange(0)  # Posições de df exibidas por cada item de "itens_janela"
+larguras_medidas = {}  # (fonte, texto) -> largura em pixels, medida no Tk uma única vez
+larguras_colunas = {}  # Coluna -> largura para o inventário atual, mantida a cada edição
+limiares_colunas = {}  # Coluna -> comprimento a partir do qual um texto editado é medido
+larguras_aplicadas = {}  # Coluna -> largura já definida na tabela
+dados_larguras = None  # (df, exibicao, fontes) para os quais as larguras foram calculadas
+fontes_tabela = {}  # Estilo ("Treeview" ou "Treeview.Heading") -> (descrição da fonte, Font) usada nas medições
+
+totais_resumo = None  # Totais do resumo, mantidos por delta a cada edição
+tabela_resumo = None  # Tabela da aba Resumo, criada uma única vez
+
+# Resumo por zona: os mesmos totais para cada prefixo do endereço (rua ou rua + prateleira)
+NOMES_ZONA = {1: "RUA", 2: "PRATELEIRA"}
+TITULOS_ZONAS = {  # Títulos curtos das colunas da tabela por zona
+    "ESTOQUE TOTAL": "ESTOQUE",
+    "TOTAL DE ITENS CONTADOS": "CONTADOS",
+    "TOTAL DE ITENS NEGATIVOS": "NEGATIVOS",
+    "TOTAL DE ITENS POSITIVOS": "POSITIVOS",
+    "TOTAL DIVERGÊNCIAS NEGATIVAS": "DIV. NEGATIVAS",
+    "TOTAL DIVERGÊNCIAS POSITIVAS": "DIV. POSITIVAS",
+    "% DIVERGÊNCIA ABSOLUTA": "% DIV. ABS.",
+}
+niveis_zona = NIVEIS_ZONA  # Níveis do endereço que formam a zona
+resumo_zonas = None  # (zona de cada linha de df, nomes das zonas, totais por zona), mantidos por delta
+zonas_alteradas = set()  # Zonas com totais alterados ainda não redesenhadas
+tabela_zonas = None  # Tabela dos totais por zona, criada uma única vez
+itens_zonas = []  # Itens da tabela por zona, na ordem das zonas de resumo_zonas
+exibicao = None  # Textos formatados das colunas de moeda, alinhados às linhas de df
+indice_busca = None  # Índices de prefixo de COD e ENDEREÇO, montados ao carregar o arquivo
+
+ATRASO_BUSCA_MS = 200  # Pausa na digitação antes de buscar automaticamente
+busca_agendada = None  # Busca pendente agendada com root.after
+
+INTERVALO_FILA_MS = 100  # Intervalo de leitura das mensagens da tarefa em segundo plano
+fila_tarefas = queue.Queue()  # Mensagens da thread de trabalho para a thread do Tk
+inventario_antes_da_previa = None  # Inventário a restaurar se uma carga com prévia não terminar
+cancelamento = None  # Evento de cancelamento da tarefa em execução (None se não houver)
+tarefa_substitui_df = False  # A tarefa em execução trabalha sobre uma cópia que substituirá df
+
+INTERVALO_LEITOR_MS = 250  # Intervalo de atualização da tela durante a contagem pelo leitor
+leituras_pendentes = set()  # Linhas lidas pelo leitor ainda não redesenhadas
+atualizacao_leitor = None  # Atualização da tela agendada com root.after
+
+ESTACAO = socket.gethostname()  # Identificação desta estação para o servidor de contagem
+INTERVALO_ENVIO_MS = 500  # Intervalo de envio das contagens ao servidor, em lote
+servidor = None  # Conexão com o servidor de contagem: {"url", "versao"} (None: contagem local)
+deltas_pendentes = []  # Incrementos de contagem desta estação ainda não enviados
+chaves_em_envio = {}  # (COD, ENDEREÇO, ocorrência) -> lotes em envio que alteram a chave
+envio_agendado = None  # Envio agendado com root.after
+fila_servidor = queue.Queue()  # Respostas e eventos do servidor para a thread do Tk
+
+banco = None  # Banco SQLite da sessão aberta: recebe cada contagem feita na tela (None: sem banco)
+caminho_banco = None  # Arquivo do banco da sessão aberta
+
+diario = None  # Arquivo do diário de edições da sessão atual
+edicoes_diario = 0  # Edições gravadas no diário desde o último snapshot
+geracao_diario = 0  # Muda a cada inventário aberto, para descartar compactações antigas
+trava_snapshot = threading.Lock()  # Impede gravações simultâneas do snapshot
+trava_compactacao = threading.Lock()  # Protege a fila de compactações e o diário pendente
+compactando = False  # Há uma compactação gravando o snapshot em segundo plano
+compactacao_pendente = None  # (dados, geração) do snapshot pedido enquanto outra compactação gravava
+
+janela_diagnostico = None  # Painel de diagnóstico (None: nunca aberto)
+tabela_diagnostico = None  # Etapas recentes exibidas no painel
+var_diagnostico = None  # Caixa que liga as medições
+rotulo_diagnostico = None  # Situação das medições e local do registro
+ultima_etapa_exibida = None  # Etapa mais recente já exibida no painel
+
+
+if __name__ == "__main__":
+    # Configuração da interface Tkinter
+    root = tk.Tk()
+    root.title("GESTÃO DE ESTOQUES")
+    root.geometry("1300x1000")
+
+    # Título na parte superior
+    titulo_principal = tk.Label(root, text="GESTÃO DE ESTOQUE - CONTAGEM", font=("Arial", 20, "bold"))
+    titulo_principal.pack(side="top", pady=10)
+
+    # Menu de Navegação
+    menu_principal = tk.Menu(root)
+    root.config(menu=menu_principal)
+
+    menu_navegacao = tk.Menu(menu_principal, tearoff=0)
+    menu_principal.add_cascade(label="NAVEGAÇÃO", menu=menu_navegacao)
+    menu_navegacao.add_command(label="APURAÇÃO", command=lambda: frame_resumo.pack_forget() or frame_dados.pack(fill="both", expand=True))
+    menu_navegacao.add_command(label="RESUMO", command=lambda: frame_dados.pack_forget() or frame_resumo.pack(fill="both", expand=True))
+    menu_navegacao.add_command(label="MEMÓRIA", command=relatorio_memoria)
+    menu_navegacao.add_command(label="DIAGNÓSTICO", command=abrir_diagnostico)
+    menu_navegacao.add_command(label="CONECTAR AO SERVIDOR", command=conectar_servidor)
+
+    # Botões superiores
+    frame_botoes = tk.Frame(root)
+    frame_botoes.pack(pady=10)
+
+    btn_carregar = tk.Button(frame_botoes, text="CARREGAR PLANILHA", command=carregar_planilha)
+    btn_carregar.grid(row=0, column=0, padx=10)
+
+    btn_salvar = tk.Button(frame_botoes, text="SALVAR PLANILHA", command=salvar_planilha)
+    btn_salvar.grid(row=1, column=0, padx=10)
+
+    # Adicionando os botões ao canto superior direito
+    frame_filtros = tk.Frame(root)
+    frame_filtros.place(relx=0.92, rely=0.01)  # Posicionado no canto superior direito
+
+    btn_faltas = tk.Button(
+        frame_filtros,
+        text="FALTAS",
+        font=("Arial", 10, "bold"),
+        bg="red",
+        fg="white",
+        command=filtrar_faltas
+    )
+    btn_faltas.pack(side="top", padx=10, pady=2)
+
+    btn_sobras = tk.Button(
+        frame_filtros,
+        text="SOBRAS",
+        font=("Arial", 10, "bold"),
+        bg="green",
+        fg="white",
+        command=filtrar_sobras
+    )
+    btn_sobras.pack(side="top", padx=5, pady=2)
+
+    btn_todos = tk.Button(
+        frame_filtros,
+        text="TODOS",
+        font=("Arial", 10, "bold"),
+        bg="darkgray",
+        fg="black",
+        command=mostrar_todos
+    )
+    btn_todos.pack(side="top", padx=5, pady=2)
+
+    btn_recontagem = tk.Button(
+        frame_filtros,
+        text="RECONTAGEM",
+        font=("Arial", 10, "bold"),
+        bg="gold",
+        fg="black",
+        command=filtrar_recontagem
+    )
+    btn_recontagem.pack(side="top", padx=5, pady=2)
 
-tk.Label(frame_botoes, text="BUSCAR POR CÓDIGO:").grid(row=1, column=3, padx=5)
-entry_busca_codigo = tk.Entry(frame_botoes)
-entry_busca_codigo.grid(row=0, column=3, padx=5)
 
-tk.Label(frame_botoes, text="BUSCAR POR ENDEREÇO:").grid(row=1, column=5, padx=5)
-entry_busca_endereco = tk.Entry(frame_botoes)
-entry_busca_endereco.grid(row=0, column=5, padx=5)
+    tk.Label(frame_botoes, text="BUSCAR POR CÓDIGO:").grid(row=1, column=3, padx=5)
+    entry_busca_codigo = tk.Entry(frame_botoes)
+    entry_busca_codigo.grid(row=0, column=3, padx=5)
+    entry_busca_codigo.bind("<KeyRelease>", agendar_busca)
 
-btn_buscar = tk.Button(frame_botoes, text="BUSCAR", command=buscar_por_codigo_endereco)
-btn_buscar.grid(row=0, column=6, padx=10)
+    tk.Label(frame_botoes, text="BUSCAR POR ENDEREÇO:").grid(row=1, column=5, padx=5)
+    entry_busca_endereco = tk.Entry(frame_botoes)
+    entry_busca_endereco.grid(row=0, column=5, padx=5)
+    entry_busca_endereco.bind("<KeyRelease>", agendar_busca)
 
-# Tabela - Aba Apuração
-frame_dados = tk.Frame(root)
-colunas = ["ÍNDICE", "COD", "PRODUTO", "VL. UNT.", "ENDEREÇO", "QTD", "CONTAGEM", "VL. ESTOQUE", "DIF. ETQ", "VL. DIF."]
-tabela = ttk.Treeview(frame_dados, columns=colunas, show="headings", height=15)
-tabela.pack(fill="both", expand=True)
+    btn_buscar = tk.Button(frame_botoes, text="BUSCAR", command=buscar_por_codigo_endereco)
+    btn_buscar.grid(row=0, column=6, padx=10)
 
-style = ttk.Style()
-style.configure("Treeview", rowheight=25)
+    # Tabela - Aba Apuração
+    frame_dados = tk.Frame(root)
+    colunas = ["ÍNDICE", "COD", "PRODUTO", "VL. UNT.", "ENDEREÇO", "QTD", "CONTAGEM", "VL. ESTOQUE", "DIF. ETQ", "VL. DIF."]
+    tabela = ttk.Treeview(frame_dados, columns=colunas, show="headings", height=15)
+    tabela.pack(fill="both", expand=True)
 
-for col in colunas:
-    if col == "PRODUTO":
-        tabela.heading(col, text=col.upper())
-        tabela.column(col, anchor="w")  # Alinhar texto à esquerda
-    else:
-        tabela.heading(col, text=col.upper())
-        tabela.column(col, anchor="center")
+    style = ttk.Style()
+    style.configure("Treeview", rowheight=25)
 
-scrollbar_y = ttk.Scrollbar(frame_dados, orient="vertical", command=tabela.yview)
-scrollbar_y.pack(side="right", fill="y")
-tabela.configure(yscrollcommand=scrollbar_y.set)
+    tabela.tag_configure("positivo", background="green", foreground="white")
+    tabela.tag_configure("igual", background="white", foreground="black")
+    tabela.tag_configure("negativo", background="red", foreground="white")
 
-tabela.bind("<Double-1>", editar_valor)  # Permitir edição ao clicar duas vezes
+    for col in colunas:
+        if col == "PRODUTO":
+            tabela.heading(col, text=col.upper())
+            tabela.column(col, anchor="w")  # Alinhar texto à esquerda
+        else:
+            tabela.heading(col, text=col.upper())
+            tabela.column(col, anchor="center")
 
-# Botões superiores (adicionando botão para salvar como JSON)
-btn_salvar_json = tk.Button(frame_botoes, text="SALVAR CONTAGEM", command=salvar_json)
-btn_salvar_json.grid(row=0, column=2, padx=10)
+    scrollbar_y = ttk.Scrollbar(frame_dados, orient="vertical", command=rolar_tabela)
+    scrollbar_y.pack(side="right", fill="y")
 
-# Menu de navegação (adicionando opção para salvar como JSON)
-menu_navegacao.add_command(label="SALVAR CONTAGEM", command=salvar_json)
+    tabela.bind("<Button-1>", clicar_cabecalho)  # Clique no cabeçalho classifica; Shift+clique adiciona critério
+    tabela.bind("<Double-1>", editar_valor)  # Permitir edição ao clicar duas vezes
+    tabela.bind("<MouseWheel>", rolar_com_mouse)
+    tabela.bind("<Button-4>", rolar_com_mouse)  # Roda do mouse no Linux
+    tabela.bind("<Button-5>", rolar_com_mouse)
+    tabela.bind("<Configure>", lambda e: df is not None and renderizar_janela())
 
-# Botão para apura inventário de estoque
-btn_apurar = tk.Button(frame_botoes, text="APURAR INVENTÁRIO", command=apurar_inventario)
-btn_apurar.grid(row=0, column=7, padx=10)
+    # Botões superiores (adicionando botão para salvar como JSON)
+    btn_salvar_json = tk.Button(frame_botoes, text="SALVAR CONTAGEM", command=salvar_json)
+    btn_salvar_json.grid(row=0, column=2, padx=10)
 
+    # Botão para mesclar as contagens parciais das equipes
+    btn_mesclar = tk.Button(frame_botoes, text="MESCLAR CONTAGENS", command=mesclar_contagens_parciais)
+    btn_mesclar.grid(row=1, column=2, padx=10)
 
-# Botão para carregar JSON
-btn_carregar_json = tk.Button(frame_botoes, text="CARREGAR JSON", command=carregar_json)
-btn_carregar_json.grid(row=1, column=7, padx=10)
+    # Menu de navegação (adicionando opção para salvar como JSON)
+    menu_navegacao.add_command(label="SALVAR CONTAGEM", command=salvar_json)
 
-# Botão ordem crescente
-btn_classificar_crescente = tk.Button(
-    frame_botoes, text="VL. DIF. -", command=lambda: classificar_vl_dif(ascendente=True)
-)
-btn_classificar_crescente.grid(row=0, column=9, padx=5)
+    # Botão para apura inventário de estoque
+    btn_apurar = tk.Button(frame_botoes, text="APURAR INVENTÁRIO", command=apurar_inventario)
+    btn_apurar.grid(row=0, column=7, padx=10)
 
-# Botão ordem decrescente
-btn_classificar_decrescente = tk.Button(
-    frame_botoes, text="VL. DIF. +", command=lambda: classificar_vl_dif(ascendente=False)
-)
-btn_classificar_decrescente.grid(row=1, column=9, padx=5)
+    # Campo do leitor de código de barras: cada leitura (COD ou COD*QTD + Enter) soma à contagem
+    tk.Label(frame_botoes, text="LEITOR (COD ou COD*QTD):").grid(row=1, column=8, padx=5)
+    entry_leitor = tk.Entry(frame_botoes)
+    entry_leitor.grid(row=0, column=8, padx=5)
+    entry_leitor.bind("<Return>", registrar_leitura)
+    root.bind("<F2>", lambda e: entry_leitor.focus_set())  # Atalho para voltar ao leitor
 
+    rotulo_leitor = tk.Label(root, text="", font=("Arial", 12, "bold"))
+    rotulo_leitor.pack(after=frame_botoes)
 
-# Aba Resumo
-frame_resumo = tk.Frame(root)
 
-# Inicializa na aba Apuração
-frame_dados.pack(fill="both", expand=True)
+    # Botão para carregar JSON
+    btn_carregar_json = tk.Button(frame_botoes, text="CARREGAR JSON", command=carregar_json)
+    btn_carregar_json.grid(row=1, column=7, padx=10)
 
-# Rodapé na parte inferior
-rodape = tk.Label(
-    root,
-    text="Created by: Ricardo Leffers Gomes\nIn: 01/01/2025\nVersion: 001",
-    font=("Arial", 10, "italic"),
-    anchor="w"
-)
-rodape.pack(side="bottom", pady=10)
+    # Botões para salvar e carregar a sessão em formato binário
+    btn_salvar_sessao = tk.Button(frame_botoes, text="SALVAR SESSÃO", command=salvar_sessao)
+    btn_salvar_sessao.grid(row=0, column=1, padx=10)
+
+    btn_carregar_sessao = tk.Button(frame_botoes, text="CARREGAR SESSÃO", command=carregar_sessao)
+    btn_carregar_sessao.grid(row=1, column=1, padx=10)
+
+    menu_navegacao.add_command(label="SALVAR SESSÃO", command=salvar_sessao)
+    menu_navegacao.add_command(label="CARREGAR SESSÃO", command=carregar_sessao)
+
+    # Botão ordem crescente
+    btn_classificar_crescente = tk.Button(
+        frame_botoes, text="VL. DIF. -", command=lambda: classificar_vl_dif(ascendente=True)
+    )
+    btn_classificar_crescente.grid(row=0, column=9, padx=5)
+
+    # Botão ordem decrescente
+    btn_classificar_decrescente = tk.Button(
+        frame_botoes, text="VL. DIF. +", command=lambda: classificar_vl_dif(ascendente=False)
+    )
+    btn_classificar_decrescente.grid(row=1, column=9, padx=5)
+
+
+    # Aba Resumo
+    frame_resumo = tk.Frame(root)
+    btn_zonas = tk.Button(frame_resumo, text=f"AGRUPAR POR {NOMES_ZONA[2]}", command=alternar_zonas)
+    btn_zonas.pack(side="bottom", pady=5)
+
+    # Inicializa na aba Apuração
+    frame_dados.pack(fill="both", expand=True)
+
+    # Progresso das operações em segundo plano (exibido apenas durante a operação)
+    frame_progresso = tk.Frame(root)
+    rotulo_progresso = tk.Label(frame_progresso, text="", anchor="w")
+    rotulo_progresso.pack(side="left", padx=5)
+    barra_progresso = ttk.Progressbar(frame_progresso, length=300, maximum=100)
+    barra_progresso.pack(side="left", fill="x", expand=True, padx=5)
+    btn_cancelar = tk.Button(frame_progresso, text="CANCELAR", command=cancelar_tarefa)
+    btn_cancelar.pack(side="left", padx=5)
+
+    # Rodapé na parte inferior
+    rodape = tk.Label(
+        root,
+        text="Created by: Ricardo Leffers Gomes\nIn: 01/01/2025\nVersion: 001",
+        font=("Arial", 10, "italic"),
+        anchor="w"
+    )
+    rodape.pack(side="bottom", pady=10)
+
+    # Medições de desempenho desde a abertura, para diagnosticar a carga
+    if os.environ.get(VARIAVEL_DIAGNOSTICO):
+        ligar_diagnostico()
+
+    # Recuperação da contagem após uma falha
+    root.protocol("WM_DELETE_WINDOW", fechar_aplicativo)
+    root.after(0, verificar_recuperacao)
 
-# Rodar o aplicativo
-root.mainloop()
+    # Rodar o aplicativo
+    root.mainloop()
@@ -0,0 +1,168 @@
+"""Apuração em lote de várias lojas, em paralelo, com resumo consolidado.
+
+Cada subpasta da pasta informada é uma loja: o arquivo chamado "estoque"
+(.xlsx, .xls, .json, .csv ou .feather) é o estoque e os demais arquivos
+são contagens, aplicadas em ordem alfabética.
+
+    python apuracao_lote.py pasta_lojas -o consolidado.xlsx
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from motor_inventario import POLITICAS_MESCLA, apurar_arquivos, gravar_resultado, linhas_resumo
+
+EXTENSOES_INVENTARIO = (".xlsx", ".xlsm", ".xls", ".json", ".csv", ".feather")
+TAMANHO_RANKING = 100  # Itens de maior divergência (em valor absoluto) no ranking consolidado
+
+def listar_lojas(pasta):
+    """Encontra, em cada subpasta, o arquivo de estoque e os arquivos de contagem da loja."""
+    lojas = []
+    for loja in sorted(os.listdir(pasta)):
+        pasta_loja = os.path.join(pasta, loja)
+        if not os.path.isdir(pasta_loja):
+            continue
+        arquivos = sorted(
+            nome for nome in os.listdir(pasta_loja)
+            if nome.lower().endswith(EXTENSOES_INVENTARIO) and not nome.startswith(("~$", "."))
+        )
+        estoque = [nome for nome in arquivos if os.path.splitext(nome)[0].lower() == "estoque"]
+        if len(estoque) != 1:
+            raise ValueError(f"A loja '{loja}' precisa de exatamente um arquivo 'estoque'.")
+        contagens = [os.path.join(pasta_loja, nome) for nome in arquivos if nome != estoque[0]]
+        lojas.append((loja, os.path.join(pasta_loja, estoque[0]), contagens))
+    return lojas
+
+def apurar_loja(loja, arquivo_estoque, arquivos_contagem, tamanho_ranking=TAMANHO_RANKING, save_path=None,
+                politica="substituir"):
+    """Apura uma loja (executado em um processo separado).
+
+    Devolve só o que o consolidado usa: os totais (com a quantidade de contagens sem item) e
+    os itens de maior divergência da loja; o inventário completo não volta ao processo principal.
+    """
+    dados, totais, nao_encontradas = apurar_arquivos(arquivo_estoque, arquivos_contagem, politica=politica)
+    if save_path:
+        gravar_resultado(dados, totais, save_path, nao_encontradas)
+    # O ranking geral está contido na união dos rankings de cada loja
+    maiores = dados.loc[dados["VL. DIF."].abs().nlargest(tamanho_ranking).index]
+    totais["contagens_sem_item"] = len(nao_encontradas)
+    return loja, totais, maiores.astype({"ENDEREÇO": str, "PRODUTO": str})
+
+def apurar_lojas(lojas, processos=None, tamanho_ranking=TAMANHO_RANKING, pasta_saida=None, ao_concluir_loja=None,
+                 politica="substituir"):
+    """Apura as lojas em paralelo, uma por processo, e consolida os resultados.
+
+    Retorna (totais por loja, ranking consolidado, erros por loja).
+    """
+    totais_por_loja, rankings, erros = {}, [], {}
+    with ProcessPoolExecutor(max_workers=processos) as executor:
+        tarefas = {}
+        for loja, estoque, contagens in lojas:
+            save_path = os.path.join(pasta_saida, f"{loja}.xlsx") if pasta_saida else None
+            tarefas[executor.submit(apurar_loja, loja, estoque, contagens, tamanho_ranking, save_path, politica)] = loja
+        for tarefa in as_completed(tarefas):
+            loja = tarefas[tarefa]
+            try:
+                loja, totais, maiores = tarefa.result()
+            except Exception as e:  # Uma loja com problema não interrompe as demais
+                erros[loja] = e
+            else:
+                totais_por_loja[loja] = totais
+                rankings.append(maiores.assign(LOJA=loja))
+            if ao_concluir_loja is not None:
+                ao_concluir_loja(loja, erros.get(loja))
+
+    totais_por_loja = dict(sorted(totais_por_loja.items()))
+    ranking = consolidar_ranking(rankings, tamanho_ranking)
+    return totais_por_loja, ranking, erros
+
+def consolidar_ranking(rankings, tamanho_ranking=TAMANHO_RANKING):
+    """Junta os rankings das lojas e mantém os itens de maior divergência absoluta."""
+    if not rankings:
+        return pd.DataFrame()
+    todos = pd.concat(rankings, ignore_index=True)
+    ranking = todos.loc[todos["VL. DIF."].abs().nlargest(tamanho_ranking).index]
+    return ranking[["LOJA"] + [col for col in ranking.columns if col != "LOJA"]].reset_index(drop=True)
+
+def somar_totais(totais_por_loja):
+    """Soma os totais de todas as lojas (o percentual é recalculado a partir das somas)."""
+    soma = {}
+    for totais in totais_por_loja.values():
+        for chave, valor in totais.items():
+            soma[chave] = soma.get(chave, 0) + valor
+    return soma
+
+def montar_resumo_consolidado(totais_por_loja):
+    """Monta a tabela do RESUMO: uma linha por loja e a linha TOTAL."""
+    linhas = [("TOTAL", somar_totais(totais_por_loja))] if totais_por_loja else []
+    registros = [
+        {"LOJA": loja, **dict(linhas_resumo(totais)), "CONTAGENS SEM ITEM": totais["contagens_sem_item"]}
+        for loja, totais in list(totais_por_loja.items()) + linhas
+    ]
+    return pd.DataFrame(registros)
+
+def gravar_consolidado(resumo, ranking, save_path):
+    """Grava o resumo consolidado e o ranking em .xlsx (abas separadas), .json ou .csv.
+
+    Em .json e .csv o ranking vai para um arquivo ao lado, com o sufixo ".ranking".
+    """
+    base, extensao = os.path.splitext(save_path)
+    extensao = extensao.lower()
+    if extensao == ".xlsx":
+        with pd.ExcelWriter(save_path) as planilhas:
+            resumo.to_excel(planilhas, sheet_name="RESUMO", index=False)
+            ranking.to_excel(planilhas, sheet_name="RANKING DIVERGÊNCIAS", index=False)
+    elif extensao == ".json":
+        resumo.to_json(save_path, orient="records", force_ascii=False, indent=4)
+        ranking.to_json(f"{base}.ranking.json", orient="records", force_ascii=False, indent=4)
+    elif extensao == ".csv":
+        resumo.to_csv(save_path, index=False)
+        ranking.to_csv(f"{base}.ranking.csv", index=False)
+    else:
+        raise ValueError(f"Formato de saída não suportado: {extensao or save_path}")
+
+def main(argumentos=None):
+    """Apura todas as lojas de uma pasta pela linha de comando."""
+    parser = argparse.ArgumentParser(description="Apura o inventário de várias lojas em paralelo.")
+    parser.add_argument("pasta", help="pasta com uma subpasta por loja (arquivo 'estoque' + arquivos de contagem)")
+    parser.add_argument("-o", "--saida", required=True, help="arquivo do resumo consolidado (.xlsx, .json ou .csv)")
+    parser.add_argument("-j", "--processos", type=int, default=None,
+                        help="processos em paralelo (padrão: um por núcleo do processador)")
+    parser.add_argument("--ranking", type=int, default=TAMANHO_RANKING,
+                        help=f"itens no ranking de divergências (padrão: {TAMANHO_RANKING})")
+    parser.add_argument("--pasta-lojas", help="grava também a apuração completa de cada loja nesta pasta")
+    parser.add_argument("--politica", choices=POLITICAS_MESCLA, default="substituir",
+                        help="item contado em mais de um arquivo da loja: somar ou manter o último (padrão)")
+    args = parser.parse_args(argumentos)
+
+    try:
+        lojas = listar_lojas(args.pasta)
+        if args.pasta_lojas:
+            os.makedirs(args.pasta_lojas, exist_ok=True)
+    except (OSError, ValueError) as e:
+        parser.exit(1, f"Erro: {e}\n")
+    if not lojas:
+        parser.exit(1, f"Erro: nenhuma loja encontrada em {args.pasta}\n")
+
+    def ao_concluir_loja(loja, erro):
+        print(f"{loja}: {'ERRO - ' + str(erro) if erro else 'apurada'}", flush=True)
+
+    totais_por_loja, ranking, erros = apurar_lojas(
+        lojas, args.processos, args.ranking, args.pasta_lojas, ao_concluir_loja, args.politica
+    )
+    try:
+        gravar_consolidado(montar_resumo_consolidado(totais_por_loja), ranking, args.saida)
+    except (OSError, ValueError) as e:
+        parser.exit(1, f"Erro: {e}\n")
+
+    print(f"{len(totais_por_loja)} de {len(lojas)} loja(s) apurada(s).")
+    if totais_por_loja:
+        for titulo, valor in linhas_resumo(somar_totais(totais_por_loja)):
+            print(f"{titulo}: {valor}")
+    if erros:
+        parser.exit(2, f"{len(erros)} loja(s) com erro: {', '.join(sorted(erros))}\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+"""Inventário em um banco SQLite indexado, para sessões maiores que a memória.
+
+O banco guarda uma linha por item, na ordem do arquivo de estoque (POSICAO), com índices
+em COD + ENDEREÇO, ENDEREÇO e VL. DIF. Filtros e buscas são consultas indexadas que trazem
+só as linhas encontradas, cada contagem é um UPDATE de uma linha e o resumo é calculado
+pelo próprio SQLite, sem carregar o inventário.
+
+    python banco_inventario.py importar estoque.xlsx contagem.sqlite
+    python banco_inventario.py contar contagem.sqlite 7891000100103*6
+    python banco_inventario.py resumo contagem.sqlite
+    python banco_inventario.py faltas contagem.sqlite -o faltas.csv
+"""
+import argparse
+import os
+import re
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from diagnostico import medido
+from motor_inventario import (
+    COLUNAS_OBRIGATORIAS, SEPARADORES_ENDERECO, TAMANHO_BLOCO, apurar, gravar_arquivo, gravar_resultado,
+    interpretar_leitura, ler_blocos_planilha, ler_inventario, linhas_resumo, montar_bloco, preparar_inventario,
+    sem_progresso, totais_do_vetor,
+)
+
+# Colunas gravadas no banco, na ordem da tabela itens (além de POSICAO)
+COLUNAS_BANCO = COLUNAS_OBRIGATORIAS + ["CONTAGEM", "VL. ESTOQUE", "DIF. ETQ", "VL. DIF.", "RECONTAGEM"]
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS itens (
+    POSICAO INTEGER PRIMARY KEY,
+    COD TEXT NOT NULL,
+    PRODUTO TEXT,
+    "VL. UNT." REAL,
+    "ENDEREÇO" TEXT,
+    QTD REAL,
+    CONTAGEM REAL,
+    "VL. ESTOQUE" REAL,
+    "DIF. ETQ" REAL,
+    "VL. DIF." REAL,
+    RECONTAGEM INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS itens_cod ON itens (COD, "ENDEREÇO");
+CREATE INDEX IF NOT EXISTS itens_endereco ON itens ("ENDEREÇO");
+CREATE INDEX IF NOT EXISTS itens_vl_dif ON itens ("VL. DIF.");
+
+-- Cada nível pesquisável do endereço: "A.2.1" gera "A.2.1", "2.1" e "1" (como na busca da tela)
+CREATE TABLE IF NOT EXISTS termos_endereco (
+    TERMO TEXT NOT NULL,
+    "ENDEREÇO" TEXT NOT NULL,
+    PRIMARY KEY (TERMO, "ENDEREÇO")
+) WITHOUT ROWID;
+"""
+
+INSERIR_ITEM = f"INSERT INTO itens VALUES ({', '.join(['?'] * (len(COLUNAS_BANCO) + 1))})"
+
+# Uma linha por UPDATE, recalculando as colunas da apuração como gravar_contagens
+ATUALIZAR_CONTAGEM = """
+UPDATE itens SET CONTAGEM = :contagem, "DIF. ETQ" = :contagem - QTD, "VL. ESTOQUE" = QTD * "VL. UNT.",
+    "VL. DIF." = (:contagem - QTD) * "VL. UNT.", RECONTAGEM = 0
+WHERE POSICAO = :posicao
+"""
+
+ATUALIZAR_LINHA = """
+UPDATE itens SET CONTAGEM = ?, "VL. ESTOQUE" = ?, "DIF. ETQ" = ?, "VL. DIF." = ?, RECONTAGEM = ?
+WHERE POSICAO = ?
+"""
+
+# Os mesmos totais de calcular_resumo (na ordem de CHAVES_RESUMO), em uma única passada pela tabela
+CONSULTA_RESUMO = """
+SELECT
+    COALESCE(SUM("VL. ESTOQUE"), 0),
+    COALESCE(SUM(CASE WHEN "DIF. ETQ" < 0 THEN "VL. DIF." END), 0),
+    COALESCE(SUM(CASE WHEN "DIF. ETQ" > 0 THEN "VL. DIF." END), 0),
+    COUNT(CASE WHEN CONTAGEM > 0 THEN 1 END),
+    COUNT(CASE WHEN "DIF. ETQ" < 0 THEN 1 END),
+    COUNT(CASE WHEN "DIF. ETQ" > 0 THEN 1 END)
+FROM itens
+"""
+
+def abrir_banco(caminho):
+    """Abre (ou cria) o banco do inventário em modo WAL, com as tabelas e os índices."""
+    conexao = sqlite3.connect(caminho)
+    conexao.execute("PRAGMA journal_mode=WAL")  # Leituras não bloqueiam as gravações das contagens
+    conexao.execute("PRAGMA synchronous=NORMAL")  # Em WAL, cada UPDATE continua atômico e bem mais rápido
+    conexao.executescript(ESQUEMA)
+    return conexao
+
+def importar_inventario(arquivo, caminho_banco, progresso=sem_progresso):
+    """Cria o banco a partir de um arquivo de estoque, bloco a bloco, já apurado.
+
+    Planilhas .xlsx e arquivos .csv são lidos em blocos de TAMANHO_BLOCO linhas: a memória
+    usada não depende do tamanho do catálogo. Retorna a quantidade de itens importados.
+    """
+    importadas = 0
+
+    def escrever(caminho):
+        nonlocal importadas
+        conexao = abrir_banco(caminho)
+        try:
+            for bloco, total in blocos_inventario(arquivo):
+                inserir_bloco(conexao, apurar(bloco), importadas)
+                importadas += len(bloco)
+                progresso(min(0.95, importadas / total) if total else None, f"{importadas} linhas importadas...")
+            conexao.commit()
+        finally:
+            conexao.close()
+
+    gravar_arquivo_banco(caminho_banco, progresso, escrever)
+    return importadas
+
+def gravar_arquivo_banco(caminho_banco, progresso, escrever):
+    """Como gravar_arquivo, descartando também o WAL deixado por um banco anterior no destino."""
+    def escrever_banco(temporario):
+        escrever(temporario)
+        for sufixo in ("-wal", "-shm"):
+            if os.path.exists(caminho_banco + sufixo):
+                os.remove(caminho_banco + sufixo)
+
+    gravar_arquivo(caminho_banco, progresso, escrever_banco)
+
+def blocos_inventario(arquivo):
+    """Gera o inventário em blocos (DataFrame, total de linhas), lendo em fluxo quando o formato permite."""
+    extensao = os.path.splitext(arquivo)[1].lower()
+    if extensao in (".xlsx", ".xlsm"):
+        yield from ler_blocos_planilha(arquivo)
+    elif extensao == ".csv":
+        for bloco in pd.read_csv(arquivo, dtype={"COD": str}, chunksize=TAMANHO_BLOCO):
+            for col in COLUNAS_OBRIGATORIAS:
+                if col not in bloco.columns:
+                    raise ValueError(f"Coluna obrigatória '{col}' não encontrada em {os.path.basename(arquivo)}.")
+            lidas = COLUNAS_OBRIGATORIAS + (["CONTAGEM"] if "CONTAGEM" in bloco.columns else [])
+            yield montar_bloco(bloco[lidas].reset_index(drop=True)), 0
+    else:
+        dados = ler_inventario(arquivo)  # .json, .xls e .feather não são lidos em partes
+        for inicio in range(0, max(len(dados), 1), TAMANHO_BLOCO):
+            yield dados.iloc[inicio:inicio + TAMANHO_BLOCO].reset_index(drop=True), len(dados)
+
+def gravar_banco(dados, caminho):
+    """Grava um inventário já carregado em um banco novo, com as colunas como estão."""
+    conexao = abrir_banco(caminho)
+    try:
+        for inicio in range(0, len(dados), TAMANHO_BLOCO):
+            inserir_bloco(conexao, dados.iloc[inicio:inicio + TAMANHO_BLOCO], inicio)
+        conexao.commit()
+    finally:
+        conexao.close()
+
+def inserir_bloco(conexao, dados, inicio):
+    """Insere as linhas de dados a partir da posição informada, com os termos de busca dos endereços."""
+    colunas = [np.arange(inicio, inicio + len(dados)).tolist()]
+    for col in COLUNAS_BANCO:
+        if col == "RECONTAGEM":
+            valores = dados[col].astype(bool).astype(int) if col in dados.columns else pd.Series(0, index=dados.index)
+        elif col in ("COD", "PRODUTO", "ENDEREÇO"):
+            valores = dados[col].astype(object).where(dados[col].notna(), None)
+        else:
+            valores = dados[col].astype(float)  # NaN é gravado como NULL
+        colunas.append(valores.tolist())
+    conexao.executemany(INSERIR_ITEM, zip(*colunas))
+    enderecos = dados["ENDEREÇO"].dropna().astype(str).unique()
+    conexao.executemany("INSERT OR IGNORE INTO termos_endereco VALUES (?, ?)", termos_endereco(enderecos))
+
+def termos_endereco(enderecos):
+    """Gera (termo, endereço) para cada nível pesquisável dos endereços."""
+    for endereco in enderecos:
+        termo = endereco.upper()
+        while termo:
+            yield termo, endereco
+            partes = re.split(SEPARADORES_ENDERECO, termo, maxsplit=1)
+            termo = partes[1] if len(partes) > 1 else ""
+
+@medido("carregar_banco")
+def ler_banco(caminho, progresso=sem_progresso):
+    """Carrega o banco inteiro para a interface, com os caches de exibição e busca."""
+    progresso(0.1, "Lendo o banco...")
+    conexao = sqlite3.connect(caminho)
+    try:
+        dados = consultar_itens(conexao).reset_index(drop=True)
+    finally:
+        conexao.close()
+    if not dados["RECONTAGEM"].any():
+        dados = dados.drop(columns="RECONTAGEM")  # Como um inventário que nunca passou por uma mescla
+    return preparar_inventario(dados, "no banco", progresso, manter_calculadas=True)
+
+def consultar_itens(conexao, condicao="1", parametros=(), limite=None):
+    """Lê as linhas que atendem à condição SQL, na ordem do estoque, indexadas pela POSICAO."""
+    consulta = f"SELECT * FROM itens WHERE {condicao} ORDER BY POSICAO"
+    if limite is not None:
+        consulta += f" LIMIT {int(limite)}"
+    dados = pd.read_sql_query(consulta, conexao, params=parametros, index_col="POSICAO")
+    dados.index.name = None
+    dados["COD"] = dados["COD"].astype(str)
+    dados["RECONTAGEM"] = dados["RECONTAGEM"].astype(bool)
+    return dados
+
+def consultar_faltas(conexao):
+    """Itens com VL. DIF. negativo (usa o índice de VL. DIF.)."""
+    return consultar_itens(conexao, '"VL. DIF." < 0')
+
+def consultar_sobras(conexao):
+    """Itens com VL. DIF. positivo (usa o índice de VL. DIF.)."""
+    return consultar_itens(conexao, '"VL. DIF." > 0')
+
+def consultar_recontagem(conexao):
+    """Itens marcados para recontagem na mescla de contagens."""
+    return consultar_itens(conexao, "RECONTAGEM = 1")
+
+def buscar_itens(conexao, codigo="", endereco=""):
+    """Itens cujo COD começa pelo código e com algum nível do endereço iniciado pelo endereço informado."""
+    condicoes, parametros = [], []
+    if codigo:
+        condicoes.append("COD >= ? AND COD < ?")
+        parametros += [codigo, codigo + chr(0x10FFFF)]
+    if endereco:
+        condicoes.append('"ENDEREÇO" IN (SELECT "ENDEREÇO" FROM termos_endereco WHERE TERMO >= ? AND TERMO < ?)')
+        parametros += [endereco.upper(), endereco.upper() + chr(0x10FFFF)]
+    return consultar_itens(conexao, " AND ".join(condicoes) or "1", parametros)
+
+def localizar_item(conexao, cod, endereco=None):
+    """Posição do item COD + ENDEREÇO (sem endereço, a primeira linha do código); None se não existir."""
+    if endereco is None:
+        linha = conexao.execute("SELECT MIN(POSICAO) FROM itens WHERE COD = ?", (cod,)).fetchone()
+    else:
+        linha = conexao.execute(
+            'SELECT MIN(POSICAO) FROM itens WHERE COD = ? AND "ENDEREÇO" = ?', (cod, endereco)
+        ).fetchone()
+    return linha[0]
+
+def gravar_contagens_banco(conexao, posicoes, contagens):
+    """Grava novas contagens, um UPDATE por linha, em uma única transação."""
+    with conexao:
+        conexao.executemany(ATUALIZAR_CONTAGEM, (
+            {"posicao": int(posicao), "contagem": float(contagem)}
+            for posicao, contagem in zip(np.atleast_1d(posicoes), np.atleast_1d(contagens))
+        ))
+
+def somar_contagem_banco(conexao, posicao, quantidade):
+    """Soma uma quantidade à contagem do item; retorna a nova contagem."""
+    atual = conexao.execute("SELECT COALESCE(CONTAGEM, 0) FROM itens WHERE POSICAO = ?", (posicao,)).fetchone()[0]
+    gravar_contagens_banco(conexao, posicao, atual + quantidade)
+    return atual + quantidade
+
+def gravar_linhas_banco(conexao, dados, posicoes):
+    """Copia para o banco a contagem, as colunas da apuração e a RECONTAGEM das linhas de dados informadas."""
+    posicoes = np.atleast_1d(posicoes)
+    colunas = [dados[col].to_numpy(dtype=float)[posicoes].tolist() for col in ["CONTAGEM", "VL. ESTOQUE", "DIF. ETQ", "VL. DIF."]]
+    if "RECONTAGEM" in dados.columns:
+        colunas.append(dados["RECONTAGEM"].to_numpy(dtype=bool)[posicoes].astype(int).tolist())
+    else:
+        colunas.append([0] * len(posicoes))
+    with conexao:
+        conexao.executemany(ATUALIZAR_LINHA, zip(*colunas, posicoes.tolist()))
+
+def apurar_banco(conexao):
+    """Calcula DIF. ETQ, VL. ESTOQUE e VL. DIF. de todos os itens, no próprio banco."""
+    with conexao:
+        conexao.execute(
+            'UPDATE itens SET "DIF. ETQ" = CONTAGEM - QTD, "VL. ESTOQUE" = QTD * "VL. UNT.", '
+            '"VL. DIF." = (CONTAGEM - QTD) * "VL. UNT."'
+        )
+
+def resumo_banco(conexao):
+    """Calcula os totais do resumo no banco, sem carregar os itens."""
+    return totais_do_vetor(conexao.execute(CONSULTA_RESUMO).fetchone())
+
+def main(argumentos=None):
+    """Cria e consulta o banco do inventário pela linha de comando."""
+    parser = argparse.ArgumentParser(description="Inventário em um banco SQLite indexado.")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    importar = comandos.add_parser("importar", help="cria o banco a partir de um arquivo de estoque, já apurado")
+    importar.add_argument("estoque", help="arquivo de estoque (.xlsx, .xls, .json, .csv ou sessão .feather)")
+    importar.add_argument("banco", help="banco a criar (.sqlite)")
+
+    resumo = comandos.add_parser("resumo", help="mostra os totais do resumo")
+    resumo.add_argument("banco")
+
+    for nome, ajuda in [("faltas", "itens com VL. DIF. negativo"), ("sobras", "itens com VL. DIF. positivo"),
+                        ("recontagem", "itens marcados para recontagem"), ("buscar", "busca por código e endereço")]:
+        consulta = comandos.add_parser(nome, help=ajuda)
+        consulta.add_argument("banco")
+        if nome == "buscar":
+            consulta.add_argument("--codigo", default="", help="início do código")
+            consulta.add_argument("--endereco", default="", help="início de qualquer nível do endereço")
+        consulta.add_argument("-o", "--saida", help="grava os itens encontrados em .csv (padrão: exibe na tela)")
+
+    contar = comandos.add_parser("contar", help="soma uma leitura (COD ou COD*QTD) à contagem do item")
+    contar.add_argument("banco")
+    contar.add_argument("leitura")
+    contar.add_argument("--endereco", help="endereço do item (padrão: a primeira linha do código)")
+
+    exportar = comandos.add_parser("exportar", help="grava o inventário apurado e o resumo (.xlsx, .json ou .csv)")
+    exportar.add_argument("banco")
+    exportar.add_argument("saida")
+    args = parser.parse_args(argumentos)
+
+    try:
+        if args.comando == "importar":
+            print(f"{importar_inventario(args.estoque, args.banco)} itens importados em {args.banco}.")
+            return
+        if not os.path.exists(args.banco):
+            raise OSError(f"Banco não encontrado: {args.banco}")
+        conexao = abrir_banco(args.banco)
+        try:
+            if args.comando == "resumo":
+                for titulo, valor in linhas_resumo(resumo_banco(conexao)):
+                    print(f"{titulo}: {valor}")
+            elif args.comando == "contar":
+                cod, quantidade = interpretar_leitura(args.leitura)
+                posicao = localizar_item(conexao, cod, args.endereco)
+                if posicao is None:
+                    raise ValueError(f"Item não encontrado: {cod}")
+                print(f"{cod}: contagem {somar_contagem_banco(conexao, posicao, quantidade):g}")
+            elif args.comando == "exportar":
+                dados = consultar_itens(conexao).reset_index(drop=True)
+                gravar_resultado(dados, resumo_banco(conexao), args.saida)
+            else:
+                consultas = {"faltas": consultar_faltas, "sobras": consultar_sobras, "recontagem": consultar_recontagem}
+                if args.comando == "buscar":
+                    itens = buscar_itens(conexao, args.codigo, args.endereco)
+                else:
+                    itens = consultas[args.comando](conexao)
+                if args.saida:
+                    itens.to_csv(args.saida, index=False)
+                    print(f"{len(itens)} item(ns) gravado(s) em {args.saida}.")
+                else:
+                    print(itens.to_string(index=False, max_rows=50))
+                    print(f"{len(itens)} item(ns).")
+        finally:
+            conexao.close()
+    except (OSError, ValueError, sqlite3.Error) as e:
+        parser.exit(1, f"Erro: {e}\n")
+
+if __name__ == "__main__":
+    main()
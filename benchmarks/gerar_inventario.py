@@ -0,0 +1,120 @@
+"""Gera inventários sintéticos, reproduzíveis, para medir o desempenho do aplicativo.
+
+Os itens imitam um estoque real: códigos de barras (alguns com zeros à esquerda), o mesmo
+código em mais de um endereço, endereços rua.prateleira.posição, nomes de produto que se
+repetem entre tamanhos, preços com muitos itens baratos e poucos caros, e uma parte dos
+itens já contada, com algumas divergências.
+
+    python benchmarks/gerar_inventario.py 100000 -o estoque_100k.xlsx
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from motor_inventario import gravar_sessao
+
+TIPOS = ["ARROZ", "FEIJÃO", "AÇÚCAR", "CAFÉ", "LEITE", "ÓLEO", "SABÃO", "DETERGENTE", "BISCOITO", "MACARRÃO",
+         "MOLHO", "FARINHA", "SUCO", "ÁGUA", "SHAMPOO", "PAPEL", "ESPONJA", "CREME", "IOGURTE", "ACHOCOLATADO"]
+MARCAS = ["BOM PREÇO", "DA CASA", "SUPREMO", "NOBRE", "VITÓRIA", "PRIMOR", "ESTRELA", "TRADIÇÃO", "SOL", "ALIANÇA"]
+TAMANHOS = ["200G", "500G", "1KG", "2KG", "5KG", "350ML", "1L", "2L", "UN", "CX 12"]
+FRACAO_REPETIDOS = 0.1  # Itens cujo código também está em outro endereço
+FRACAO_ZEROS = 0.2  # Códigos EAN-13 com zero à esquerda (precisam ser lidos como texto)
+
+def gerar_inventario(linhas, contados=0.3, semente=0):
+    """Gera um inventário com as colunas obrigatórias e CONTAGEM (zero nos itens não contados)."""
+    rng = np.random.default_rng(semente)
+
+    # Códigos: EAN-13, parte com zero à esquerda, e parte repetida em outro endereço
+    distintos = max(1, int(linhas * (1 - FRACAO_REPETIDOS)))
+    codigos = rng.choice(10 ** 12, size=distintos, replace=False) + 10 ** 12 * rng.integers(1, 10, size=distintos)
+    codigos = np.where(rng.random(distintos) < FRACAO_ZEROS, codigos % 10 ** 12, codigos)
+    escolhidos = np.concatenate([np.arange(distintos), rng.integers(0, distintos, size=linhas - distintos)])
+    cod = pd.Series(codigos[escolhidos]).map("{:013d}".format)
+
+    # Produto por código distinto: tipo + marca + tamanho (os nomes se repetem entre códigos)
+    produto = pd.Series(
+        np.array(TIPOS)[rng.integers(0, len(TIPOS), distintos)].astype(object) + " "
+        + np.array(MARCAS)[rng.integers(0, len(MARCAS), distintos)].astype(object) + " "
+        + np.array(TAMANHOS)[rng.integers(0, len(TAMANHOS), distintos)].astype(object)
+    )[escolhidos].reset_index(drop=True)
+
+    # Preços log-normais: muitos itens baratos, poucos caros
+    vl_unt = np.round(rng.lognormal(mean=2.5, sigma=1.0, size=distintos), 2)[escolhidos]
+
+    # Endereços rua.prateleira.posição, com ruas de tamanhos diferentes
+    ruas = max(1, int(np.sqrt(linhas) / 4))
+    pesos = 1 / np.sqrt(np.arange(1, ruas + 1))  # As primeiras ruas concentram mais itens
+    rua = rng.choice(ruas, size=linhas, p=pesos / pesos.sum())
+    nomes_ruas = np.array([nome_rua(i) for i in range(ruas)], dtype=object)
+    endereco = (pd.Series(nomes_ruas[rua]) + "." + pd.Series(rng.integers(1, 21, linhas)).astype(str)
+                + "." + pd.Series(rng.integers(1, 11, linhas)).astype(str))
+
+    qtd = rng.poisson(rng.choice([2, 10, 40], size=linhas, p=[0.5, 0.35, 0.15]))
+    # Itens contados: a maioria confere, o restante diverge um pouco para mais ou para menos
+    contagem = np.zeros(linhas, dtype=np.int64)
+    foi_contado = rng.random(linhas) < contados
+    divergencia = np.where(rng.random(linhas) < 0.25, rng.integers(-3, 4, linhas), 0)
+    contagem[foi_contado] = np.maximum(qtd + divergencia, 0)[foi_contado]
+
+    return pd.DataFrame({
+        "COD": cod,
+        "PRODUTO": produto,
+        "VL. UNT.": vl_unt,
+        "ENDEREÇO": endereco,
+        "QTD": qtd,
+        "CONTAGEM": contagem,
+    })
+
+def nome_rua(indice):
+    """Nome da rua no estilo das colunas de planilha: A, B, ..., Z, AA, AB, ..."""
+    nome = ""
+    indice += 1
+    while indice:
+        indice, resto = divmod(indice - 1, 26)
+        nome = chr(ord("A") + resto) + nome
+    return nome
+
+def gravar_inventario(dados, caminho):
+    """Grava o inventário no formato da extensão (.xlsx, .csv, .json ou sessão .feather)."""
+    extensao = os.path.splitext(caminho)[1].lower()
+    if extensao == ".xlsx":
+        # Em modo de gravação em fluxo, milhões de linhas não ficam em memória como células
+        livro = openpyxl.Workbook(write_only=True)
+        planilha = livro.create_sheet()
+        planilha.append(list(dados.columns))
+        for linha in dados.itertuples(index=False, name=None):
+            planilha.append(linha)
+        livro.save(caminho)
+    elif extensao == ".csv":
+        dados.to_csv(caminho, index=False)
+    elif extensao == ".json":
+        dados.to_json(caminho, orient="records", force_ascii=False)
+    elif extensao == ".feather":
+        gravar_sessao(dados, caminho)
+    else:
+        raise ValueError(f"Formato não suportado: {extensao or caminho}")
+
+def main(argumentos=None):
+    """Gera um inventário sintético pela linha de comando."""
+    parser = argparse.ArgumentParser(description="Gera um inventário sintético para medições de desempenho.")
+    parser.add_argument("linhas", type=int, help="quantidade de itens")
+    parser.add_argument("-o", "--saida", required=True, help="arquivo gerado (.xlsx, .csv, .json ou .feather)")
+    parser.add_argument("--contados", type=float, default=0.3, help="fração dos itens já contados (padrão: 0,3)")
+    parser.add_argument("--semente", type=int, default=0, help="semente do gerador (padrão: 0)")
+    args = parser.parse_args(argumentos)
+
+    dados = gerar_inventario(args.linhas, args.contados, args.semente)
+    try:
+        gravar_inventario(dados, args.saida)
+    except (OSError, ValueError) as e:
+        parser.exit(1, f"Erro: {e}\n")
+    print(f"{len(dados)} itens gravados em {args.saida}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""Mede o tempo e o pico de memória de cada etapa do aplicativo em inventários sintéticos.
+
+As etapas são as mesmas funções usadas pela interface (ContagemEstoque.py), executadas sem
+janela: a Treeview, a fonte e o estilo do Tk são simulados e contam as chamadas que, na
+tela, seriam idas ao Tk. Com --tk, usa o Tk de verdade (em servidores sem tela, rode com
+um display virtual: xvfb-run python benchmarks/medir_desempenho.py --tk).
+
+    python benchmarks/medir_desempenho.py --tamanhos 1000 10000 100000
+    python benchmarks/medir_desempenho.py --comparar benchmarks/resultados/anterior.json
+
+Os inventários gerados ficam em benchmarks/dados e são reaproveitados entre execuções.
+O resultado é gravado em .json (para comparações futuras) e em um relatório .md.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+PASTA_BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(PASTA_BENCHMARKS))
+
+from gerar_inventario import gerar_inventario, gravar_inventario
+from motor_inventario import gravar_arquivo, ler_planilha_em_fluxo, sem_progresso
+
+PASTA_DADOS = os.path.join(PASTA_BENCHMARKS, "dados")
+PASTA_RESULTADOS = os.path.join(PASTA_BENCHMARKS, "resultados")
+TAMANHOS_PADRAO = [1000, 10000, 100000]
+ETAPAS = [
+    "carregar_planilha", "apurar_inventario", "atualizar_tabela", "redimensionar_colunas",
+    "formatar_coluna_vl_dif", "atualizar_resumo", "salvar_planilha",
+]
+# As mesmas colunas da tabela da aba Apuração
+COLUNAS_TABELA = ["ÍNDICE", "COD", "PRODUTO", "VL. UNT.", "ENDEREÇO", "QTD", "CONTAGEM", "VL. ESTOQUE", "DIF. ETQ", "VL. DIF."]
+TOLERANCIA = 0.2  # Aumento de tempo aceito antes de apontar uma regressão (20%)
+DIFERENCA_MINIMA_S = 0.01  # Diferenças menores que esta são ruído de medição
+
+chamadas_tk = {"total": 0}  # Chamadas feitas à Treeview e à fonte simuladas
+
+class TabelaSimulada:
+    """Treeview sem tela: guarda os itens e os valores e conta as chamadas."""
+
+    def __init__(self, master=None, columns=(), height=10, **opcoes):
+        self.colunas = list(columns)
+        self.altura = height
+        self.itens = {}
+        self.larguras = {col: 200 for col in self.colunas}
+        self.sequencia = 0
+
+    def insert(self, parent, index, values=(), tags=(), **opcoes):
+        chamadas_tk["total"] += 1
+        self.sequencia += 1
+        item = f"I{self.sequencia}"
+        self.itens[item] = {"values": tuple(values), "tags": tags}
+        return item
+
+    def delete(self, *itens):
+        chamadas_tk["total"] += 1
+        for item in itens:
+            del self.itens[item]
+
+    def item(self, item, option=None, **opcoes):
+        chamadas_tk["total"] += 1
+        if opcoes:
+            self.itens[item].update(opcoes)
+            return None
+        return self.itens[item][option] if option else dict(self.itens[item])
+
+    def get_children(self, item=""):
+        chamadas_tk["total"] += 1
+        return tuple(self.itens)
+
+    def column(self, col, option=None, **opcoes):
+        chamadas_tk["total"] += 1
+        if "width" in opcoes:
+            self.larguras[col] = opcoes["width"]
+        return self.larguras.get(col, 200) if option == "width" else None
+
+    def heading(self, col, **opcoes):
+        chamadas_tk["total"] += 1
+
+    def winfo_height(self):
+        return self.altura * 25  # Como uma tabela já desenhada, com linhas de 25 pixels
+
+    def cget(self, opcao):
+        return self.altura
+
+    def pack(self, **opcoes):
+        pass
+
+    def tag_configure(self, *args, **opcoes):
+        pass
+
+    def yview_moveto(self, fracao):
+        pass
+
+class FonteSimulada:
+    """Fonte sem tela: largura aproximada de 7 pixels por caractere."""
+
+    def __init__(self, **opcoes):
+        pass
+
+    def measure(self, texto):
+        chamadas_tk["total"] += 1
+        return 7 * len(str(texto))
+
+class EstiloSimulado:
+    """ttk.Style sem tela."""
+
+    def configure(self, *args, **opcoes):
+        pass
+
+    def lookup(self, *args, **opcoes):
+        return ""
+
+class BarraSimulada:
+    """Barra de rolagem sem tela."""
+
+    def set(self, inicio, fim):
+        pass
+
+def preparar_aplicativo(usar_tk=False):
+    """Importa a interface sem abrir a janela e liga a ela uma tabela simulada (ou a do Tk)."""
+    import ContagemEstoque as app
+
+    if usar_tk:
+        import tkinter as tk
+        from tkinter import ttk
+        app.root = tk.Tk()
+        app.root.geometry("1300x1000")
+        app.tabela = ttk.Treeview(app.root, columns=COLUNAS_TABELA, show="headings", height=30)
+        app.tabela.pack(fill="both", expand=True)
+        app.scrollbar_y = ttk.Scrollbar(app.root)
+        app.frame_resumo = tk.Frame(app.root)
+        app.root.update()
+    else:
+        app.Font = FonteSimulada
+        app.ttk = SimpleNamespace(Treeview=TabelaSimulada, Style=EstiloSimulado)
+        app.tabela = TabelaSimulada(columns=COLUNAS_TABELA, height=30)
+        app.scrollbar_y = BarraSimulada()
+        app.frame_resumo = None
+    app.colunas = COLUNAS_TABELA
+    return app
+
+def arquivo_inventario(linhas, semente=0):
+    """Gera (ou reaproveita) a planilha sintética com a quantidade de linhas informada."""
+    caminho = os.path.join(PASTA_DADOS, f"estoque_{linhas}_{semente}.xlsx")
+    if not os.path.exists(caminho):
+        os.makedirs(PASTA_DADOS, exist_ok=True)
+        print(f"Gerando {os.path.basename(caminho)}...", flush=True)
+        gravar_inventario(gerar_inventario(linhas, semente=semente), caminho)
+    return caminho
+
+def executar_etapas(app, arquivo, etapas, medir):
+    """Executa as etapas na ordem da interface; medir(nome, função) executa e mede cada uma."""
+    def carregar():
+        app.df, app.exibicao, app.indice_busca = ler_planilha_em_fluxo(arquivo, sem_progresso)
+        app.totais_resumo = None
+        app.redefinir_ordenacao()
+
+    def apurar():
+        app.df, app.exibicao = app.calcular_apuracao(app.df.copy(), sem_progresso)
+        app.cache_ordenacao.clear()
+
+    def redimensionar():
+        app.dados_larguras = None  # Recalcula, em vez de reaproveitar as larguras de atualizar_tabela
+        app.redimensionar_colunas()
+
+    def salvar():
+        dados = app.df.copy()  # Como em salvar_planilha: cópia fixa gravada em segundo plano
+        saida = os.path.join(PASTA_DADOS, "saida.xlsx")
+        gravar_arquivo(saida, sem_progresso, lambda caminho: dados.to_excel(caminho, index=False))
+        os.remove(saida)
+
+    funcoes = {
+        "carregar_planilha": carregar,
+        "apurar_inventario": apurar,
+        "atualizar_tabela": app.atualizar_tabela,
+        "redimensionar_colunas": redimensionar,
+        "formatar_coluna_vl_dif": app.formatar_coluna_vl_dif,
+        "atualizar_resumo": app.atualizar_resumo,
+        "salvar_planilha": salvar,
+    }
+    carregar_sempre = "carregar_planilha" not in etapas
+    if carregar_sempre:
+        carregar()  # As outras etapas precisam do inventário carregado
+    for nome in ETAPAS:
+        if nome in etapas:
+            medir(nome, funcoes[nome])
+
+def medir_tamanho(app, linhas, etapas, repeticoes):
+    """Mede as etapas em um inventário: o menor tempo entre as repetições e o pico de memória."""
+    arquivo = arquivo_inventario(linhas)
+    resultados = {nome: {"segundos": float("inf")} for nome in etapas}
+
+    def medir_tempo(nome, funcao):
+        chamadas = chamadas_tk["total"]
+        inicio = time.perf_counter()
+        funcao()
+        resultados[nome]["segundos"] = min(resultados[nome]["segundos"], time.perf_counter() - inicio)
+        resultados[nome]["chamadas_tk"] = chamadas_tk["total"] - chamadas
+
+    def medir_memoria(nome, funcao):
+        tracemalloc.reset_peak()
+        em_uso = tracemalloc.get_traced_memory()[0]
+        funcao()
+        resultados[nome]["pico_mb"] = (tracemalloc.get_traced_memory()[1] - em_uso) / 1024 ** 2
+
+    for _ in range(repeticoes):
+        executar_etapas(app, arquivo, etapas, medir_tempo)
+    # Memória em uma rodada separada: o rastreamento deixa o código mais lento
+    tracemalloc.start()
+    try:
+        executar_etapas(app, arquivo, etapas, medir_memoria)
+    finally:
+        tracemalloc.stop()
+    return resultados
+
+def ambiente(usar_tk):
+    """Versões e máquina em que as medições foram feitas."""
+    return {
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "sistema": platform.platform(),
+        "processador": platform.processor() or platform.machine(),
+        "tabela": "tk" if usar_tk else "simulada",
+    }
+
+def comparar(atual, anterior, tolerancia=TOLERANCIA):
+    """Compara os tempos com os de uma medição anterior; retorna {(linhas, etapa): (antes, variação, situação)}."""
+    comparacao = {}
+    for linhas, etapas in atual["resultados"].items():
+        for nome, medida in etapas.items():
+            antes = anterior.get("resultados", {}).get(linhas, {}).get(nome)
+            if antes is None:
+                continue
+            agora, tempo_antes = medida["segundos"], antes["segundos"]
+            variacao = agora / tempo_antes - 1 if tempo_antes else 0.0
+            situacao = ""
+            if abs(agora - tempo_antes) >= DIFERENCA_MINIMA_S:
+                if variacao > tolerancia:
+                    situacao = "REGRESSÃO"
+                elif variacao < -tolerancia:
+                    situacao = "melhora"
+            comparacao[(linhas, nome)] = (tempo_antes, variacao, situacao)
+    return comparacao
+
+def montar_relatorio(resultado, comparacao=None):
+    """Monta o relatório em Markdown: uma tabela por tamanho de inventário."""
+    linhas_relatorio = ["# Desempenho por etapa", ""]
+    linhas_relatorio += [f"- {chave}: {valor}" for chave, valor in resultado["ambiente"].items()]
+    for linhas, etapas in resultado["resultados"].items():
+        linhas_relatorio += ["", f"## {int(linhas):,} linhas".replace(",", "."), ""]
+        cabecalho = "| Etapa | Tempo (s) | Pico de memória (MB) | Chamadas ao Tk |"
+        separador = "|---|---:|---:|---:|"
+        if comparacao is not None:
+            cabecalho += " Antes (s) | Variação | |"
+            separador += "---:|---:|---|"
+        linhas_relatorio += [cabecalho, separador]
+        for nome, medida in etapas.items():
+            linha = (f"| {nome} | {medida['segundos']:.4f} | {medida.get('pico_mb', 0):.1f} | "
+                     f"{medida.get('chamadas_tk', 0)} |")
+            if comparacao is not None:
+                antes, variacao, situacao = comparacao.get((linhas, nome), (None, None, ""))
+                linha += " - | - | |" if antes is None else f" {antes:.4f} | {variacao:+.0%} | {situacao} |"
+            linhas_relatorio.append(linha)
+    return "\n".join(linhas_relatorio) + "\n"
+
+def main(argumentos=None):
+    """Mede as etapas pela linha de comando e grava o resultado e o relatório."""
+    parser = argparse.ArgumentParser(description="Mede o desempenho das etapas do aplicativo.")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=TAMANHOS_PADRAO,
+                        help="quantidades de linhas dos inventários (padrão: 1000 10000 100000)")
+    parser.add_argument("--etapas", nargs="+", choices=ETAPAS, default=ETAPAS, help="etapas medidas (padrão: todas)")
+    parser.add_argument("--repeticoes", type=int, default=3, help="repetições de cada medição de tempo (padrão: 3)")
+    parser.add_argument("--tk", action="store_true", help="usa a Treeview do Tk em vez da simulada (requer um display)")
+    parser.add_argument("--comparar", help="resultado .json anterior para comparar os tempos")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA,
+                        help="aumento de tempo aceito antes de apontar regressão (padrão: 0,2 = 20%%)")
+    parser.add_argument("-o", "--saida", help="arquivo .json do resultado (padrão: benchmarks/resultados/AAAAMMDD_HHMMSS.json)")
+    args = parser.parse_args(argumentos)
+
+    app = preparar_aplicativo(args.tk)
+    resultado = {"ambiente": ambiente(args.tk), "resultados": {}}
+    for linhas in args.tamanhos:
+        print(f"Medindo {linhas} linhas...", flush=True)
+        resultado["resultados"][str(linhas)] = medir_tamanho(app, linhas, args.etapas, max(1, args.repeticoes))
+
+    comparacao = None
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as arquivo:
+            comparacao = comparar(resultado, json.load(arquivo), args.tolerancia)
+
+    saida = args.saida or os.path.join(PASTA_RESULTADOS, datetime.now().strftime("%Y%m%d_%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+    with open(saida, "w", encoding="utf-8") as arquivo:
+        json.dump(resultado, arquivo, ensure_ascii=False, indent=4)
+    relatorio = montar_relatorio(resultado, comparacao)
+    with open(os.path.splitext(saida)[0] + ".md", "w", encoding="utf-8") as arquivo:
+        arquivo.write(relatorio)
+    print(relatorio)
+    print(f"Resultado gravado em {saida}.")
+
+    if comparacao and any(situacao == "REGRESSÃO" for _, _, situacao in comparacao.values()):
+        parser.exit(2, "Há etapas mais lentas que na medição anterior.\n")
+
+if __name__ == "__main__":
+    main()
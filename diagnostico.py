@@ -0,0 +1,191 @@
+"""Diagnóstico de desempenho: tempo, linhas e memória de cada etapa do aplicativo.
+
+Desligado por padrão. Ligado (ativar), cada etapa medida com etapa() ou @medido grava uma
+linha JSON no registro, que é rotacionado ao passar de LIMITE_REGISTRO, e fica nas etapas
+recentes exibidas no painel. Os tempos são medidos sem rastreamento: a variação de memória
+vem da memória residente do processo (psutil, se instalado, ou /proc no Linux), que é
+compartilhada pelas etapas simultâneas em threads diferentes.
+
+perfilar_proxima() executa a próxima etapa sob o cProfile e o tracemalloc, que também mede o
+pico de memória, e grava o perfil (.prof, para pstats ou snakeviz) e um relatório em texto
+com as funções mais demoradas. O tempo dessa etapa inclui o custo das duas ferramentas.
+"""
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+LIMITE_REGISTRO = 1024 ** 2  # Tamanho do registro antes de rotacioná-lo (1 MB)
+LIMITE_RECENTES = 200  # Etapas mantidas em memória para o painel
+FUNCOES_RELATORIO = 40  # Funções listadas no relatório em texto do perfil
+
+ativo = False  # Medições ligadas
+arquivo_registro = None  # Registro JSON lines (None: etapas só em memória)
+pasta_perfis = None  # Pasta dos perfis do cProfile
+perfil_pendente = False  # A próxima etapa será executada sob o cProfile
+recentes = deque(maxlen=LIMITE_RECENTES)  # Últimas etapas medidas, da mais antiga à mais recente
+trava = threading.Lock()  # Protege o registro, as etapas recentes e o perfil pendente
+pilhas = threading.local()  # Etapas em andamento em cada thread (etapas dentro de etapas)
+
+def ativar(caminho_registro=None, caminho_perfis=None):
+    """Liga as medições, gravando as etapas em caminho_registro e os perfis em caminho_perfis."""
+    global ativo, arquivo_registro, pasta_perfis
+    arquivo_registro = caminho_registro
+    pasta_perfis = caminho_perfis or (os.path.dirname(caminho_registro) if caminho_registro else None)
+    ativo = True
+
+def desativar():
+    """Desliga as medições; as etapas recentes continuam disponíveis para o painel."""
+    global ativo, perfil_pendente
+    ativo = False
+    perfil_pendente = False
+
+def perfilar_proxima():
+    """Executa a próxima etapa medida sob o cProfile (requer as medições ligadas)."""
+    global perfil_pendente
+    if not ativo:
+        raise RuntimeError("Ative o diagnóstico antes de perfilar uma operação.")
+    perfil_pendente = True
+
+def memoria_processo():
+    """Memória residente do processo, em bytes (None quando não há como medi-la)."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as arquivo:
+            return int(arquivo.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+def contar_linhas(resultado):
+    """Linhas do inventário no resultado de uma etapa: DataFrame ou tupla que começa por um."""
+    if isinstance(resultado, tuple) and resultado:
+        resultado = resultado[0]
+    return len(resultado) if isinstance(resultado, pd.DataFrame) else None
+
+@contextmanager
+def etapa(nome, linhas=None, minimo_s=0.0):
+    """Mede o bloco como a etapa 'nome'; o registro devolvido aceita registro["linhas"] = n.
+
+    Etapas mais rápidas que minimo_s não são registradas (operações frequentes, como a rolagem).
+    """
+    if not ativo:
+        yield {}
+        return
+
+    global perfil_pendente
+    pilha = getattr(pilhas, "etapas", None)
+    if pilha is None:
+        pilha = pilhas.etapas = []
+    perfil = None
+    if not pilha:  # Só a etapa mais externa é perfilada
+        with trava:
+            if perfil_pendente:
+                perfil, perfil_pendente = cProfile.Profile(), False
+
+    registro = {"etapa": nome, "linhas": linhas}
+    pilha.append(nome)
+    rastreando = False
+    if perfil is not None:
+        try:
+            perfil.enable()
+        except ValueError:  # Outro profiler já ativo nesta thread
+            perfil = None
+        else:
+            rastreando = not tracemalloc.is_tracing()
+            if rastreando:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            memoria_rastreada = tracemalloc.get_traced_memory()[0]
+    memoria = memoria_processo()
+    inicio = time.perf_counter()
+    try:
+        yield registro
+    finally:
+        segundos = time.perf_counter() - inicio
+        memoria_final = memoria_processo()
+        pilha.pop()
+        registro.update({
+            "horario": datetime.now().isoformat(timespec="milliseconds"),
+            "segundos": round(segundos, 6),
+            "memoria_mb": None if memoria is None or memoria_final is None
+            else round((memoria_final - memoria) / 1024 ** 2, 3),
+            "pico_mb": None,
+            "thread": threading.current_thread().name,
+        })
+        if perfil is not None:
+            perfil.disable()
+            registro["pico_mb"] = round((tracemalloc.get_traced_memory()[1] - memoria_rastreada) / 1024 ** 2, 3)
+            if rastreando:
+                tracemalloc.stop()
+            registro["perfil"] = gravar_perfil(perfil, nome)
+        if perfil is not None or segundos >= minimo_s:
+            gravar_registro(registro)
+
+def medido(nome, linhas=contar_linhas, minimo_s=0.0):
+    """Decorador: mede cada chamada da função como a etapa 'nome'.
+
+    linhas(resultado) informa as linhas processadas; por padrão, as do DataFrame devolvido.
+    """
+    def decorar(funcao):
+        @functools.wraps(funcao)
+        def medir(*args, **kwargs):
+            if not ativo:
+                return funcao(*args, **kwargs)
+            with etapa(nome, minimo_s=minimo_s) as registro:
+                resultado = funcao(*args, **kwargs)
+                registro["linhas"] = linhas(resultado)
+            return resultado
+        return medir
+    return decorar
+
+def gravar_registro(registro):
+    """Guarda a etapa nas recentes e acrescenta uma linha ao registro, rotacionando-o se preciso."""
+    with trava:
+        recentes.append(registro)
+        if arquivo_registro is None:
+            return
+        try:
+            if os.path.exists(arquivo_registro) and os.path.getsize(arquivo_registro) > LIMITE_REGISTRO:
+                base, extensao = os.path.splitext(arquivo_registro)
+                os.replace(arquivo_registro, f"{base}.anterior{extensao}")  # Guarda só o registro anterior
+            with open(arquivo_registro, "a", encoding="utf-8") as arquivo:
+                arquivo.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        except OSError:
+            pass  # O diagnóstico nunca interrompe a operação medida
+
+def gravar_perfil(perfil, nome):
+    """Grava o perfil (.prof) e o relatório em texto (.txt); retorna o caminho do .prof."""
+    if pasta_perfis is None:
+        return None
+    base = os.path.join(pasta_perfis, f"perfil_{nome}_{datetime.now():%Y%m%d_%H%M%S}")
+    relatorio = io.StringIO()
+    pstats.Stats(perfil, stream=relatorio).sort_stats("cumulative").print_stats(FUNCOES_RELATORIO)
+    try:
+        os.makedirs(pasta_perfis, exist_ok=True)
+        perfil.dump_stats(base + ".prof")
+        with open(base + ".txt", "w", encoding="utf-8") as arquivo:
+            arquivo.write(relatorio.getvalue())
+    except OSError:
+        return None
+    return base + ".prof"
+
+def etapas_recentes():
+    """Cópia das etapas recentes, da mais recente à mais antiga."""
+    with trava:
+        return list(reversed(recentes))
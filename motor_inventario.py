@@ -0,0 +1,627 @@
+"""Motor de apuração do inventário, sem interface gráfica.
+
+Reúne a leitura e a validação dos arquivos, a apuração, os totais do resumo,
+a formatação em reais e os índices de busca. É usado pela interface
+(ContagemEstoque.py) e pode ser executado na linha de comando:
+
+    python motor_inventario.py estoque.xlsx contagem1.json contagem2.xlsx -o resultado.xlsx
+"""
+import argparse
+import importlib.util
+import json
+import operator
+import os
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from diagnostico import etapa, medido
+
+
+# Colunas exibidas como moeda (R$) na tabela de apuração
+COLUNAS_MOEDA = ["VL. UNT.", "VL. ESTOQUE", "VL. DIF."]
+# Troca os separadores do padrão americano (1,234.56) pelo brasileiro (1.234,56)
+TROCA_SEPARADORES = str.maketrans(",.", ".,")
+# Textos em cache ocupam bem menos memória no formato do Arrow, quando o pyarrow está instalado
+TIPO_TEXTO = "string[pyarrow]" if importlib.util.find_spec("pyarrow") else object
+# Separadores dos níveis do endereço (rua, prateleira, posição), ex.: "A.2.1"
+SEPARADORES_ENDERECO = r"[.\-/ ]"
+# Totais do resumo, na ordem das colunas de contribuicoes_resumo
+CHAVES_RESUMO = [
+    "total_estoque", "total_dif_neg", "total_dif_pos",
+    "total_itens_contados", "total_itens_negativos", "total_itens_positivos",
+]
+NIVEIS_ZONA = 1  # Níveis do endereço que formam a zona do resumo por zona ("A.2.1" → "A")
+SEM_ENDERECO = "(SEM ENDEREÇO)"  # Zona dos itens sem endereço
+
+TAMANHO_BLOCO = 20000  # Linhas lidas da planilha por vez na importação em fluxo
+LIMITE_CATEGORIA = 0.5  # PRODUTO vira categoria se tiver no máximo esta fração de nomes distintos
+
+COLUNAS_OBRIGATORIAS = ["COD", "PRODUTO", "VL. UNT.", "ENDEREÇO", "QTD"]
+COLUNAS_CONTAGEM = ["COD", "ENDEREÇO", "CONTAGEM"]  # Colunas mínimas de um arquivo de contagem
+# Como combinar contagens de arquivos diferentes para o mesmo item
+POLITICAS_MESCLA = {
+    "substituir": "a contagem do último arquivo prevalece",
+    "somar": "as contagens dos arquivos são somadas",
+}
+
+class TarefaCancelada(Exception):
+    """Indica que o usuário cancelou a operação em segundo plano."""
+
+def sem_progresso(fracao, texto, parcial=None):
+    """Callback de progresso vazio, para uso fora da interface."""
+
+def ler_arquivo(file_path):
+    """Lê um arquivo de inventário pelo formato da extensão, mantendo COD como texto."""
+    extensao = os.path.splitext(file_path)[1].lower()
+    if extensao in (".xlsx", ".xlsm", ".xls"):
+        dados = pd.read_excel(file_path, dtype={"COD": str})
+    elif extensao == ".json":
+        dados = pd.read_json(file_path, orient="records", dtype={"COD": str})  # Mantém zeros à esquerda do código
+    elif extensao == ".csv":
+        dados = pd.read_csv(file_path, dtype={"COD": str})
+    elif extensao == ".feather":
+        dados = ler_feather(file_path)
+    else:
+        raise ValueError(f"Formato de arquivo não suportado: {extensao or file_path}")
+    if "COD" in dados.columns:
+        dados["COD"] = dados["COD"].astype(str)
+    return dados
+
+def ler_inventario(file_path, progresso=sem_progresso):
+    """Lê e valida um inventário de qualquer formato suportado, sem os caches da interface."""
+    if file_path.lower().endswith((".xlsx", ".xlsm")):
+        return ler_planilha_em_fluxo(file_path, progresso, somente_dados=True)
+    progresso(0.1, "Lendo o arquivo...")
+    # Sessões já trazem as colunas calculadas da última apuração
+    manter_calculadas = file_path.lower().endswith(".feather")
+    return validar_inventario(ler_arquivo(file_path), f"em {os.path.basename(file_path)}", manter_calculadas)
+
+@medido("carregar_planilha")
+def ler_planilha(file_path, progresso):
+    """Lê e prepara a planilha de Excel (executado fora da thread do Tk)."""
+    progresso(0.1, "Lendo a planilha...")
+    dados = pd.read_excel(file_path)
+
+    # Converter a coluna COD para texto
+    if "COD" in dados.columns:
+        dados["COD"] = dados["COD"].astype(str)
+
+    return preparar_inventario(dados, "na planilha", progresso)
+
+@medido("carregar_planilha")
+def ler_planilha_em_fluxo(file_path, progresso, somente_dados=False):
+    """Lê a planilha em modo somente leitura, bloco a bloco, enviando prévias para a tabela.
+
+    Com somente_dados, devolve apenas o DataFrame, sem os textos de exibição e os índices de busca.
+    """
+    partes = []
+    partes_exibicao = None if somente_dados else []
+    for dados, total in ler_blocos_planilha(file_path):
+        ler_bloco(dados, partes, partes_exibicao, total, progresso)
+
+    progresso(0.9, "Compactando colunas...")
+    dados = compactar_tipos(pd.concat(partes, ignore_index=True))
+    if somente_dados:
+        return dados
+    nova_exibicao = pd.concat(partes_exibicao, ignore_index=True)
+    progresso(0.95, "Indexando códigos e endereços...")
+    return dados, nova_exibicao, construir_indice_busca(dados)
+
+def ler_blocos_planilha(file_path):
+    """Valida o cabeçalho e gera a planilha em blocos de até TAMANHO_BLOCO linhas.
+
+    Gera (DataFrame do bloco, total de linhas da planilha); o total é 0 quando a planilha não o informa.
+    """
+    livro = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        planilha = livro.active
+        linhas = planilha.iter_rows(values_only=True)
+
+        # Valida o cabeçalho antes de ler qualquer dado
+        with etapa("validar_inventario"):
+            cabecalho = [str(c).strip() if c is not None else "" for c in next(linhas, ())]
+            for col in COLUNAS_OBRIGATORIAS:
+                if col not in cabecalho:
+                    raise ValueError(f"Coluna obrigatória '{col}' não encontrada na planilha.")
+
+        # Lê somente as colunas usadas pelo aplicativo
+        lidas = COLUNAS_OBRIGATORIAS + (["CONTAGEM"] if "CONTAGEM" in cabecalho else [])
+        extrair = operator.itemgetter(*[cabecalho.index(col) for col in lidas])
+        largura = len(cabecalho)
+        total = max((planilha.max_row or 0) - 1, 0)  # Pode ser desconhecido em modo somente leitura
+
+        bloco, gerados = [], 0
+        for linha in linhas:
+            if len(linha) < largura:
+                linha = linha + (None,) * (largura - len(linha))
+            valores = extrair(linha)
+            if all(valor is None for valor in valores):
+                continue  # Linhas vazias (ex.: linhas formatadas ao fim de exportações), como no pd.read_excel
+            # COD vira texto célula a célula: um COD vazio no bloco não converte os demais em float ("2578.0")
+            cod = valores[0]
+            if isinstance(cod, float) and cod.is_integer():
+                valores = (str(int(cod)),) + valores[1:]
+            elif cod is not None and not isinstance(cod, str):
+                valores = (str(cod),) + valores[1:]
+            bloco.append(valores)
+            if len(bloco) == TAMANHO_BLOCO:
+                yield montar_bloco(pd.DataFrame.from_records(bloco, columns=lidas)), total
+                bloco, gerados = [], gerados + 1
+        if bloco or not gerados:
+            yield montar_bloco(pd.DataFrame.from_records(bloco, columns=lidas)), total
+    finally:
+        livro.close()
+
+def montar_bloco(dados):
+    """Converte os tipos de um bloco lido e cria as colunas calculadas, ainda não apuradas."""
+    dados["COD"] = dados["COD"].astype(str)
+    for col in ["VL. UNT.", "QTD", "CONTAGEM"]:
+        if col in dados.columns:
+            dados[col] = pd.to_numeric(dados[col], errors="coerce")
+    if "CONTAGEM" not in dados.columns:
+        dados["CONTAGEM"] = 0
+    dados["VL. ESTOQUE"] = 0.0
+    dados["DIF. ETQ"] = 0.0
+    dados["VL. DIF."] = 0.0
+    return dados
+
+def ler_bloco(dados, partes, partes_exibicao, total, progresso):
+    """Acumula um bloco lido e envia a prévia da tabela nas potências de dois."""
+    partes.append(dados)
+    lidas_ate_agora = sum(len(parte) for parte in partes)
+    fracao = min(0.85, 0.85 * lidas_ate_agora / total) if total else None
+    if partes_exibicao is None:  # Leitura sem interface: não há prévia a exibir
+        progresso(fracao, f"{lidas_ate_agora} linhas lidas...")
+        return
+    partes_exibicao.append(preparar_exibicao(dados))
+    parcial = None
+    if len(partes) & (len(partes) - 1) == 0:  # 1, 2, 4, 8... blocos: a prévia custa O(n) no total
+        parcial = (pd.concat(partes, ignore_index=True), pd.concat(partes_exibicao, ignore_index=True))
+    progresso(fracao, f"{lidas_ate_agora} linhas lidas...", parcial)
+
+def compactar_tipos(dados):
+    """Usa tipos compactos: textos repetidos como categorias e quantidades em 32 bits quando não há perda."""
+    dados["ENDEREÇO"] = dados["ENDEREÇO"].astype("category")
+    # Nomes de produto só compensam como categoria quando se repetem
+    if dados["PRODUTO"].nunique() <= len(dados) * LIMITE_CATEGORIA:
+        dados["PRODUTO"] = dados["PRODUTO"].astype("category")
+
+    for col in ["QTD", "CONTAGEM"]:
+        if not pd.api.types.is_numeric_dtype(dados[col]):
+            continue  # Conteúdo inválido: o erro aparece na apuração, como antes
+        valores = dados[col].to_numpy(dtype=float)
+        if np.isnan(valores).any():
+            continue  # Células vazias: mantém float64 com NaN
+        for tipo in (np.int32, np.float32):
+            if cabe_no_tipo(valores, tipo):
+                dados[col] = valores.astype(tipo)
+                break
+    return dados
+
+def cabe_no_tipo(valores, tipo):
+    """Indica se todos os valores podem ser guardados no tipo informado sem perda."""
+    valores = np.asarray(valores, dtype=float)
+    if np.issubdtype(tipo, np.integer):
+        limites = np.iinfo(tipo)
+        return bool(np.all(np.isfinite(valores) & (valores == np.round(valores))
+                           & (valores >= limites.min) & (valores <= limites.max)))
+    if np.dtype(tipo) == np.float32:
+        return bool(np.all((valores.astype(np.float32) == valores) | np.isnan(valores)))
+    return True
+
+def atribuir_valores(dados, posicoes, col, valores):
+    """Grava valores nas posições informadas, ampliando para float64 o tipo que não os comporta."""
+    valores = np.atleast_1d(np.asarray(valores, dtype=float))
+    if not cabe_no_tipo(valores, dados[col].dtype):
+        dados[col] = dados[col].astype(float)  # Ex.: contagem fracionada em uma coluna int32
+    dados.iloc[np.atleast_1d(posicoes), dados.columns.get_loc(col)] = valores
+
+def gravar_contagens(dados, posicoes, contagem):
+    """Grava novas contagens nas posições informadas e recalcula as colunas dessas linhas."""
+    posicoes = np.atleast_1d(posicoes)
+    contagem = np.atleast_1d(np.asarray(contagem, dtype=float))
+    qtd = dados["QTD"].to_numpy(dtype=float)[posicoes]
+    vl_unt = dados["VL. UNT."].to_numpy(dtype=float)[posicoes]
+    atribuir_valores(dados, posicoes, "CONTAGEM", contagem)
+    atribuir_valores(dados, posicoes, "DIF. ETQ", contagem - qtd)
+    atribuir_valores(dados, posicoes, "VL. ESTOQUE", vl_unt * qtd)
+    atribuir_valores(dados, posicoes, "VL. DIF.", (contagem - qtd) * vl_unt)
+    if "RECONTAGEM" in dados.columns:
+        dados.iloc[posicoes, dados.columns.get_loc("RECONTAGEM")] = False  # Nova contagem resolve a pendência
+
+def megabytes(quantidade_bytes):
+    """Formata uma quantidade de bytes em MB no padrão brasileiro."""
+    return f"{quantidade_bytes / 1024 ** 2:,.2f} MB".translate(TROCA_SEPARADORES)
+
+@medido("validar_inventario")
+def validar_inventario(dados, origem, manter_calculadas=False):
+    """Valida as colunas obrigatórias, cria as colunas calculadas e compacta os tipos."""
+    for col in COLUNAS_OBRIGATORIAS:
+        if col not in dados.columns:
+            raise ValueError(f"Coluna obrigatória '{col}' não encontrada {origem}.")
+
+    if "CONTAGEM" not in dados.columns:
+        dados["CONTAGEM"] = 0
+
+    if not manter_calculadas:
+        dados["VL. ESTOQUE"] = 0.0
+        dados["DIF. ETQ"] = 0.0
+        dados["VL. DIF."] = 0.0
+
+    return compactar_tipos(dados)
+
+def preparar_inventario(dados, origem, progresso, manter_calculadas=False):
+    """Valida as colunas, cria as colunas calculadas e monta os caches de exibição e busca."""
+    progresso(0.5, "Validando colunas...")
+    validar_inventario(dados, origem, manter_calculadas)
+    progresso(0.7, "Formatando valores...")
+    nova_exibicao = preparar_exibicao(dados)
+    progresso(0.9, "Indexando códigos e endereços...")
+    novo_indice = construir_indice_busca(dados)
+    return dados, nova_exibicao, novo_indice
+
+@medido("carregar_json")
+def ler_json(file_path, progresso):
+    """Lê e prepara o arquivo JSON (executado fora da thread do Tk)."""
+    progresso(0.1, "Lendo o arquivo JSON...")
+    dados = pd.read_json(file_path, orient="records", dtype={"COD": str})  # Mantém zeros à esquerda do código
+    return preparar_inventario(dados, "no arquivo JSON", progresso)
+
+@medido("carregar_sessao")
+def ler_sessao(file_path, progresso):
+    """Lê a sessão mapeando o arquivo em memória (executado fora da thread do Tk)."""
+    progresso(0.1, "Lendo a sessão...")
+    dados = ler_feather(file_path)
+    # A sessão já traz as colunas calculadas da última apuração
+    return preparar_inventario(dados, "na sessão", progresso, manter_calculadas=True)
+
+def ler_feather(file_path):
+    """Lê um arquivo .feather mapeando-o em memória (requer pyarrow)."""
+    # pd.read_feather não aceita memory_map: o mapeamento é feito pelo próprio pyarrow
+    from pyarrow import feather
+    return feather.read_table(file_path, memory_map=True).to_pandas()
+
+def gravar_sessao(dados, caminho):
+    """Grava o inventário com os tipos de cada coluna preservados (requer pyarrow)."""
+    # Sem compressão, o arquivo pode ser mapeado em memória ao ser reaberto
+    dados.reset_index(drop=True).to_feather(caminho, compression="uncompressed")
+
+def gravar_arquivo(save_path, progresso, escrever):
+    """Grava em um arquivo temporário e só substitui o destino se não houver cancelamento."""
+    base, extensao = os.path.splitext(save_path)
+    temporario = f"{base}.tmp{extensao}"
+    progresso(None, "Gravando arquivo...")
+    try:
+        escrever(temporario)
+        progresso(None, "Finalizando...")  # Última chance de cancelar
+        os.replace(temporario, save_path)
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+
+def formatar_moeda(valor):
+    """Formata valores como moeda no padrão brasileiro, incluindo R$."""
+    if isinstance(valor, (int, float)):
+        return f"R$ {valor:,.2f}".translate(TROCA_SEPARADORES)
+    return valor
+
+def formatar_moeda_serie(serie):
+    """Formata uma coluna inteira como moeda brasileira em uma única passada."""
+    # Formata tudo em um único texto e troca os separadores de uma só vez,
+    # em vez de chamar formatar_moeda célula a célula
+    valores = pd.to_numeric(serie, errors="coerce").astype(float).tolist()
+    textos = "\n".join(map("R$ {:,.2f}".format, valores)).translate(TROCA_SEPARADORES)
+    return pd.Series(textos.split("\n") if valores else [], index=serie.index, dtype=TIPO_TEXTO)
+
+def preparar_exibicao(dados):
+    """Gera, para o inventário inteiro, os textos das colunas de moeda exibidos na tabela."""
+    return pd.DataFrame({col: formatar_moeda_serie(dados[col]) for col in COLUNAS_MOEDA})
+
+def construir_indice_busca(dados):
+    """Monta os índices de COD, ENDEREÇO, da chave COD+ENDEREÇO (e das repetidas) e das linhas de cada COD, uma única vez por arquivo carregado."""
+    return {
+        "COD": indexar_prefixos(dados["COD"]),
+        "ENDEREÇO": indexar_prefixos(dados["ENDEREÇO"], SEPARADORES_ENDERECO),
+        "CHAVE": construir_indice_chaves(dados),
+        "REPETIDAS": construir_indice_repetidas(dados),
+        "CODIGO": construir_indice_codigos(dados),
+    }
+
+def construir_indice_chaves(dados):
+    """Mapeia cada chave (COD, ENDEREÇO) para a posição da linha em dados."""
+    chaves = list(zip(dados["COD"].astype(str), dados["ENDEREÇO"].astype(str)))
+    # Percorre de trás para frente: com chaves repetidas, vale a primeira ocorrência
+    return dict(zip(reversed(chaves), range(len(chaves) - 1, -1, -1)))
+
+def construir_indice_repetidas(dados):
+    """Mapeia cada chave (COD, ENDEREÇO) que se repete para as posições das suas linhas, em ordem."""
+    cods, enderecos = dados["COD"].astype(str).to_numpy(), dados["ENDEREÇO"].astype(str).to_numpy()
+    repetidas = np.flatnonzero(pd.DataFrame({"COD": cods, "ENDEREÇO": enderecos}).duplicated(keep=False).to_numpy())
+    grupos = pd.Series(repetidas).groupby([cods[repetidas], enderecos[repetidas]], sort=False)
+    return {chave: posicoes.to_numpy() for chave, posicoes in grupos}
+
+def localizar_ocorrencia(indice_chaves, indice_repetidas, cod, endereco, ocorrencia=0):
+    """Posição da linha de número 'ocorrencia' (a partir de 0) da chave (COD, ENDEREÇO); None se não existir."""
+    chave = (str(cod), str(endereco))
+    if not ocorrencia:
+        return indice_chaves.get(chave)
+    posicoes = indice_repetidas.get(chave)
+    return int(posicoes[ocorrencia]) if posicoes is not None and 0 < ocorrencia < len(posicoes) else None
+
+def ocorrencia_da_linha(indice_repetidas, cod, endereco, posicao):
+    """Número da ocorrência (a partir de 0) da linha entre as que repetem a sua chave (COD, ENDEREÇO)."""
+    posicoes = indice_repetidas.get((cod, endereco))
+    return 0 if posicoes is None else int(np.searchsorted(posicoes, posicao))
+
+def construir_indice_codigos(dados):
+    """Mapeia cada COD para as posições das suas linhas (o mesmo código pode estar em vários endereços)."""
+    return pd.Series(np.arange(len(dados))).groupby(dados["COD"].astype(str).to_numpy(), sort=False).indices
+
+def interpretar_leitura(texto):
+    """Separa a leitura do leitor de código de barras em (COD, quantidade): "789100" ou "789100*6"."""
+    cod, separador, quantidade = texto.strip().partition("*")
+    cod = cod.strip()
+    if not cod:
+        raise ValueError("Leitura sem código.")
+    return cod, float(quantidade.replace(",", ".")) if separador else 1.0
+
+def localizar_chaves(dados, cods, enderecos):
+    """Localiza de uma vez as linhas de várias chaves (COD, ENDEREÇO); -1 onde a chave não existe."""
+    chaves = pd.Index(dados["COD"].astype(str) + "\x1f" + dados["ENDEREÇO"].astype(str))
+    primeiras = ~chaves.duplicated()  # Com chaves repetidas, vale a primeira ocorrência
+    procuradas = pd.Series(np.asarray(cods, dtype=str)).str.cat(pd.Series(np.asarray(enderecos, dtype=str)), sep="\x1f")
+    encontradas = chaves[primeiras].get_indexer(procuradas)
+    return np.where(encontradas >= 0, np.flatnonzero(primeiras)[encontradas], -1)
+
+def indexar_prefixos(serie, separadores=None):
+    """Ordena os termos pesquisáveis dos valores distintos de uma coluna."""
+    # Endereços se repetem muito: indexa cada valor distinto uma única vez
+    codigos, distintos = pd.factorize(serie.astype(str).str.upper())
+    termos = pd.Series(distintos, dtype=object)
+    partes = [termos]
+    if separadores:
+        # Cada nível do endereço também pode ser buscado: "A.2.1" gera "A.2.1", "2.1" e "1"
+        resto = termos
+        while True:
+            resto = resto.str.split(separadores, n=1, regex=True).str[1].dropna()
+            if resto.empty:
+                break
+            partes.append(resto)
+
+    todos = pd.concat(partes)
+    valores = todos.to_numpy(dtype=str)
+    ordem = np.argsort(valores, kind="stable")
+    return valores[ordem], todos.index.to_numpy()[ordem], codigos
+
+def buscar_prefixo(indice, consulta):
+    """Retorna, em ordem, as posições das linhas com algum termo iniciado pela consulta."""
+    termos, distintos, codigos = indice
+    consulta = consulta.upper()
+    inicio = np.searchsorted(termos, consulta, side="left")
+    fim = np.searchsorted(termos, consulta + chr(0x10FFFF), side="left")
+    encontrados = np.zeros(len(termos), dtype=bool)  # Há ao menos um termo por valor distinto
+    encontrados[distintos[inicio:fim]] = True
+    return np.flatnonzero(encontrados[codigos])
+
+def apurar(dados):
+    """Calcula DIF. ETQ, VL. ESTOQUE e VL. DIF. de todos os itens."""
+    dados["DIF. ETQ"] = dados["CONTAGEM"] - dados["QTD"]
+    dados["VL. ESTOQUE"] = dados["QTD"] * dados["VL. UNT."]
+    dados["VL. DIF."] = dados["DIF. ETQ"] * dados["VL. UNT."]
+    return dados
+
+def calcular_resumo(dados):
+    """Calcula os totais exibidos no resumo do inventário."""
+    return totais_do_vetor(contribuicoes_resumo(dados).sum(axis=0))
+
+def contribuicoes_resumo(dados):
+    """Contribuição de cada linha para cada total do resumo: matriz linhas × CHAVES_RESUMO.
+
+    Os totais são somas dessas contribuições, por isso podem ser mantidos por delta (nova - anterior).
+    """
+    dif_etq = np.asarray(dados["DIF. ETQ"], dtype=float)
+    vl_dif = np.nan_to_num(np.asarray(dados["VL. DIF."], dtype=float))
+    negativos, positivos = dif_etq < 0, dif_etq > 0  # NaN não é negativo nem positivo
+    return np.column_stack([
+        np.nan_to_num(np.asarray(dados["VL. ESTOQUE"], dtype=float)),
+        np.where(negativos, vl_dif, 0.0),
+        np.where(positivos, vl_dif, 0.0),
+        np.asarray(dados["CONTAGEM"], dtype=float) > 0,
+        negativos,
+        positivos,
+    ])
+
+def contribuicao_da_linha(dados, posicao):
+    """Contribuição de uma única linha para os totais do resumo (vetor na ordem de CHAVES_RESUMO)."""
+    # Lê só as quatro células usadas: copiar a linha inteira custa bem mais que o cálculo
+    celulas = {col: [dados[col].iat[posicao]] for col in ["VL. ESTOQUE", "DIF. ETQ", "VL. DIF.", "CONTAGEM"]}
+    return contribuicoes_resumo(celulas)[0]
+
+def totais_do_vetor(vetor):
+    """Converte somas na ordem de CHAVES_RESUMO nos totais do resumo (quantidades de itens como inteiros)."""
+    return {
+        chave: int(round(valor)) if chave.startswith("total_itens") else float(valor)
+        for chave, valor in zip(CHAVES_RESUMO, vetor)
+    }
+
+def agrupar_zonas(enderecos, niveis=NIVEIS_ZONA):
+    """Zona de cada linha pelos primeiros níveis do endereço ("A.2.1" → "A" com 1 nível, "A.2" com 2).
+
+    Retorna (código da zona de cada linha, nomes das zonas em ordem alfabética).
+    """
+    # Cada endereço distinto é processado uma única vez
+    enderecos = pd.Series(enderecos).astype("category")
+    distintos = pd.Series(enderecos.cat.categories.astype(str))
+    nivel = f"[^{SEPARADORES_ENDERECO[1:]}*"
+    zonas = distintos.str.extract(f"^({nivel}(?:{SEPARADORES_ENDERECO}{nivel}){{0,{niveis - 1}}})", expand=False)
+    zonas = zonas.fillna(distintos).to_numpy(dtype=str)
+    codigos = enderecos.cat.codes.to_numpy()
+    if (codigos < 0).any():
+        zonas = np.append(zonas, SEM_ENDERECO)
+        codigos = np.where(codigos < 0, len(zonas) - 1, codigos)
+
+    nomes, zona_do_distinto = np.unique(zonas, return_inverse=True)
+    zona_das_linhas = zona_do_distinto[codigos]
+    # Descarta zonas só de endereços sem nenhuma linha (categorias sem uso)
+    usadas = np.flatnonzero(np.bincount(zona_das_linhas, minlength=len(nomes)))
+    renumeracao = np.zeros(len(nomes), dtype=np.intp)
+    renumeracao[usadas] = np.arange(len(usadas))
+    return renumeracao[zona_das_linhas], nomes[usadas]
+
+def resumo_por_zona(dados, niveis=NIVEIS_ZONA):
+    """Totais do resumo de cada zona do endereço, em uma única passada pelas colunas.
+
+    Retorna (código da zona de cada linha, nomes das zonas, matriz zonas × CHAVES_RESUMO);
+    a soma das linhas da matriz são os totais gerais.
+    """
+    zonas, nomes = agrupar_zonas(dados["ENDEREÇO"], niveis)
+    contribuicoes = contribuicoes_resumo(dados)
+    matriz = np.column_stack([
+        np.bincount(zonas, weights=contribuicoes[:, i], minlength=len(nomes)) for i in range(len(CHAVES_RESUMO))
+    ]) if len(nomes) else np.zeros((0, len(CHAVES_RESUMO)))
+    return zonas, nomes, matriz
+
+def linhas_resumo(totais):
+    """Monta as linhas (descrição, valor formatado) do resumo a partir dos totais."""
+    total_estoque = totais["total_estoque"]
+    total_dif_neg = totais["total_dif_neg"]
+    total_dif_pos = totais["total_dif_pos"]
+    divergencia_absoluta = abs(total_dif_neg) + abs(total_dif_pos)
+    return [
+        ("ESTOQUE TOTAL", formatar_moeda(total_estoque)),
+        ("TOTAL DE ITENS CONTADOS", f"{totais['total_itens_contados']}"),
+        ("TOTAL DE ITENS NEGATIVOS", f"{totais['total_itens_negativos']}"),
+        ("TOTAL DE ITENS POSITIVOS", f"{totais['total_itens_positivos']}"),
+        ("TOTAL DIVERGÊNCIAS NEGATIVAS", formatar_moeda(total_dif_neg)),
+        ("TOTAL DIVERGÊNCIAS POSITIVAS", formatar_moeda(total_dif_pos)),
+        ("% DIVERGÊNCIA ABSOLUTA", f"{(divergencia_absoluta / total_estoque * 100):,.2f}%" if total_estoque != 0 else "0,00%"),
+    ]
+
+def ler_contagens(file_path):
+    """Lê um arquivo de contagem (COD, ENDEREÇO e CONTAGEM) de qualquer formato suportado."""
+    dados = ler_arquivo(file_path)
+    for col in COLUNAS_CONTAGEM:
+        if col not in dados.columns:
+            raise ValueError(f"Coluna obrigatória '{col}' não encontrada em {os.path.basename(file_path)}.")
+    contagens = dados[COLUNAS_CONTAGEM].copy()
+    contagens["ENDEREÇO"] = contagens["ENDEREÇO"].astype(str)
+    contagens["CONTAGEM"] = pd.to_numeric(contagens["CONTAGEM"], errors="raise")
+    return contagens
+
+def mesclar_contagens(dados, contagens, politica="substituir"):
+    """Combina contagens parciais de vários arquivos em dados, de uma vez, pela chave COD+ENDEREÇO.
+
+    contagens é uma lista de (nome do arquivo, DataFrame de ler_contagens), na ordem de aplicação.
+    CONTAGEM zero ou vazia conta como item não contado pelo arquivo (SALVAR CONTAGEM grava o
+    inventário inteiro). Itens contados com valores diferentes em mais de um arquivo ficam
+    marcados na coluna RECONTAGEM. Retorna (conflitos, com a contagem de cada arquivo por
+    item marcado, e contagens sem item no estoque).
+    """
+    if politica not in POLITICAS_MESCLA:
+        raise ValueError(f"Política de mescla desconhecida: {politica}")
+    todas = pd.concat(
+        [parte[COLUNAS_CONTAGEM].assign(ARQUIVO=nome) for nome, parte in contagens]
+        or [pd.DataFrame(columns=COLUNAS_CONTAGEM + ["ARQUIVO"])],
+        ignore_index=True,
+    )
+    todas = todas[todas["CONTAGEM"].fillna(0).astype(float) != 0]
+
+    # Junção por hash das chaves de todos os arquivos com as linhas do estoque
+    posicoes = localizar_chaves(dados, todas["COD"], todas["ENDEREÇO"])
+    nao_encontradas = todas[posicoes < 0].reset_index(drop=True)
+    todas = todas[posicoes >= 0].assign(POSICAO=posicoes[posicoes >= 0], CONTAGEM=lambda t: t["CONTAGEM"].astype(float))
+
+    # Valor de cada arquivo por item e, depois, a combinação entre os arquivos
+    agregacao = "sum" if politica == "somar" else "last"
+    por_arquivo = todas.groupby(["POSICAO", "ARQUIVO"], sort=False)["CONTAGEM"].agg(agregacao)
+    por_item = por_arquivo.groupby(level="POSICAO", sort=False)
+    valores = por_item.agg(agregacao)  # Grupos mantêm a ordem dos arquivos: "last" é o último arquivo
+    divergentes = por_item.nunique()
+    divergentes = divergentes.index[divergentes > 1].to_numpy()
+
+    if "RECONTAGEM" not in dados.columns:
+        dados["RECONTAGEM"] = False
+    if len(valores):
+        gravar_contagens(dados, valores.index.to_numpy(), valores.to_numpy(dtype=float))
+    dados.iloc[divergentes, dados.columns.get_loc("RECONTAGEM")] = True
+
+    # Relatório dos conflitos: uma coluna por arquivo com a contagem de cada item marcado
+    conflitos = por_arquivo[por_arquivo.index.get_level_values("POSICAO").isin(divergentes)].unstack("ARQUIVO")
+    conflitos = conflitos.reindex(columns=[nome for nome, _ in contagens]).sort_index().reset_index()
+    conflitos.columns.name = None
+    conflitos.insert(0, "COD", dados["COD"].to_numpy()[conflitos["POSICAO"]])
+    conflitos.insert(1, "ENDEREÇO", dados["ENDEREÇO"].astype(str).to_numpy()[conflitos["POSICAO"]])
+    conflitos["CONTAGEM FINAL"] = dados["CONTAGEM"].to_numpy()[conflitos["POSICAO"]]
+    return conflitos.drop(columns="POSICAO"), nao_encontradas
+
+def apurar_arquivos(arquivo_estoque, arquivos_contagem=(), progresso=sem_progresso, politica="substituir"):
+    """Lê o estoque, mescla os arquivos de contagem e apura o inventário.
+
+    Retorna (dados, totais do resumo, contagens sem item correspondente no estoque).
+    """
+    dados = ler_inventario(arquivo_estoque, progresso)
+    contagens = []
+    for i, arquivo in enumerate(arquivos_contagem):
+        progresso(0.9, f"Lendo contagem {i + 1} de {len(arquivos_contagem)}...")
+        contagens.append((os.path.basename(arquivo), ler_contagens(arquivo)))
+    _, nao_encontradas = mesclar_contagens(dados, contagens, politica)
+    apurar(dados)
+    return dados, calcular_resumo(dados), nao_encontradas
+
+def gravar_resultado(dados, totais, save_path, nao_encontradas=None):
+    """Grava o inventário apurado e o resumo em .xlsx (abas separadas), .json ou .csv.
+
+    Em .json e .csv o resumo vai para um arquivo ao lado, com o sufixo ".resumo".
+    """
+    resumo = pd.DataFrame(linhas_resumo(totais), columns=["Descrição", "Valor"])
+    base, extensao = os.path.splitext(save_path)
+    extensao = extensao.lower()
+    if extensao == ".xlsx":
+        def escrever(caminho):
+            with pd.ExcelWriter(caminho) as planilhas:
+                dados.to_excel(planilhas, sheet_name="APURAÇÃO", index=False)  # Primeira aba: reabre no aplicativo
+                resumo.to_excel(planilhas, sheet_name="RESUMO", index=False)
+                if "RECONTAGEM" in dados.columns and dados["RECONTAGEM"].any():
+                    dados[dados["RECONTAGEM"]].to_excel(planilhas, sheet_name="RECONTAGEM", index=False)
+                if nao_encontradas is not None and len(nao_encontradas):
+                    nao_encontradas.to_excel(planilhas, sheet_name="SEM ITEM NO ESTOQUE", index=False)
+        gravar_arquivo(save_path, sem_progresso, escrever)
+    elif extensao == ".json":
+        gravar_arquivo(save_path, sem_progresso, lambda caminho: dados.to_json(caminho, orient="records", force_ascii=False, indent=4))
+        with open(f"{base}.resumo.json", "w", encoding="utf-8") as arquivo:
+            json.dump(dict(linhas_resumo(totais)), arquivo, ensure_ascii=False, indent=4)
+    elif extensao == ".csv":
+        gravar_arquivo(save_path, sem_progresso, lambda caminho: dados.to_csv(caminho, index=False))
+        resumo.to_csv(f"{base}.resumo.csv", index=False)
+    else:
+        raise ValueError(f"Formato de saída não suportado: {extensao or save_path}")
+
+def main(argumentos=None):
+    """Apura um inventário pela linha de comando, sem abrir a interface."""
+    parser = argparse.ArgumentParser(description="Apura um inventário de estoque sem abrir a interface gráfica.")
+    parser.add_argument("estoque", help="arquivo de estoque (.xlsx, .xls, .json, .csv ou sessão .feather)")
+    parser.add_argument("contagens", nargs="*",
+                        help="arquivos com COD, ENDEREÇO e CONTAGEM, mesclados na ordem informada")
+    parser.add_argument("-o", "--saida", required=True, help="arquivo de resultado (.xlsx, .json ou .csv)")
+    parser.add_argument("--politica", choices=POLITICAS_MESCLA, default="substituir",
+                        help="item contado em mais de um arquivo: " + "; ".join(
+                            f"{nome}: {descricao}" for nome, descricao in POLITICAS_MESCLA.items()))
+    args = parser.parse_args(argumentos)
+
+    try:
+        dados, totais, nao_encontradas = apurar_arquivos(args.estoque, args.contagens, politica=args.politica)
+        gravar_resultado(dados, totais, args.saida, nao_encontradas)
+    except (OSError, ValueError) as e:
+        parser.exit(1, f"Erro: {e}\n")
+
+    for titulo, valor in linhas_resumo(totais):
+        print(f"{titulo}: {valor}")
+    if "RECONTAGEM" in dados.columns and dados["RECONTAGEM"].any():
+        print(f"{int(dados['RECONTAGEM'].sum())} item(ns) com contagens divergentes entre arquivos, marcados para RECONTAGEM.")
+    if len(nao_encontradas):
+        print(f"{len(nao_encontradas)} contagem(ns) sem item correspondente no estoque.")
+
+if __name__ == "__main__":
+    main()
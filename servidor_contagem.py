@@ -0,0 +1,282 @@
+"""Servidor local de contagem: várias estações contando o mesmo inventário pela rede local.
+
+O servidor guarda o inventário oficial. Estações (o aplicativo em CONECTAR AO SERVIDOR,
+ou leitores de mão) enviam incrementos de contagem, que são somados sob uma trava e
+gravados em lote na sessão.
+
+    python servidor_contagem.py estoque.xlsx --porta 8765 --sessao contagem.feather
+
+Rotas (JSON):
+    GET  /inventario                 inventário completo e a versão atual
+    GET  /resumo                     totais do resumo
+    GET  /eventos?desde=V&espera=S   linhas alteradas depois da versão V (aguarda até S segundos)
+    POST /contagens                  {"estacao": "...", "deltas": [{"cod": ..., "endereco": ..., "quantidade": ...}]}
+
+Em /contagens, "endereco" é opcional: sem ele vale a primeira linha do código. Quando o
+inventário repete COD + ENDEREÇO, "ocorrencia" (0, a primeira, por padrão) escolhe a linha;
+as linhas devolvidas pelo servidor também a informam.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from motor_inventario import (
+    apurar, calcular_resumo, construir_indice_chaves, construir_indice_codigos, construir_indice_repetidas,
+    gravar_arquivo, gravar_contagens, gravar_sessao, ler_inventario, linhas_resumo, localizar_ocorrencia,
+    ocorrencia_da_linha, sem_progresso,
+)
+
+PORTA_PADRAO = 8765
+ESPERA_MAXIMA_S = 30  # Tempo máximo que /eventos segura a resposta aguardando alterações
+LIMITE_ALTERACOES = 10000  # Lotes de alterações guardados para estações que ficaram para trás
+INTERVALO_GRAVACAO_S = 10  # Intervalo da gravação da sessão em disco, quando houve alterações
+
+dados = None  # Inventário oficial
+indice_chaves = {}  # (COD, ENDEREÇO) -> posição
+indice_repetidas = {}  # (COD, ENDEREÇO) repetida -> posições das suas linhas
+indice_codigos = {}  # COD -> posições
+totais = None  # Totais do resumo, mantidos por delta a cada lote
+versao = 0  # Aumenta a cada lote de contagens aplicado
+alteracoes = []  # (versão, posições alteradas) dos últimos lotes
+alterado = False  # Há alterações ainda não gravadas na sessão
+trava = threading.Condition()  # Protege o estado acima e avisa as estações que aguardam eventos
+
+def iniciar_inventario(inventario):
+    """Define o inventário oficial e monta os índices de chave e de código."""
+    global dados, indice_chaves, indice_repetidas, indice_codigos, totais, versao, alteracoes
+    with trava:
+        dados = apurar(inventario)
+        indice_chaves = construir_indice_chaves(dados)
+        indice_repetidas = construir_indice_repetidas(dados)
+        indice_codigos = construir_indice_codigos(dados)
+        totais = calcular_resumo(dados)
+        versao = 0
+        alteracoes = []
+
+def aplicar_deltas(deltas):
+    """Soma um lote de incrementos de contagem ao inventário em uma única gravação.
+
+    Retorna (linhas alteradas com a contagem resultante, deltas recusados).
+    """
+    global versao, alterado
+    posicoes, quantidades, recusados = [], [], []
+    with trava:
+        for delta in deltas:
+            try:
+                posicao = localizar_delta(delta)
+                quantidade = float(delta["quantidade"])
+            except (KeyError, TypeError, ValueError):
+                posicao = None
+            if posicao is None:
+                recusados.append(delta)
+            else:
+                posicoes.append(posicao)
+                quantidades.append(quantidade)
+        if not posicoes:
+            return [], recusados
+
+        # Deltas da mesma linha no lote são somados antes de gravar
+        somas = pd.Series(quantidades).groupby(np.array(posicoes)).sum()
+        alteradas = somas.index.to_numpy()
+        anteriores = calcular_resumo(dados.iloc[alteradas])
+        atuais = np.nan_to_num(dados["CONTAGEM"].to_numpy(dtype=float)[alteradas])
+        gravar_contagens(dados, alteradas, atuais + somas.to_numpy())
+        novos = calcular_resumo(dados.iloc[alteradas])
+        for chave in totais:
+            totais[chave] += novos[chave] - anteriores[chave]
+
+        versao += 1
+        alteracoes.append((versao, alteradas))
+        del alteracoes[:-LIMITE_ALTERACOES]
+        alterado = True
+        trava.notify_all()  # Acorda as estações aguardando em /eventos
+        return linhas_alteradas(alteradas), recusados
+
+def localizar_delta(delta):
+    """Localiza a linha de um delta pela chave COD+ENDEREÇO (e ocorrência) ou, sem endereço, pelo código."""
+    cod = str(delta["cod"])
+    if delta.get("endereco") is not None:
+        return localizar_ocorrencia(indice_chaves, indice_repetidas, cod, delta["endereco"], int(delta.get("ocorrencia", 0)))
+    posicoes = indice_codigos.get(cod)
+    return None if posicoes is None else int(posicoes[0])
+
+def linhas_alteradas(posicoes):
+    """Chave e contagem atual das linhas informadas (chamado com a trava)."""
+    return [
+        {
+            "cod": cod,
+            "endereco": endereco,
+            "ocorrencia": ocorrencia_da_linha(indice_repetidas, cod, endereco, posicao),
+            "contagem": float(contagem),
+        }
+        for posicao, cod, endereco, contagem in zip(
+            posicoes,
+            dados["COD"].astype(str).to_numpy()[posicoes],
+            dados["ENDEREÇO"].astype(str).to_numpy()[posicoes],
+            np.nan_to_num(dados["CONTAGEM"].to_numpy(dtype=float)[posicoes]),
+        )
+    ]
+
+def eventos_desde(desde, espera):
+    """Aguarda até 'espera' segundos por alterações posteriores à versão 'desde' e as devolve."""
+    with trava:
+        trava.wait_for(lambda: versao != desde, timeout=min(espera, ESPERA_MAXIMA_S))
+        resposta = {"versao": versao, "resumo": totais_json(), "linhas": [], "recarregar": False}
+        if versao == desde:
+            return resposta
+        if desde > versao or not alteracoes or alteracoes[0][0] > desde + 1:
+            resposta["recarregar"] = True  # Estação muito atrasada (ou servidor reiniciado): baixar tudo
+            return resposta
+        posicoes = np.unique(np.concatenate([p for v, p in alteracoes if v > desde]))
+        resposta["linhas"] = linhas_alteradas(posicoes)
+        return resposta
+
+def totais_json():
+    """Totais do resumo em tipos do JSON, com as linhas já formatadas."""
+    return {
+        "totais": {chave: float(valor) for chave, valor in totais.items()},
+        "linhas": linhas_resumo(totais),
+    }
+
+def gravar_periodicamente(caminho):
+    """Grava a sessão em lote, a cada intervalo, somente quando houve alterações."""
+    while True:
+        time.sleep(INTERVALO_GRAVACAO_S)
+        gravar_se_alterado(caminho)
+
+def gravar_se_alterado(caminho):
+    """Grava uma cópia do inventário na sessão se houve alterações desde a última gravação."""
+    global alterado
+    with trava:
+        if not alterado:
+            return
+        copia = dados.copy()
+        alterado = False
+    try:
+        gravar_arquivo(caminho, sem_progresso, lambda temporario: gravar_sessao(copia, temporario))
+    except OSError:
+        with trava:
+            alterado = True  # Tenta de novo na próxima vez
+
+class ManipuladorContagem(BaseHTTPRequestHandler):
+    """Atende as rotas do servidor de contagem."""
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        parametros = urllib.parse.parse_qs(url.query)
+        if url.path == "/inventario":
+            with trava:
+                itens = dados.to_json(orient="records", force_ascii=False)
+                atual = versao
+            self.responder_texto(f'{{"versao": {atual}, "itens": {itens}}}')
+        elif url.path == "/resumo":
+            with trava:
+                self.responder({"versao": versao, "resumo": totais_json()})
+        elif url.path == "/eventos":
+            try:
+                desde = int(parametros.get("desde", ["0"])[0])
+                espera = float(parametros.get("espera", [str(ESPERA_MAXIMA_S)])[0])
+            except ValueError:
+                self.responder({"erro": "Parâmetros inválidos."}, 400)
+                return
+            self.responder(eventos_desde(desde, espera))
+        else:
+            self.responder({"erro": "Rota não encontrada."}, 404)
+
+    def do_POST(self):
+        if urllib.parse.urlsplit(self.path).path != "/contagens":
+            self.responder({"erro": "Rota não encontrada."}, 404)
+            return
+        try:
+            corpo = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            deltas = corpo["deltas"]
+        except (ValueError, KeyError, TypeError):
+            self.responder({"erro": "Corpo inválido: esperado {\"deltas\": [...]}"}, 400)
+            return
+        linhas, recusados = aplicar_deltas(deltas)
+        with trava:
+            atual = versao
+        self.responder({"versao": atual, "linhas": linhas, "recusados": recusados})
+
+    def responder(self, conteudo, status=200):
+        self.responder_texto(json.dumps(conteudo, ensure_ascii=False), status)
+
+    def responder_texto(self, texto, status=200):
+        corpo = texto.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, formato, *args):
+        pass  # Sem uma linha no terminal a cada leitura das estações
+
+def criar_servidor(host="0.0.0.0", porta=PORTA_PADRAO):
+    """Cria o servidor HTTP (uma thread por conexão) para o inventário já iniciado."""
+    servidor = ThreadingHTTPServer((host, porta), ManipuladorContagem)
+    servidor.daemon_threads = True
+    return servidor
+
+# Funções das estações (clientes) -------------------------------------------------
+
+def baixar_inventario(url, tempo_limite=60):
+    """Baixa o inventário oficial; retorna (DataFrame, versão)."""
+    with urllib.request.urlopen(f"{url.rstrip('/')}/inventario", timeout=tempo_limite) as resposta:
+        conteudo = json.load(resposta)
+    inventario = pd.DataFrame(conteudo["itens"])
+    if "COD" in inventario.columns:
+        inventario["COD"] = inventario["COD"].astype(str)
+    return inventario, conteudo["versao"]
+
+def enviar_deltas(url, deltas, estacao="", tempo_limite=10):
+    """Envia um lote de incrementos de contagem; retorna a resposta do servidor."""
+    corpo = json.dumps({"estacao": estacao, "deltas": deltas}, ensure_ascii=False).encode("utf-8")
+    requisicao = urllib.request.Request(
+        f"{url.rstrip('/')}/contagens", data=corpo, headers={"Content-Type": "application/json"}
+    )
+    with urllib.request.urlopen(requisicao, timeout=tempo_limite) as resposta:
+        return json.load(resposta)
+
+def aguardar_eventos(url, desde, espera=ESPERA_MAXIMA_S):
+    """Aguarda as alterações posteriores à versão 'desde' (long polling); retorna a resposta."""
+    consulta = urllib.parse.urlencode({"desde": desde, "espera": espera})
+    with urllib.request.urlopen(f"{url.rstrip('/')}/eventos?{consulta}", timeout=espera + 10) as resposta:
+        return json.load(resposta)
+
+def main(argumentos=None):
+    """Inicia o servidor de contagem pela linha de comando."""
+    parser = argparse.ArgumentParser(description="Servidor local para contagem em várias estações.")
+    parser.add_argument("estoque", help="inventário inicial (.xlsx, .xls, .json, .csv ou sessão .feather)")
+    parser.add_argument("--host", default="0.0.0.0", help="endereço de escuta (padrão: todas as interfaces)")
+    parser.add_argument("--porta", type=int, default=PORTA_PADRAO, help=f"porta (padrão: {PORTA_PADRAO})")
+    parser.add_argument("--sessao", help="sessão .feather gravada periodicamente (padrão: ao lado do estoque)")
+    args = parser.parse_args(argumentos)
+
+    try:
+        iniciar_inventario(ler_inventario(args.estoque))
+    except (OSError, ValueError) as e:
+        parser.exit(1, f"Erro: {e}\n")
+    sessao = args.sessao or os.path.splitext(args.estoque)[0] + ".servidor.feather"
+    threading.Thread(target=gravar_periodicamente, args=(sessao,), daemon=True).start()
+
+    servidor = criar_servidor(args.host, args.porta)
+    print(f"Servidor de contagem em http://{args.host}:{args.porta} ({len(dados)} itens). Sessão: {sessao}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        gravar_se_alterado(sessao)
+
+if __name__ == "__main__":
+    main()
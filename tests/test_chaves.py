@@ -0,0 +1,20 @@
+"""Chaves COD + ENDEREÇO repetidas: cada linha é localizada pelo número da ocorrência."""
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from motor_inventario import construir_indice_chaves, construir_indice_repetidas, localizar_ocorrencia, ocorrencia_da_linha
+
+def test_ocorrencias_de_chaves_repetidas():
+    dados = pd.DataFrame({"COD": ["10", "20", "10", "10"], "ENDEREÇO": ["A.1", "A.1", "A.1", "A.1"]})
+    chaves, repetidas = construir_indice_chaves(dados), construir_indice_repetidas(dados)
+
+    assert list(repetidas) == [("10", "A.1")]
+    ocorrencias = [ocorrencia_da_linha(repetidas, "10", "A.1", posicao) for posicao in (0, 2, 3)]
+    assert ocorrencias == [0, 1, 2]
+    assert [localizar_ocorrencia(chaves, repetidas, "10", "A.1", n) for n in range(4)] == [0, 2, 3, None]
+    assert ocorrencia_da_linha(repetidas, "20", "A.1", 1) == 0
+    assert localizar_ocorrencia(chaves, repetidas, "20", "A.1", 1) is None
@@ -0,0 +1,27 @@
+"""Leitura da planilha em fluxo: linhas vazias e códigos numéricos, como no pd.read_excel."""
+import os
+import sys
+
+import openpyxl
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from motor_inventario import ler_planilha_em_fluxo, sem_progresso
+
+def test_linhas_vazias_e_cod_ausente(tmp_path):
+    livro = openpyxl.Workbook()
+    planilha = livro.active
+    planilha.append(["COD", "PRODUTO", "VL. UNT.", "ENDEREÇO", "QTD"])
+    planilha.append([2578, "MASSA", 130.9, "A.2.1", 718])
+    planilha.append([None, "SEM CÓDIGO", 1.0, "A.2.2", 1])
+    planilha.append([4643, "CABO", 42.01, "A.2.3", 996])
+    for _ in range(7):  # Linhas formatadas, sem valores, ao fim da exportação
+        planilha.append([None] * 5)
+    caminho = str(tmp_path / "estoque.xlsx")
+    livro.save(caminho)
+
+    dados, _, indice = ler_planilha_em_fluxo(caminho, sem_progresso)
+    assert len(dados) == 3
+    assert dados["COD"].iat[0] == "2578" and dados["COD"].iat[2] == "4643"
+    assert dados["QTD"].dtype.kind == "i"
+    assert ("2578", "A.2.1") in indice["CHAVE"]
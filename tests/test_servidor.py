@@ -0,0 +1,67 @@
+"""Servidor de contagem com estações locais: incrementos simultâneos, eventos e totais."""
+import os
+import sys
+import threading
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import servidor_contagem
+from servidor_contagem import aguardar_eventos, criar_servidor, enviar_deltas, iniciar_inventario
+
+ESTACOES = 8
+LOTES = 10  # Lotes enviados por estação
+
+def test_estacoes_simultaneas():
+    iniciar_inventario(pd.DataFrame({
+        "COD": ["10", "20", "10"],
+        "PRODUTO": ["CABO", "MASSA", "CABO"],
+        "VL. UNT.": [2.0, 5.0, 2.0],
+        "ENDEREÇO": ["A.1", "A.2", "A.1"],  # A chave de "10" se repete
+        "QTD": [100, 50, 10],
+        "CONTAGEM": [0.0, 0.0, 0.0],
+    }))
+    servidor = criar_servidor("127.0.0.1", 0)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{servidor.server_address[1]}"
+    try:
+        recusados = []
+
+        def estacao(nome):
+            for _ in range(LOTES):
+                resposta = enviar_deltas(url, [
+                    {"cod": "10", "endereco": "A.1", "quantidade": 1},
+                    {"cod": "10", "endereco": "A.1", "ocorrencia": 1, "quantidade": 2},
+                    {"cod": "20", "quantidade": 0.5},  # Sem endereço: a primeira linha do código
+                    {"cod": "99", "endereco": "A.1", "quantidade": 1},  # Item inexistente
+                ], nome)
+                recusados.extend(resposta["recusados"])
+
+        estacoes = [threading.Thread(target=estacao, args=(f"E{i}",)) for i in range(ESTACOES)]
+        for thread in estacoes:
+            thread.start()
+        for thread in estacoes:
+            thread.join()
+
+        assert len(recusados) == ESTACOES * LOTES
+        eventos = aguardar_eventos(url, 0, espera=0)
+        assert eventos["versao"] == ESTACOES * LOTES and not eventos["recarregar"]
+        contagens = {(linha["cod"], linha["endereco"], linha["ocorrencia"]): linha["contagem"] for linha in eventos["linhas"]}
+        assert contagens == {
+            ("10", "A.1", 0): ESTACOES * LOTES,
+            ("20", "A.2", 0): ESTACOES * LOTES * 0.5,
+            ("10", "A.1", 1): ESTACOES * LOTES * 2,
+        }
+
+        totais = eventos["resumo"]["totais"]
+        esperados = servidor_contagem.calcular_resumo(servidor_contagem.dados)
+        assert totais == {chave: float(valor) for chave, valor in esperados.items()}
+        assert totais["total_estoque"] == 100 * 2.0 + 50 * 5.0 + 10 * 2.0
+        assert totais["total_itens_contados"] == 3
+
+        # Sem alterações novas, a espera termina sem linhas
+        assert aguardar_eventos(url, eventos["versao"], espera=0)["linhas"] == []
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
@@ -0,0 +1,35 @@
+"""Sessão .feather: o inventário gravado por gravar_sessao volta igual em ler_sessao e ler_arquivo."""
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from motor_inventario import apurar, gravar_sessao, ler_arquivo, ler_sessao, sem_progresso, validar_inventario
+
+pytest.importorskip("pyarrow")
+
+def inventario():
+    dados = pd.DataFrame({
+        "COD": ["0789100010010", "2578", "2578"],
+        "PRODUTO": ["ARROZ 1KG", "FEIJÃO 1KG", "FEIJÃO 1KG"],
+        "VL. UNT.": [10.5, 8.0, 8.0],
+        "ENDEREÇO": ["A.1.1", "A.1.2", "B.2.1"],
+        "QTD": [3, 5, 0],
+        "CONTAGEM": [3, 4, 1],
+    })
+    return apurar(validar_inventario(dados, "no teste"))
+
+def test_sessao_ida_e_volta(tmp_path):
+    dados = inventario()
+    caminho = str(tmp_path / "sessao.feather")
+    gravar_sessao(dados, caminho)
+
+    lidos, exibicao, indice = ler_sessao(caminho, sem_progresso)
+    pd.testing.assert_frame_equal(lidos, dados)
+    assert len(exibicao) == len(dados)
+    assert indice["CHAVE"][("2578", "B.2.1")] == 2
+
+    pd.testing.assert_frame_equal(ler_arquivo(caminho), dados)